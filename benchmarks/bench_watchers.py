@@ -0,0 +1,185 @@
+"""
+Нагрузочный сценарий: тысячи одновременных ожиданий прогонов.
+
+Регистрирует N ожиданий тем же путём, что и «▶️ Запустить» (jobs.watch_launch),
+против фейкового TestOps, где каждый запуск закрывается через случайное время
+из заданного распределения. Измеряет:
+- задержку event loop (лаг таймера-сэмплера);
+- память на одно ожидание (tracemalloc);
+- частоту запросов к TestOps;
+- задержку уведомления после закрытия прогона.
+
+Пример:
+    python -m benchmarks.bench_watchers --watches 2000 --interval 2 \\
+        --close-dist exp --close-mean 20 --mongomock
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import tracemalloc
+from typing import Callable, List
+
+from benchmarks.fakes import FakeTelegram, FakeTestOps
+from benchmarks.harness import (
+    LatencyRecorder,
+    configure_environment,
+    import_bot,
+    print_latency_table,
+    print_report,
+    reset_bench_db,
+)
+from utils import percentile
+
+FINAL_TEXT_RE = re.compile(r"ID (\d+)</b> завершён")
+
+
+def close_distribution(kind: str, mean: float) -> Callable[[], float]:
+    """Возвращает генератор времени до закрытия прогона (в секундах)."""
+    if kind == "fixed":
+        return lambda: mean
+    if kind == "uniform":
+        return lambda: random.uniform(0, 2 * mean)
+    if kind == "exp":
+        return lambda: random.expovariate(1 / mean) if mean > 0 else 0.0
+    raise ValueError(f"Неизвестное распределение: {kind}")
+
+
+async def _sample_loop_lag(samples: List[float], period: float, stop: asyncio.Event) -> None:
+    """Каждые period секунд замеряет, насколько позже срабатывает таймер."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + period
+        await asyncio.sleep(period)
+        samples.append(max(loop.time() - expected, 0.0))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    testops = FakeTestOps(
+        latency=args.testops_latency,
+        close_after=close_distribution(args.close_dist, args.close_mean),
+    )
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    await testops.start()
+    await telegram.start()
+
+    configure_environment(testops, args.mongo_uri, args.mongomock, args.mongo_db)
+    bot = import_bot(args.log_level)
+    import jobs
+
+    reset_bench_db()
+    # Интервал опроса задаётся до post_init: там создаётся общий проход poll_launches
+    jobs.LAUNCH_CHECK_INTERVAL = args.interval
+    app = bot.build_application(token="123456:BENCH", base_url=telegram.base_url)
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_loop_lag(lag_samples, args.lag_period, stop))
+
+    # Регистрация ожиданий и замер памяти на одно ожидание
+    tracemalloc.start()
+    mem_before, _ = tracemalloc.get_traced_memory()
+    launches = [testops.create_launch(job_id=1) for _ in range(args.watches)]
+    mem_launches, _ = tracemalloc.get_traced_memory()
+    for i, launch in enumerate(launches):
+        jobs.watch_launch(
+            app.job_queue,
+            chat_id=20_000 + i,
+            loading_message_id=1,
+            launch_id=launch.launch_id,
+            job_id=launch.job_id,
+            project_id=1,
+            job_name="Bench job",
+        )
+    mem_after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Память фейковых запусков TestOps в расчёт не берём
+    mem_per_watch = (mem_after - mem_launches) / max(args.watches, 1)
+
+    testops.calls.clear()
+    started = time.time()
+    deadline = started + args.timeout
+    notified = {}
+    scanned = 0
+    while time.time() < deadline and len(notified) < args.watches:
+        await asyncio.sleep(0.5)
+        sent = telegram.sent
+        for msg in sent[scanned:]:
+            m = FINAL_TEXT_RE.search(msg["text"])
+            if m:
+                notified.setdefault(int(m.group(1)), msg["ts"])
+        scanned = len(sent)
+    elapsed = time.time() - started
+
+    stop.set()
+    await sampler
+    for job in app.job_queue.jobs():
+        job.schedule_removal()
+    await app.stop()
+    await app.shutdown()
+    await app.post_shutdown(app)
+    await telegram.stop()
+    await testops.stop()
+
+    recorder = LatencyRecorder()
+    for launch in launches:
+        ts = notified.get(launch.launch_id)
+        if ts is not None:
+            recorder.add("notify_after_close", max(ts - launch.closes_at, 0.0))
+    for lag in lag_samples:
+        recorder.add("event_loop_lag", lag)
+
+    report = {
+        "watches": args.watches,
+        "notified": len(notified),
+        "elapsed_sec": elapsed,
+        "check_interval_sec": args.interval,
+        "memory_per_watch_bytes": mem_per_watch,
+        "memory_total_kib": (mem_after - mem_before) / 1024,
+        "testops_requests_per_sec": testops.total_calls / elapsed if elapsed else 0.0,
+        "testops_calls": dict(testops.calls),
+        "latency": recorder.summary(),
+        "event_loop_lag_max_ms": (max(lag_samples) * 1000) if lag_samples else 0.0,
+        "notify_p95_sec": percentile(recorder.samples.get("notify_after_close", []), 95) or 0.0,
+    }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--watches", type=int, default=1000, help="число одновременных ожиданий")
+    parser.add_argument("--interval", type=float, default=2.0, help="интервал опроса статуса, с")
+    parser.add_argument("--close-dist", choices=("fixed", "uniform", "exp"), default="uniform",
+                        help="распределение времени до закрытия прогона")
+    parser.add_argument("--close-mean", type=float, default=10.0, help="среднее время до закрытия, с")
+    parser.add_argument("--timeout", type=float, default=120.0, help="максимальная длительность сценария, с")
+    parser.add_argument("--lag-period", type=float, default=0.1, help="период сэмплирования лага, с")
+    parser.add_argument("--testops-latency", type=float, default=0.0, help="задержка фейкового TestOps, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    parser.add_argument("--mongo-uri", default=None, help="MongoDB для бенчмарка (по умолчанию MONGO_URI)")
+    parser.add_argument("--mongo-db", default="telegram_bot_bench", help="имя бенчмарковой базы")
+    parser.add_argument("--mongomock", action="store_true", help="использовать mongomock вместо MongoDB")
+    parser.add_argument("--log-level", default="WARNING", help="уровень логирования бота во время замера")
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON-файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(
+        "Ожидание прогонов",
+        {k: v for k, v in report.items() if not isinstance(v, dict)},
+    )
+    print_report("Вызовы TestOps", report["testops_calls"])
+    print_latency_table(report["latency"])
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
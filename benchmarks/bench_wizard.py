@@ -0,0 +1,183 @@
+"""
+Бенчмарк мастера запуска теста.
+
+Поднимает фейковые TestOps и Bot API, собирает настоящий Application из bot.py
+и прогоняет через него симулированных пользователей по сценарию:
+«▶️ Запустить тест» → проект → Job → параметры по умолчанию → имя запуска → «▶️ Запустить».
+
+Отчёт: апдейтов в секунду, перцентили задержки обработчиков по шагам,
+количество вызовов TestOps и Bot API на один запуск.
+
+Пример:
+    python -m benchmarks.bench_wizard --users 50 --rounds 3 --mongomock
+
+Записать обмены с TestOps и потом воспроизвести их (с задержкой 50 мс на ответ):
+    python -m benchmarks.bench_wizard --mongomock --record wizard.jsonl.gz
+    python -m benchmarks.bench_wizard --mongomock --replay wizard.jsonl.gz --replay-latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.fakes import FakeTelegram, FakeTestOps
+from benchmarks.harness import (
+    LatencyRecorder,
+    UpdateFactory,
+    configure_environment,
+    import_bot,
+    print_latency_table,
+    print_report,
+    reset_bench_db,
+)
+
+FIRST_USER_ID = 10_000
+
+
+async def _simulate_user(app, telegram: FakeTelegram, factory: UpdateFactory, recorder: LatencyRecorder,
+                         user_id: int, project_id: int, params_per_job: int, round_no: int) -> None:
+    from telegram import Update
+
+    def press(data: str):
+        # Кнопку нажимают на последнем сообщении бота с inline-клавиатурой
+        return lambda: factory.callback(user_id, data, telegram.keyboards.get(user_id))
+
+    job_id = project_id * 100 + 1
+    steps = [("menu_run_test", lambda: factory.text(user_id, "▶️ Запустить тест")),
+             ("select_project", press(f"project_{project_id}")),
+             ("select_job", press(f"job_{job_id}_{project_id}"))]
+    for position in range(params_per_job):
+        steps.append(("param_default", press(f"param_{position}_0_{job_id}_{project_id}")))
+    steps.append(("launch_name", lambda: factory.text(user_id, f"bench launch {user_id} {round_no}")))
+    steps.append(("launch_confirm", press("launch_confirm")))
+
+    for step, build in steps:
+        update = Update.de_json(build(), app.bot)
+        with recorder.measure(step):
+            await app.process_update(update)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    testops = FakeTestOps(
+        jobs_per_project=args.jobs, params_per_job=args.params, latency=args.testops_latency
+    )
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    await testops.start()
+    await telegram.start()
+
+    configure_environment(testops, args.mongo_uri, args.mongomock, args.mongo_db)
+    if args.record:
+        os.environ["TESTOPS_RECORD"] = args.record
+    if args.replay:
+        os.environ["TESTOPS_REPLAY"] = args.replay
+        if args.replay_latency is not None:
+            os.environ["TESTOPS_REPLAY_LATENCY"] = str(args.replay_latency)
+    bot = import_bot(args.log_level)
+    import db
+    import testops_client as toc
+    from message_state import tracker
+
+    reset_bench_db()
+    factory = UpdateFactory()
+    recorder = LatencyRecorder()
+    user_ids = [FIRST_USER_ID + i for i in range(args.users)]
+    for uid in user_ids:
+        db.add_allowed_user(factory.user(uid)["username"])
+        db.add_project(uid, uid % args.projects + 1, f"Project {uid % args.projects + 1}")
+
+    app = bot.build_application(token="123456:BENCH", base_url=telegram.base_url)
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+
+    testops.calls.clear()
+    telegram.calls.clear()
+    started = time.perf_counter()
+    for round_no in range(args.rounds):
+        await asyncio.gather(
+            *(
+                _simulate_user(
+                    app, telegram, factory, recorder, uid, uid % args.projects + 1, args.params, round_no
+                )
+                for uid in user_ids
+            )
+        )
+    wall = time.perf_counter() - started
+
+    # Проверки результата в этом бенчмарке не нужны — снимаем их до остановки
+    for job in app.job_queue.jobs():
+        job.schedule_removal()
+    await app.stop()
+    await app.shutdown()
+    await app.post_shutdown(app)
+    await telegram.stop()
+    await testops.stop()
+
+    # При воспроизведении фейковый TestOps не вызывается — считаем по записанным обменам
+    replayer = toc.get_replayer()
+    if replayer is not None:
+        testops_calls = dict(replayer.stats)
+        run_calls = replayer.stats["POST /job/{id}/run"]
+        testops_total = sum(replayer.stats.values())
+    else:
+        testops_calls = dict(testops.calls)
+        run_calls = testops.calls["run"]
+        testops_total = testops.total_calls
+    launches = max(run_calls, 1)
+    updates = sum(len(v) for v in recorder.samples.values())
+    report = {
+        "users": args.users,
+        "rounds": args.rounds,
+        "launches": run_calls,
+        "updates": updates,
+        "wall_sec": wall,
+        "updates_per_sec": updates / wall if wall else 0.0,
+        "testops_calls_per_launch": testops_total / launches,
+        "bot_api_calls_per_launch": telegram.total_calls / launches,
+        "testops_calls": testops_calls,
+        "bot_api_calls": dict(telegram.calls),
+        "message_edits": tracker.summary(),
+        "latency": recorder.summary(),
+    }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="число одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=3, help="сколько раз каждый проходит мастер")
+    parser.add_argument("--projects", type=int, default=5, help="число разных проектов")
+    parser.add_argument("--jobs", type=int, default=5, help="Job’ов в проекте")
+    parser.add_argument("--params", type=int, default=3, help="параметров у Job-а")
+    parser.add_argument("--testops-latency", type=float, default=0.0, help="задержка фейкового TestOps, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    parser.add_argument("--mongo-uri", default=None, help="MongoDB для бенчмарка (по умолчанию MONGO_URI)")
+    parser.add_argument("--mongo-db", default="telegram_bot_bench", help="имя бенчмарковой базы")
+    parser.add_argument("--mongomock", action="store_true", help="использовать mongomock вместо MongoDB")
+    parser.add_argument("--log-level", default="WARNING", help="уровень логирования бота во время замера")
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON-файл")
+    parser.add_argument("--record", help="записать обмены с TestOps в файл (JSON Lines, .gz — сжатый)")
+    parser.add_argument("--replay", help="воспроизвести записанные обмены вместо фейкового TestOps")
+    parser.add_argument(
+        "--replay-latency", type=float, default=None, help="задержка ответов при воспроизведении, с"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(
+        "Мастер запуска",
+        {k: v for k, v in report.items() if not isinstance(v, dict)},
+    )
+    print_report("Вызовы TestOps", report["testops_calls"])
+    print_report("Вызовы Bot API", report["bot_api_calls"])
+    print_report("Правки сообщений", report["message_edits"])
+    print_latency_table(report["latency"])
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
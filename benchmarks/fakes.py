@@ -0,0 +1,251 @@
+"""
+Локальные заглушки внешних сервисов для бенчмарков:
+- FakeTestOps — aiohttp-сервер с эндпоинтами Allure TestOps, которые использует testops_client;
+- FakeTelegram — минимальный Bot API, достаточный для работы Application из bot.py.
+
+Оба сервера считают обращения по эндпоинтам, чтобы бенчмарк мог посчитать
+количество API-вызовов на один запуск.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from aiohttp import web
+
+
+class _FakeServer:
+    """Общая часть фейковых серверов: запуск на свободном порту и счётчики вызовов."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.port: Optional[int] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def _build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self, host: str = "127.0.0.1") -> None:
+        self._runner = web.AppRunner(self._build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _delay(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+# --------------------- Allure TestOps ---------------------
+@dataclass
+class FakeLaunch:
+    launch_id: int
+    job_id: int
+    created_at: float
+    closes_at: float
+    closed_seen_at: Optional[float] = None
+    statistic: List[Dict] = field(default_factory=list)
+
+
+class FakeTestOps(_FakeServer):
+    """
+    Заглушка Allure TestOps API.
+    close_after — функция без аргументов, возвращающая через сколько секунд запуск закроется
+    (по умолчанию сразу). Так сценарии задают распределение длительности прогонов.
+    """
+
+    def __init__(
+        self,
+        jobs_per_project: int = 5,
+        params_per_job: int = 3,
+        latency: float = 0.0,
+        close_after: Callable[[], float] = lambda: 0.0,
+    ) -> None:
+        super().__init__(latency)
+        self.jobs_per_project = jobs_per_project
+        self.params_per_job = params_per_job
+        self.close_after = close_after
+        self.launches: Dict[int, FakeLaunch] = {}
+        self._launch_ids = itertools.count(1000)
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api"
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/uaa/oauth/token", self._token)
+        app.router.add_get("/api/project/{id}", self._project)
+        app.router.add_get("/api/job", self._jobs)
+        app.router.add_get("/api/job/{id}", self._job)
+        app.router.add_post("/api/job/{id}/run", self._run)
+        app.router.add_get("/api/launch/{id}", self._launch)
+        app.router.add_get("/api/launch/{id}/statistic", self._statistic)
+        return app
+
+    def create_launch(self, job_id: int) -> FakeLaunch:
+        """Создаёт запуск напрямую (без HTTP) — для сценариев, которые не проходят мастер."""
+        now = time.time()
+        launch = FakeLaunch(
+            launch_id=next(self._launch_ids),
+            job_id=job_id,
+            created_at=now,
+            closes_at=now + max(self.close_after(), 0.0),
+            statistic=[
+                {"status": "passed", "count": random.randint(10, 200)},
+                {"status": "failed", "count": random.randint(0, 5)},
+                {"status": "skipped", "count": random.randint(0, 10)},
+            ],
+        )
+        self.launches[launch.launch_id] = launch
+        return launch
+
+    async def _token(self, request: web.Request) -> web.Response:
+        self.calls["token"] += 1
+        await self._delay()
+        return web.json_response({"access_token": "fake-jwt", "expires_in": 3600})
+
+    async def _project(self, request: web.Request) -> web.Response:
+        self.calls["project"] += 1
+        await self._delay()
+        pid = int(request.match_info["id"])
+        return web.json_response({"id": pid, "name": f"Project {pid}"})
+
+    async def _jobs(self, request: web.Request) -> web.Response:
+        self.calls["jobs"] += 1
+        await self._delay()
+        pid = int(request.query.get("projectId", 0))
+        return web.json_response(
+            [
+                {"id": pid * 100 + i, "name": f"Job {pid}-{i}"}
+                for i in range(1, self.jobs_per_project + 1)
+            ]
+        )
+
+    async def _job(self, request: web.Request) -> web.Response:
+        self.calls["job"] += 1
+        await self._delay()
+        jid = int(request.match_info["id"])
+        params = [
+            {"id": jid * 10 + i, "name": f"param{i}", "defaultValue": f"v{i}"}
+            for i in range(1, self.params_per_job + 1)
+        ]
+        return web.json_response({"id": jid, "name": f"Job {jid}", "parameters": params})
+
+    async def _run(self, request: web.Request) -> web.Response:
+        self.calls["run"] += 1
+        await self._delay()
+        launch = self.create_launch(int(request.match_info["id"]))
+        return web.json_response({"id": launch.launch_id})
+
+    async def _launch(self, request: web.Request) -> web.Response:
+        self.calls["launch"] += 1
+        await self._delay()
+        launch = self.launches.get(int(request.match_info["id"]))
+        if not launch:
+            return web.json_response({"error": "not found"}, status=404)
+        now = time.time()
+        closed = now >= launch.closes_at
+        if closed and launch.closed_seen_at is None:
+            launch.closed_seen_at = now
+        return web.json_response(
+            {
+                "id": launch.launch_id,
+                "closed": closed,
+                "createdDate": int(launch.created_at * 1000),
+                "closedDate": int(launch.closes_at * 1000) if closed else None,
+            }
+        )
+
+    async def _statistic(self, request: web.Request) -> web.Response:
+        self.calls["statistic"] += 1
+        await self._delay()
+        launch = self.launches.get(int(request.match_info["id"]))
+        if not launch:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response(launch.statistic)
+
+
+# --------------------- Telegram Bot API ---------------------
+class FakeTelegram(_FakeServer):
+    """
+    Заглушка Telegram Bot API. Отвечает на методы, которые вызывает бот,
+    и запоминает отправленные сообщения (время и текст) для замера задержки уведомлений.
+    """
+
+    BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__(latency)
+        self.sent: List[Dict] = []
+        # chat_id -> ID последнего сообщения с inline-клавиатурой (на нём «нажимают» кнопки)
+        self.keyboards: Dict[int, int] = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._method)
+        return app
+
+    def _message(self, chat_id: int, text: str = "") -> Dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self.BOT_USER,
+            "text": text,
+        }
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        await self._delay()
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == "getMe":
+            result = self.BOT_USER
+        elif method == "getUpdates":
+            # Long polling: апдейтов нет, держим запрос, но не дольше секунды
+            await asyncio.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            result = []
+        elif method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = int(params.get("chat_id", 0))
+            text = params.get("text", "")
+            result = self._message(chat_id, text)
+            if "message_id" in params:
+                result["message_id"] = int(params["message_id"])
+            if method == "sendMessage":
+                self.sent.append({"chat_id": chat_id, "text": text, "ts": time.time()})
+            if "inline_keyboard" in str(params.get("reply_markup", "")):
+                self.keyboards[chat_id] = result["message_id"]
+            elif self.keyboards.get(chat_id) == result["message_id"]:
+                del self.keyboards[chat_id]
+        else:
+            # answerCallbackQuery, sendChatAction, deleteMessage и прочие
+            result = True
+        return web.Response(
+            text=json.dumps({"ok": True, "result": result}), content_type="application/json"
+        )
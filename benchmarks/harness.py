@@ -0,0 +1,186 @@
+"""
+Общая обвязка бенчмарков: поднимает фейковые сервисы, настраивает окружение
+и импортирует настоящий bot.py, а также собирает метрики задержек.
+"""
+
+import importlib
+import itertools
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.fakes import FakeTelegram, FakeTestOps  # noqa: E402
+from utils import percentile  # noqa: E402
+
+BENCH_TOKEN = "123456:BENCH"
+
+
+def configure_environment(
+    testops: FakeTestOps, mongo_uri: Optional[str], mongomock: bool, mongo_db: str
+) -> None:
+    """
+    Выставляет переменные окружения так, чтобы testops_client и db смотрели на фейки.
+    Должна вызываться до импорта bot.py.
+    """
+    os.environ["TELEGRAM_BOT_TOKEN"] = BENCH_TOKEN
+    os.environ["TESTOPS_API_BASE"] = testops.api_base
+    os.environ["TESTOPS_URL"] = f"http://127.0.0.1:{testops.port}"
+    os.environ["USER_TOKEN"] = "bench-token"
+    os.environ["MONGO_DB"] = mongo_db
+    # Бенчмарку файл лога не нужен
+    os.environ.setdefault("LOG_FILE", "")
+    # Симулированные пользователи действуют быстрее живых — лимиты частоты снимаем
+    os.environ.setdefault("RATE_LIMIT_UPDATES_PER_MIN", "0")
+    os.environ.setdefault("RATE_LIMIT_LAUNCHES_PER_HOUR", "0")
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+    if mongomock:
+        try:
+            import mongomock as _mongomock
+        except ImportError:
+            raise SystemExit("Для --mongomock установите пакет mongomock")
+        import pymongo
+
+        pymongo.MongoClient = _mongomock.MongoClient
+        _patch_mongomock_bulk(_mongomock)
+
+
+def _patch_mongomock_bulk(mongomock_module) -> None:
+    """
+    pymongo 4.11+ передаёт в bulk-операции аргумент sort, о котором mongomock не знает.
+    Отбрасываем его, чтобы bulk_write работал и под mongomock.
+    """
+    builder = mongomock_module.collection.BulkOperationBuilder
+    for name in ("add_replace", "add_update"):
+        original = getattr(builder, name)
+        if getattr(original, "_bench_patched", False):
+            continue
+
+        def patched(self, *args, _original=original, **kwargs):
+            kwargs.pop("sort", None)
+            return _original(self, *args, **kwargs)
+
+        patched._bench_patched = True
+        setattr(builder, name, patched)
+
+
+def import_bot(log_level: str):
+    """
+    Импортирует bot.py (он настраивает логирование при импорте) и понижает
+    уровень логирования, чтобы логи не искажали замеры.
+    """
+    bot = importlib.import_module("bot")
+    logging.getLogger().setLevel(log_level)
+    return bot
+
+
+def reset_bench_db() -> None:
+    """Очищает коллекции бенчмарковой базы."""
+    import db
+
+    database = db.get_db()
+    for name in database.list_collection_names():
+        database[name].delete_many({})
+
+
+class LatencyRecorder:
+    """Копит длительности по именованным шагам и строит перцентили."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def measure(self, step: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[step].append(time.perf_counter() - started)
+
+    def add(self, step: str, value: float) -> None:
+        self.samples[step].append(value)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for step, values in sorted(self.samples.items()):
+            result[step] = {
+                "count": len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values) * 1000,
+            }
+        return result
+
+
+class UpdateFactory:
+    """Строит JSON-апдейты Telegram от имени симулированных пользователей."""
+
+    def __init__(self) -> None:
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+
+    @staticmethod
+    def user(user_id: int) -> Dict:
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": f"User {user_id}",
+            "username": f"bench_user_{user_id}",
+        }
+
+    def _message(self, user_id: int, text: str, from_bot: bool = False) -> Dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": FakeTelegram.BOT_USER if from_bot else self.user(user_id),
+            "text": text,
+        }
+
+    def text(self, user_id: int, text: str) -> Dict:
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, text)}
+
+    def callback(self, user_id: int, data: str, message_id: Optional[int] = None) -> Dict:
+        """Нажатие кнопки; message_id — сообщение с клавиатурой (по умолчанию новое)."""
+        update_id = next(self._update_ids)
+        message = self._message(user_id, "…", from_bot=True)
+        if message_id is not None:
+            message["message_id"] = message_id
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self.user(user_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": message,
+            },
+        }
+
+
+def print_report(title: str, rows: Dict[str, object]) -> None:
+    print(f"\n=== {title} ===")
+    width = max(len(k) for k in rows) if rows else 0
+    for key, value in rows.items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"{key.ljust(width)}  {value}")
+
+
+def print_latency_table(summary: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{'step':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, row in summary.items():
+        print(
+            f"{step:<20}{row['count']:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            f"{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}"
+        )
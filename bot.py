@@ -1,13 +1,16 @@
 import logging
 import os
-import sys
+from typing import Optional
 
 from dotenv import load_dotenv
+from telegram import Update
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CallbackQueryHandler,
     CommandHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
@@ -15,50 +18,150 @@ from telegram.ext import (
 load_dotenv()
 
 # --------------------- Логирование ---------------------
-logging.basicConfig(
-    level=logging.DEBUG,  # ставим DEBUG, чтобы ловить всё
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),           # вывод в консоль
-        logging.FileHandler("bot.log", encoding="utf-8")  # и в файл bot.log
-    ]
-)
+# Импортируется после load_dotenv(), чтобы подхватить LOG_* из .env
+from logging_setup import setup_logging
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # --------------------- Переменные окружения ---------------------
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-if not TELEGRAM_BOT_TOKEN:
-    logger.error("Отсутствует TELEGRAM_BOT_TOKEN в окружении")
-    raise RuntimeError("TELEGRAM_BOT_TOKEN обязателен")
 
-# Импорт модулей
-from handlers_basic import start, help_command, list_projects
+# Импорт модулей (без побочных эффектов: ресурсы поднимаются в post_init)
+import testops_client as toc
+from db import close_db, init_db
+from handlers_basic import start, help_command, list_projects, stats_command
 from handlers_testops import button_handler, text_message_handler
-from handlers_admin import allow_user, disallow_user, list_allowed
+from handlers_admin import (
+    allow_user,
+    disallow_user,
+    export_allowed,
+    import_allowed,
+    list_allowed,
+    list_allowed_page,
+    loop_monitor_command,
+    rate_limits_command,
+    schedule_add,
+    schedule_del,
+    schedule_list,
+)
+from jobs import WORKER_ID, release_own_watches, start_project_sync, start_watch_coordinator
+from lifecycle import install_signal_handlers, reject_while_draining
+from loop_monitor import LOOP_MONITOR_ENABLED, monitor
+from message_state import tracker
+from rate_limit import limit_updates
+from scheduler import start_scheduler
+from suggestions import flush_suggestions, start_suggestions_flush
+from webhook_server import start_webhook_server, stop_webhook_server
 
 
-def main() -> None:
-    application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+async def post_init(application: Application) -> None:
+    """
+    Вызывается PTB после инициализации Application, уже внутри event loop, до начала
+    приёма апдейтов. Миграции MongoDB выполняются здесь же (запросы рассчитаны на новую схему),
+    а индексы создаются в фоне, чтобы не задерживать старт.
+    """
+    await init_db()
+    # Файл TESTOPS_REPLAY читается сразу: если его нет, бот не стартует
+    toc.get_replayer()
+    if LOOP_MONITOR_ENABLED:
+        monitor.start()
+    install_signal_handlers(application)
+    start_watch_coordinator(application.job_queue)
+    start_project_sync(application.job_queue)
+    start_scheduler(application.job_queue)
+    start_suggestions_flush(application.job_queue)
+    application.bot_data["webhook_runner"] = await start_webhook_server()
+    logger.info(f"Воркер {WORKER_ID} запущен")
+
+
+async def post_stop(application: Application) -> None:
+    """
+    Вызывается PTB после остановки обработки апдейтов и JobQueue:
+    отпускает аренду ожиданий прогонов, чтобы их сразу подхватили другие воркеры
+    (или этот же воркер после перезапуска), и сохраняет накопленные значения параметров.
+    """
+    try:
+        released = release_own_watches()
+        logger.info(f"Отпущено ожиданий прогонов: {released}")
+    except Exception as e:
+        logger.error(f"Не удалось отпустить ожидания прогонов: {e}")
+    flush_suggestions()
+
+
+async def post_shutdown(application: Application) -> None:
+    """
+    Вызывается PTB при остановке Application: закрывает HTTP-сессию и соединения с MongoDB.
+    """
+    logger.info(f"Правки сообщений за время работы: {tracker.summary()}")
+    if monitor.running:
+        await monitor.stop()
+    await stop_webhook_server(application.bot_data.pop("webhook_runner", None))
+    await toc.close_session()
+    close_db()
+
+
+def build_application(
+    token: Optional[str] = None, base_url: Optional[str] = None
+) -> Application:
+    """
+    Собирает Application со всеми обработчиками.
+    base_url позволяет направить Bot API на другой сервер (например, фейковый в бенчмарках).
+    """
+    token = token or TELEGRAM_BOT_TOKEN
+    if not token:
+        logger.error("Отсутствует TELEGRAM_BOT_TOKEN в окружении")
+        raise RuntimeError("TELEGRAM_BOT_TOKEN обязателен")
+    
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+
+    # Во время остановки новые действия не принимаются
+    application.add_handler(TypeHandler(Update, reject_while_draining), group=-2)
+    # Лимиты частоты действий и запусков — до всех обработчиков
+    application.add_handler(TypeHandler(Update, limit_updates), group=-1)
 
     # Обычные команды
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("list_projects", list_projects))
+    application.add_handler(CommandHandler("stats", stats_command))
 
     # Админ-команды (работают с @username)
     application.add_handler(CommandHandler("allow_user", allow_user))
     application.add_handler(CommandHandler("disallow_user", disallow_user))
     application.add_handler(CommandHandler("list_allowed", list_allowed))
+    application.add_handler(CommandHandler("export_allowed", export_allowed))
+    application.add_handler(CommandHandler("import_allowed", import_allowed))
+    application.add_handler(CommandHandler("loop_monitor", loop_monitor_command))
+    application.add_handler(CommandHandler("rate_limits", rate_limits_command))
+    application.add_handler(CommandHandler("schedule_add", schedule_add))
+    application.add_handler(CommandHandler("schedule_list", schedule_list))
+    application.add_handler(CommandHandler("schedule_del", schedule_del))
 
     # CallbackQuery (Inline-кнопки)
+    application.add_handler(CallbackQueryHandler(list_allowed_page, pattern=r"^allowed_page_"))
     application.add_handler(CallbackQueryHandler(button_handler))
 
     # Текстовые сообщения (кроме команд)
     application.add_handler(
         MessageHandler(filters.TEXT & (~filters.COMMAND), text_message_handler)
     )
+    return application
+
 
-    application.run_polling()
+def main() -> None:
+    application = build_application()
+    # Сигналы остановки обрабатывает lifecycle (с фазой дренажа), см. post_init
+    application.run_polling(stop_signals=None)
 
 
 if __name__ == "__main__":
@@ -1,30 +1,231 @@
+import asyncio
 import os
 import logging
-from pymongo import MongoClient, errors as mongo_errors
-from typing import List, Dict, Optional
+import time
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument, UpdateOne, errors as mongo_errors
+from pymongo.collection import Collection
+from pymongo.database import Database
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from launch_stats import LaunchStats
+from testops_client import DEFAULT_INSTANCE
 
 logger = logging.getLogger(__name__)
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-MONGO_DB = "telegram_bot"
+MONGO_DB = os.getenv("MONGO_DB", "telegram_bot")
+# Общий каталог проектов: один документ на (instance, project_id) (имя, метаданные);
+# instance — имя сервера TestOps, ID проектов, Job-ов и прогонов уникальны только в его пределах
 PROJECTS_COLLECTION = "projects"
+# Подписки пользователей на проекты: один документ на (user_id, instance, project_id)
+USER_PROJECTS_COLLECTION = "user_projects"
 ALLOWED_COLLECTION = "allowed_users"
+JOB_STATS_COLLECTION = "job_stats"
+WATCHES_COLLECTION = "launch_watches"
+SCHEDULES_COLLECTION = "launch_schedules"
+# Частые значения параметров: один документ на (instance, job_id, param, value) со счётчиком
+SUGGESTIONS_COLLECTION = "param_suggestions"
+# Ключи недавних запусков (защита от повторного запуска того же Job-а), удаляются по TTL
+LAUNCH_KEYS_COLLECTION = "launch_keys"
+
+# Сколько последних длительностей прогонов хранить в сводке (для p95)
+JOB_STATS_WINDOW = 100
+
+# Индексы, которые создаются один раз в фоне при старте бота, после миграций (см. init_db)
+INDEXES = [
+    (PROJECTS_COLLECTION, [("instance", 1), ("project_id", 1)], {"unique": True}),
+    (USER_PROJECTS_COLLECTION, [("user_id", 1), ("instance", 1), ("project_id", 1)], {"unique": True}),
+    (USER_PROJECTS_COLLECTION, [("instance", 1), ("project_id", 1)], {}),
+    (ALLOWED_COLLECTION, [("username", 1)], {"unique": True}),
+    (JOB_STATS_COLLECTION, [("instance", 1), ("project_id", 1), ("job_id", 1)], {"unique": True}),
+    (WATCHES_COLLECTION, [("instance", 1), ("launch_id", 1)], {"unique": True}),
+    (WATCHES_COLLECTION, [("lease_until", 1)], {}),
+    (WATCHES_COLLECTION, [("owner", 1)], {}),
+    (
+        SUGGESTIONS_COLLECTION,
+        [("instance", 1), ("job_id", 1), ("param", 1), ("value", 1)],
+        {"unique": True},
+    ),
+    (LAUNCH_KEYS_COLLECTION, [("expires_at", 1)], {"expireAfterSeconds": 0}),
+]
+
+# Коллекции с данными сервера TestOps и их уникальные индексы до появления поля instance
+INSTANCE_COLLECTIONS = {
+    PROJECTS_COLLECTION: ["project_id_1"],
+    USER_PROJECTS_COLLECTION: ["user_id_1_project_id_1", "project_id_1"],
+    JOB_STATS_COLLECTION: ["project_id_1_job_id_1"],
+    WATCHES_COLLECTION: ["launch_id_1"],
+    SCHEDULES_COLLECTION: [],
+    SUGGESTIONS_COLLECTION: ["job_id_1_param_1"],
+}
+
+# Клиент создаётся лениво, при первом обращении к базе
+_mongo_client: Optional[MongoClient] = None
+
+
+def get_db() -> Database:
+    """
+    Возвращает базу MONGO_DB, при первом вызове создавая MongoClient.
+    Импорт модуля не открывает соединений и не трогает индексы.
+    """
+    global _mongo_client
+    if _mongo_client is None:
+        _mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    return _mongo_client[MONGO_DB]
+
+
+def _col(name: str) -> Collection:
+    return get_db()[name]
+
+
+def migrate_projects() -> int:
+    """
+    Переводит проекты из старой схемы (копия проекта на каждого пользователя в projects)
+    в общий каталог + подписки user_projects. Повторный запуск безопасен.
+    Возвращает число перенесённых старых документов.
+    """
+    projects = _col(PROJECTS_COLLECTION)
+    legacy = list(projects.find({"user_id": {"$exists": True}}))
+    if legacy:
+        catalogue: Dict[int, Dict] = {}
+        subscriptions = []
+        for doc in legacy:
+            catalogue[doc["project_id"]] = {
+                k: doc[k] for k in ("project_name", "project_meta") if k in doc
+            }
+            subscriptions.append(
+                UpdateOne(
+                    {"user_id": doc["user_id"], "project_id": doc["project_id"]},
+                    {"$setOnInsert": {"user_id": doc["user_id"], "project_id": doc["project_id"]}},
+                    upsert=True,
+                )
+            )
+        _col(USER_PROJECTS_COLLECTION).bulk_write(subscriptions, ordered=False)
+        projects.bulk_write(
+            [
+                UpdateOne(
+                    {"project_id": project_id, "user_id": {"$exists": False}},
+                    {"$setOnInsert": {"project_id": project_id, **fields}},
+                    upsert=True,
+                )
+                for project_id, fields in catalogue.items()
+            ],
+            ordered=False,
+        )
+        projects.delete_many({"_id": {"$in": [doc["_id"] for doc in legacy]}})
+        logger.info(
+            f"Проекты перенесены в общий каталог: {len(catalogue)} проектов, {len(legacy)} подписок"
+        )
+    # Старый уникальный индекс (user_id, project_id) в каталоге больше не нужен
+    if "user_id_1_project_id_1" in projects.index_information():
+        projects.drop_index("user_id_1_project_id_1")
+    return len(legacy)
+
+
+def migrate_suggestions() -> int:
+    """
+    Переводит значения параметров из старой схемы (документ на параметр с массивом values)
+    в документы на каждое значение. Счётчики переносятся через $max, поэтому повторный
+    запуск безопасен. Возвращает число перенесённых старых документов.
+    """
+    col = _col(SUGGESTIONS_COLLECTION)
+    # Старый уникальный индекс без value не даёт хранить несколько значений параметра
+    if "instance_1_job_id_1_param_1" in col.index_information():
+        col.drop_index("instance_1_job_id_1_param_1")
+    legacy = list(col.find({"values": {"$exists": True}}))
+    if not legacy:
+        return 0
+    operations = [
+        UpdateOne(
+            {
+                "instance": doc.get("instance", DEFAULT_INSTANCE),
+                "job_id": doc["job_id"],
+                "param": doc["param"],
+                "value": item["value"],
+            },
+            {"$max": {"count": item["count"], "last_used": item["last_used"]}},
+            upsert=True,
+        )
+        for doc in legacy
+        for item in doc["values"]
+    ]
+    if operations:
+        col.bulk_write(operations, ordered=False)
+    col.delete_many({"_id": {"$in": [doc["_id"] for doc in legacy]}})
+    logger.info(f"Значения параметров перенесены в новую схему: {len(operations)} значений")
+    return len(legacy)
+
+
+def migrate_instances() -> int:
+    """
+    Помечает данные, сохранённые до поддержки нескольких серверов TestOps, сервером
+    по умолчанию и удаляет старые уникальные индексы без instance (новые создаёт ensure_indexes).
+    Повторный запуск безопасен. Возвращает число помеченных документов.
+    """
+    tagged = 0
+    for name, legacy_indexes in INSTANCE_COLLECTIONS.items():
+        col = _col(name)
+        tagged += col.update_many(
+            {"instance": {"$exists": False}}, {"$set": {"instance": DEFAULT_INSTANCE}}
+        ).modified_count
+        existing = col.index_information()
+        for index in legacy_indexes:
+            if index in existing:
+                col.drop_index(index)
+    if tagged:
+        logger.info(f"Данные помечены сервером TestOps «{DEFAULT_INSTANCE}»: {tagged} документов")
+    return tagged
+
+
+def run_migrations() -> None:
+    """
+    Переносит данные из старых схем. Запросы бота уже рассчитаны на новую схему
+    (например, фильтруют по instance), поэтому миграции должны закончиться до приёма апдейтов.
+    Ошибки только логируются.
+    """
+    try:
+        migrate_projects()
+    except mongo_errors.PyMongoError as e:
+        logger.warning(f"Не удалось перенести проекты в общий каталог: {e}")
+    try:
+        migrate_instances()
+    except mongo_errors.PyMongoError as e:
+        logger.warning(f"Не удалось пометить данные сервером TestOps: {e}")
+    try:
+        migrate_suggestions()
+    except mongo_errors.PyMongoError as e:
+        logger.warning(f"Не удалось перенести значения параметров: {e}")
+
 
-mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-db = mongo_client[MONGO_DB]
-projects_col = db[PROJECTS_COLLECTION]
-allowed_col = db[ALLOWED_COLLECTION]
+def ensure_indexes() -> None:
+    """
+    Создаёт индексы из INDEXES. Ошибки только логируются — бот может работать и без них.
+    """
+    for collection, keys, options in INDEXES:
+        try:
+            _col(collection).create_index(keys, **options)
+        except mongo_errors.PyMongoError as e:
+            logger.warning(f"Не удалось создать индекс для {collection}: {e}")
 
 
-try:
-    projects_col.create_index([("user_id", 1), ("project_id", 1)], unique=True)
-except mongo_errors.PyMongoError as e:
-    logger.warning(f"Не удалось создать индекс для projects: {e}")
+async def init_db() -> "asyncio.Task":
+    """
+    Выполняет миграции (в отдельном потоке, но дожидаясь их) и запускает создание индексов
+    в фоне. Вызывается из post_init, то есть до начала приёма апдейтов; возвращает задачу
+    создания индексов, которую при желании можно дождаться.
+    """
+    await asyncio.to_thread(run_migrations)
+    return asyncio.get_running_loop().create_task(asyncio.to_thread(ensure_indexes))
+
 
-try:
-    allowed_col.create_index([("username", 1)], unique=True)
-except mongo_errors.PyMongoError as e:
-    logger.warning(f"Не удалось создать индекс для allowed_users: {e}")
+def close_db() -> None:
+    """Закрывает MongoClient, если он был создан."""
+    global _mongo_client
+    if _mongo_client is not None:
+        _mongo_client.close()
+        _mongo_client = None
 
 
 def is_user_allowed(username: str) -> bool:
@@ -32,7 +233,7 @@ def is_user_allowed(username: str) -> bool:
     Возвращает True, если в коллекции allowed_users есть документ с данным username.
     """
     try:
-        return allowed_col.find_one({"username": username}) is not None
+        return _col(ALLOWED_COLLECTION).find_one({"username": username}) is not None
     except Exception as e:
         logger.error(f"DB.is_user_allowed: {e}")
         return False
@@ -44,7 +245,7 @@ def add_allowed_user(username: str) -> None:
     Если уже есть—просто игнорируем DuplicateKeyError.
     """
     try:
-        allowed_col.insert_one({"username": username})
+        _col(ALLOWED_COLLECTION).insert_one({"username": username})
     except mongo_errors.DuplicateKeyError:
         pass
     except Exception as e:
@@ -57,7 +258,7 @@ def remove_allowed_user(username: str) -> None:
     Удаляет username из коллекции allowed_users.
     """
     try:
-        allowed_col.delete_one({"username": username})
+        _col(ALLOWED_COLLECTION).delete_one({"username": username})
     except Exception as e:
         logger.error(f"DB.remove_allowed_user: {e}")
         raise
@@ -68,60 +269,620 @@ def list_allowed_users() -> List[str]:
     Возвращает список всех username из allowed_users.
     """
     try:
-        return [doc["username"] for doc in allowed_col.find({})]
+        return [doc["username"] for doc in _col(ALLOWED_COLLECTION).find({})]
     except Exception as e:
         logger.error(f"DB.list_allowed_users: {e}")
         return []
 
 
+def add_allowed_users(usernames: List[str]) -> int:
+    """
+    Добавляет в allowed_users сразу несколько username одним bulk_write.
+    Уже существующие пропускаются. Возвращает число новых пользователей.
+    """
+    if not usernames:
+        return 0
+    try:
+        result = _col(ALLOWED_COLLECTION).bulk_write(
+            [
+                UpdateOne({"username": u}, {"$setOnInsert": {"username": u}}, upsert=True)
+                for u in usernames
+            ],
+            ordered=False,
+        )
+        return result.upserted_count
+    except Exception as e:
+        logger.error(f"DB.add_allowed_users: {e}")
+        raise
+
+
+def remove_allowed_users(usernames: List[str]) -> int:
+    """
+    Удаляет из allowed_users сразу несколько username. Возвращает число удалённых.
+    """
+    if not usernames:
+        return 0
+    try:
+        return _col(ALLOWED_COLLECTION).delete_many({"username": {"$in": usernames}}).deleted_count
+    except Exception as e:
+        logger.error(f"DB.remove_allowed_users: {e}")
+        raise
+
+
+def get_allowed_users_page(after: Optional[str], limit: int) -> Tuple[List[str], bool]:
+    """
+    Страница белого списка по алфавиту: до limit username, идущих после after.
+    Использует индекс по username, поэтому не зависит от размера списка.
+    Возвращает (username на странице, есть ли следующая страница).
+    """
+    query = {"username": {"$gt": after}} if after else {}
+    try:
+        cursor = (
+            _col(ALLOWED_COLLECTION)
+            .find(query, {"_id": 0, "username": 1})
+            .sort("username", 1)
+            .limit(limit + 1)
+        )
+        names = [doc["username"] for doc in cursor]
+        return names[:limit], len(names) > limit
+    except Exception as e:
+        logger.error(f"DB.get_allowed_users_page: {e}")
+        raise
+
+
+def iter_allowed_users(batch_size: int = 500) -> Iterator[str]:
+    """
+    Перебирает весь белый список по алфавиту через курсор, не загружая его в память целиком.
+    """
+    cursor = (
+        _col(ALLOWED_COLLECTION)
+        .find({}, {"_id": 0, "username": 1})
+        .sort("username", 1)
+        .batch_size(batch_size)
+    )
+    for doc in cursor:
+        yield doc["username"]
+
+
+def _with_catalogue(subscriptions: List[Dict]) -> List[Dict]:
+    """
+    Дополняет подписки данными проекта из каталога (project_name, project_meta).
+    """
+    if not subscriptions:
+        return []
+    ids = list({sub["project_id"] for sub in subscriptions})
+    catalogue = {
+        (doc.get("instance", DEFAULT_INSTANCE), doc["project_id"]): doc
+        for doc in _col(PROJECTS_COLLECTION).find({"project_id": {"$in": ids}}, {"_id": 0})
+    }
+    result = []
+    for sub in subscriptions:
+        instance = sub.get("instance", DEFAULT_INSTANCE)
+        project = catalogue.get(
+            (instance, sub["project_id"]), {"project_name": f"Проект {sub['project_id']}"}
+        )
+        result.append(
+            {**project, "user_id": sub["user_id"], "instance": instance, "project_id": sub["project_id"]}
+        )
+    return result
+
+
 def get_user_projects(user_id: int) -> List[Dict]:
     """
-    Возвращает список документов проектов для данного user_id.
+    Возвращает список проектов пользователя (instance, project_id, project_name, ...)
+    в порядке добавления.
     """
     try:
-        return list(projects_col.find({"user_id": user_id}))
+        subscriptions = list(
+            _col(USER_PROJECTS_COLLECTION).find({"user_id": user_id}, {"_id": 0}).sort("_id", 1)
+        )
+        return _with_catalogue(subscriptions)
     except Exception as e:
         logger.error(f"DB.get_user_projects: {e}")
         raise
 
 
-def find_project(user_id: int, project_id: int) -> Optional[Dict]:
+def find_project(user_id: int, project_id: int, instance: str = DEFAULT_INSTANCE) -> Optional[Dict]:
     """
-    Возвращает документ проекта по user_id + project_id или None, если не найден.
+    Возвращает проект по user_id + (instance, project_id) или None, если пользователь его не добавлял.
     """
     try:
-        return projects_col.find_one({"user_id": user_id, "project_id": project_id})
+        subscription = _col(USER_PROJECTS_COLLECTION).find_one(
+            {"user_id": user_id, "instance": instance, "project_id": project_id}, {"_id": 0}
+        )
+        if subscription is None:
+            return None
+        return _with_catalogue([subscription])[0]
     except Exception as e:
         logger.error(f"DB.find_project: {e}")
         raise
 
 
-def add_project(user_id: int, project_id: int, project_name: str) -> None:
+def add_project(user_id: int, project_id: int, project_name: str, instance: str = DEFAULT_INSTANCE) -> None:
     """
-    Вставляет новый проект в MongoDB. Если уже существует — бросает mongo_errors.DuplicateKeyError.
+    Добавляет проект пользователю: обновляет запись в общем каталоге и создаёт подписку.
+    Если подписка уже существует — бросает mongo_errors.DuplicateKeyError.
     """
     try:
-        projects_col.insert_one(
-            {
-                "user_id": user_id,
-                "project_id": project_id,
-                "project_name": project_name,
-            }
+        _col(PROJECTS_COLLECTION).update_one(
+            {"instance": instance, "project_id": project_id},
+            {"$set": {"project_name": project_name}},
+            upsert=True,
+        )
+        _col(USER_PROJECTS_COLLECTION).insert_one(
+            {"user_id": user_id, "instance": instance, "project_id": project_id}
         )
     except mongo_errors.DuplicateKeyError:
         raise
     except Exception as e:
         logger.error(f"DB.add_project: {e}")
         raise
-    
-def delete_project(user_id: int, project_id: int) -> bool:
+
+
+def add_projects(
+        user_id: int, projects: Dict[int, str], instance: str = DEFAULT_INSTANCE
+) -> Tuple[List[int], List[int]]:
+    """
+    Добавляет пользователю сразу несколько проектов {project_id: project_name} сервера instance:
+    каталог обновляется одним bulk_write, подписки вставляются одним неупорядоченным insert_many.
+    Возвращает (добавленные ID, ID, которые уже были у пользователя).
+    """
+    if not projects:
+        return [], []
+    try:
+        _col(PROJECTS_COLLECTION).bulk_write(
+            [
+                UpdateOne(
+                    {"instance": instance, "project_id": pid},
+                    {"$set": {"project_name": name}},
+                    upsert=True,
+                )
+                for pid, name in projects.items()
+            ],
+            ordered=False,
+        )
+        docs = [{"user_id": user_id, "instance": instance, "project_id": pid} for pid in projects]
+        try:
+            _col(USER_PROJECTS_COLLECTION).insert_many(docs, ordered=False)
+            return list(projects), []
+        except mongo_errors.BulkWriteError as e:
+            duplicates = [
+                docs[err["index"]]["project_id"]
+                for err in e.details.get("writeErrors", [])
+                if err.get("code") == 11000
+            ]
+            if len(duplicates) != len(e.details.get("writeErrors", [])):
+                raise
+            return [pid for pid in projects if pid not in duplicates], duplicates
+    except Exception as e:
+        logger.error(f"DB.add_projects: {e}")
+        raise
+
+
+def delete_project(user_id: int, project_id: int, instance: str = DEFAULT_INSTANCE) -> bool:
     """
-    Удаляет проект с заданным project_id для пользователя user_id.
+    Отписывает пользователя user_id от проекта (instance, project_id) (запись в каталоге остаётся).
     Возвращает True, если удаление прошло успешно.
     """
     try:
-        result = projects_col.delete_one({"user_id": user_id, "project_id": project_id})
+        result = _col(USER_PROJECTS_COLLECTION).delete_one(
+            {"user_id": user_id, "instance": instance, "project_id": project_id}
+        )
         return result.deleted_count > 0
     except Exception as e:
         logger.error(f"DB.delete_project: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def get_saved_project_ids() -> Dict[str, List[int]]:
+    """
+    Возвращает ID всех проектов, на которые подписан хотя бы один пользователь (без повторов),
+    по серверам TestOps: {instance: [project_id, ...]}.
+    """
+    try:
+        saved: Dict[str, List[int]] = {}
+        for instance in _col(USER_PROJECTS_COLLECTION).distinct("instance"):
+            saved[instance] = _col(USER_PROJECTS_COLLECTION).distinct(
+                "project_id", {"instance": instance}
+            )
+        return saved
+    except Exception as e:
+        logger.error(f"DB.get_saved_project_ids: {e}")
+        raise
+
+
+def update_projects_metadata(projects: Dict[int, Dict], instance: str = DEFAULT_INSTANCE) -> int:
+    """
+    Обновляет имя и метаданные проектов сервера instance в общем каталоге одним bulk_write.
+    projects: {project_id: {"project_name": ..., "project_meta": {...}}}.
+    Документы, где ничего не поменялось, не трогаются. Возвращает число изменённых документов.
+    """
+    if not projects:
+        return 0
+    requests = [
+        UpdateOne(
+            {
+                "instance": instance,
+                "project_id": project_id,
+                "$or": [{field: {"$ne": value}} for field, value in fields.items()],
+            },
+            {"$set": fields},
+        )
+        for project_id, fields in projects.items()
+    ]
+    try:
+        result = _col(PROJECTS_COLLECTION).bulk_write(requests, ordered=False)
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"DB.update_projects_metadata: {e}")
+        raise
+
+
+def record_job_run(
+    project_id: int,
+    job_id: int,
+    job_name: str,
+    duration_sec: float,
+    stats: LaunchStats,
+    instance: str = DEFAULT_INSTANCE,
+) -> None:
+    """
+    Инкрементально обновляет сводку по Job-у после завершения очередного прогона.
+    Сводка хранится одним документом на (instance, project_id, job_id): счётчики прогонов,
+    сумма длительностей, окно последних JOB_STATS_WINDOW длительностей, серии падений
+    и разбивка последнего прогона по статусам.
+    Прогон считается неуспешным, если в нём есть хотя бы один упавший или сломанный тест.
+    """
+    run_failed = stats.has_failures
+    update = [
+        {
+            "$set": {
+                "job_name": job_name,
+                "runs": {"$add": [{"$ifNull": ["$runs", 0]}, 1]},
+                "passed_runs": {
+                    "$add": [{"$ifNull": ["$passed_runs", 0]}, 0 if run_failed else 1]
+                },
+                "duration_sum": {"$add": [{"$ifNull": ["$duration_sum", 0]}, duration_sec]},
+                "durations": {
+                    "$slice": [
+                        {"$concatArrays": [{"$ifNull": ["$durations", []]}, [duration_sec]]},
+                        -JOB_STATS_WINDOW,
+                    ]
+                },
+                "tests_total": {"$add": [{"$ifNull": ["$tests_total", 0]}, stats.total]},
+                "tests_passed": {"$add": [{"$ifNull": ["$tests_passed", 0]}, stats.passed]},
+                "last_counts": {"$literal": stats.counts},
+                "failure_streak": (
+                    {"$add": [{"$ifNull": ["$failure_streak", 0]}, 1]} if run_failed else 0
+                ),
+                "last_status": "FAILED" if run_failed else "PASSED",
+                "last_run_at": "$$NOW",
+            }
+        },
+        {
+            "$set": {
+                "max_failure_streak": {
+                    "$max": [{"$ifNull": ["$max_failure_streak", 0]}, "$failure_streak"]
+                }
+            }
+        },
+    ]
+    try:
+        _col(JOB_STATS_COLLECTION).update_one(
+            {"instance": instance, "project_id": project_id, "job_id": job_id}, update, upsert=True
+        )
+    except Exception as e:
+        logger.error(f"DB.record_job_run: {e}")
+        raise
+
+
+def get_project_job_stats(project_id: int, instance: str = DEFAULT_INSTANCE) -> List[Dict]:
+    """
+    Возвращает сводки по всем Job-ам проекта (по одному документу на Job).
+    """
+    try:
+        return list(
+            _col(JOB_STATS_COLLECTION)
+            .find({"instance": instance, "project_id": project_id})
+            .sort("job_name", 1)
+        )
+    except Exception as e:
+        logger.error(f"DB.get_project_job_stats: {e}")
+        raise
+
+
+def create_watch(watch: Dict, owner: str, lease_until: float) -> None:
+    """
+    Регистрирует ожидание прогона сразу с арендой (lease) на воркер owner.
+    """
+    try:
+        _col(WATCHES_COLLECTION).update_one(
+            {"instance": watch["instance"], "launch_id": watch["launch_id"]},
+            {"$set": {**watch, "owner": owner, "lease_until": lease_until}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"DB.create_watch: {e}")
+        raise
+
+
+def renew_watch_leases(
+        owner: str, keys: List[Tuple[str, int]], lease_until: float
+) -> List[Tuple[str, int]]:
+    """
+    Продлевает аренду ожиданий (instance, launch_id), которые всё ещё принадлежат owner.
+    Возвращает ключи, оставшиеся за этим воркером (остальные забрал другой воркер
+    или они уже завершены).
+    """
+    if not keys:
+        return []
+    try:
+        col = _col(WATCHES_COLLECTION)
+        query = {"owner": owner, "launch_id": {"$in": list({launch_id for _, launch_id in keys})}}
+        col.update_many(query, {"$set": {"lease_until": lease_until}})
+        return [
+            (doc.get("instance", DEFAULT_INSTANCE), doc["launch_id"])
+            for doc in col.find(query, {"instance": 1, "launch_id": 1})
+        ]
+    except Exception as e:
+        logger.error(f"DB.renew_watch_leases: {e}")
+        raise
+
+
+def claim_watch(owner: str, now: float, lease_until: float) -> Optional[Dict]:
+    """
+    Атомарно забирает одно ожидание с истёкшей арендой (воркер умер или отпустил его).
+    Возвращает документ ожидания или None, если свободных нет.
+    """
+    try:
+        return _col(WATCHES_COLLECTION).find_one_and_update(
+            {"lease_until": {"$lt": now}},
+            {"$set": {"owner": owner, "lease_until": lease_until}},
+            return_document=ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        logger.error(f"DB.claim_watch: {e}")
+        raise
+
+
+def claim_expired_watches(owner: str, now: float, lease_until: float, limit: int) -> List[Dict]:
+    """
+    Забирает до limit ожиданий с истёкшей арендой (каждое — атомарно, см. claim_watch).
+    Возвращает документы забранных ожиданий; меньше limit — свободных больше нет.
+    """
+    claimed = []
+    while len(claimed) < limit:
+        doc = claim_watch(owner, now, lease_until)
+        if not doc:
+            break
+        claimed.append(doc)
+    return claimed
+
+
+def finish_watch(launch_id: int, owner: str, instance: str = DEFAULT_INSTANCE) -> bool:
+    """
+    Удаляет ожидание, если оно принадлежит owner. Возвращает True только одному воркеру —
+    тому, кто и должен отправить уведомление о завершении.
+    """
+    try:
+        result = _col(WATCHES_COLLECTION).delete_one(
+            {"instance": instance, "launch_id": launch_id, "owner": owner}
+        )
+        return result.deleted_count > 0
+    except Exception as e:
+        logger.error(f"DB.finish_watch: {e}")
+        raise
+
+
+def release_watches(owner: str) -> int:
+    """
+    Отпускает все ожидания воркера (при остановке), чтобы другие воркеры сразу их подхватили.
+    Возвращает количество отпущенных ожиданий.
+    """
+    try:
+        result = _col(WATCHES_COLLECTION).update_many(
+            {"owner": owner}, {"$set": {"lease_until": 0}}
+        )
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"DB.release_watches: {e}")
+        raise
+
+
+def request_watch_checks(launch_ids: List[int], instance: Optional[str] = None) -> Set[int]:
+    """
+    Помечает ожидания как «прогон закрыт, проверить сейчас» — для случая, когда событие
+    о закрытии пришло не тому воркеру, который опрашивает прогон. Все ID — одним update_many.
+    instance=None — прогоны с такими ID на любом сервере TestOps (лишняя проверка безвредна).
+    Возвращает ID, для которых ожидания нашлись.
+    """
+    query: Dict = {"launch_id": {"$in": launch_ids}}
+    if instance is not None:
+        query["instance"] = instance
+    col = _col(WATCHES_COLLECTION)
+    try:
+        found = {doc["launch_id"] for doc in col.find(query, {"launch_id": 1, "_id": 0})}
+        if found:
+            col.update_many(query, {"$set": {"check_requested": True}})
+        return found
+    except Exception as e:
+        logger.error(f"DB.request_watch_checks: {e}")
+        raise
+
+
+def pop_requested_checks(owner: str) -> List[Tuple[str, int]]:
+    """
+    Возвращает (instance, launch_id) ожиданий owner, для которых запрошена немедленная
+    проверка, и снимает с них этот флаг.
+    """
+    try:
+        col = _col(WATCHES_COLLECTION)
+        query = {"owner": owner, "check_requested": True}
+        docs = list(col.find(query, {"instance": 1, "launch_id": 1}))
+        if docs:
+            col.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}}, {"$unset": {"check_requested": ""}}
+            )
+        return [(doc.get("instance", DEFAULT_INSTANCE), doc["launch_id"]) for doc in docs]
+    except Exception as e:
+        logger.error(f"DB.pop_requested_checks: {e}")
+        raise
+
+
+def add_schedule(schedule: Dict) -> str:
+    """
+    Сохраняет расписание запуска Job-а. Возвращает его ID (строка ObjectId).
+    """
+    try:
+        return str(_col(SCHEDULES_COLLECTION).insert_one(dict(schedule)).inserted_id)
+    except Exception as e:
+        logger.error(f"DB.add_schedule: {e}")
+        raise
+
+
+def list_schedules() -> List[Dict]:
+    """
+    Возвращает все расписания (поле id — строковый ID, вместо _id).
+    """
+    try:
+        return [
+            {**doc, "id": str(doc.pop("_id"))}
+            for doc in _col(SCHEDULES_COLLECTION).find({}).sort("_id", 1)
+        ]
+    except Exception as e:
+        logger.error(f"DB.list_schedules: {e}")
+        raise
+
+
+def delete_schedule(schedule_id: str) -> bool:
+    """
+    Удаляет расписание. Возвращает False, если такого нет (или ID некорректный).
+    """
+    if not ObjectId.is_valid(schedule_id):
+        return False
+    try:
+        return _col(SCHEDULES_COLLECTION).delete_one({"_id": ObjectId(schedule_id)}).deleted_count > 0
+    except Exception as e:
+        logger.error(f"DB.delete_schedule: {e}")
+        raise
+
+
+def claim_schedule_run(schedule_id: str, slot: int) -> bool:
+    """
+    Атомарно отмечает запуск расписания в слоте slot (номер минуты).
+    True получает только один воркер — он и запускает Job.
+    """
+    try:
+        result = _col(SCHEDULES_COLLECTION).update_one(
+            {"_id": ObjectId(schedule_id), "last_slot": {"$ne": slot}},
+            {"$set": {"last_slot": slot}},
+        )
+        return result.modified_count == 1
+    except Exception as e:
+        logger.error(f"DB.claim_schedule_run: {e}")
+        raise
+
+
+def record_schedule_launch(schedule_id: str, launch_id: Optional[int], error: Optional[str] = None) -> None:
+    """
+    Запоминает результат последнего запуска по расписанию (ID прогона или текст ошибки).
+    """
+    try:
+        _col(SCHEDULES_COLLECTION).update_one(
+            {"_id": ObjectId(schedule_id)},
+            {"$set": {"last_launch_id": launch_id, "last_error": error, "last_run_at": time.time()}},
+        )
+    except Exception as e:
+        logger.error(f"DB.record_schedule_launch: {e}")
+
+
+def load_param_suggestions(job_id: int, instance: str = DEFAULT_INSTANCE) -> List[Dict]:
+    """
+    Возвращает сохранённые значения параметров Job-а: документ на значение
+    (param, value, count, last_used).
+    """
+    try:
+        return list(
+            _col(SUGGESTIONS_COLLECTION).find({"instance": instance, "job_id": job_id}, {"_id": 0})
+        )
+    except Exception as e:
+        logger.error(f"DB.load_param_suggestions: {e}")
+        raise
+
+
+def save_param_suggestions(docs: List[Dict]) -> None:
+    """
+    Прибавляет к счётчикам значений параметров приращения count одним bulk_write
+    ($inc, поэтому воркеры не затирают данные друг друга). Документ на значение.
+    """
+    try:
+        _col(SUGGESTIONS_COLLECTION).bulk_write(
+            [
+                UpdateOne(
+                    {
+                        "instance": doc["instance"],
+                        "job_id": doc["job_id"],
+                        "param": doc["param"],
+                        "value": doc["value"],
+                    },
+                    {"$inc": {"count": doc["count"]}, "$max": {"last_used": doc["last_used"]}},
+                    upsert=True,
+                )
+                for doc in docs
+            ],
+            ordered=False,
+        )
+    except Exception as e:
+        logger.error(f"DB.save_param_suggestions: {e}")
+        raise
+
+
+def claim_launch_key(key: str, ttl: float) -> Optional[Dict]:
+    """
+    Атомарно занимает ключ запуска на ttl секунд.
+    Возвращает None, если ключ был свободен (или протух) и теперь занят этим вызовом,
+    иначе — документ занятого ключа (launch_id = None, пока запуск ещё идёт).
+    """
+    col = _col(LAUNCH_KEYS_COLLECTION)
+    try:
+        for _ in range(2):
+            now = datetime.now(timezone.utc)
+            expires_at = now + timedelta(seconds=ttl)
+            try:
+                col.insert_one({"_id": key, "launch_id": None, "expires_at": expires_at})
+                return None
+            except mongo_errors.DuplicateKeyError:
+                pass
+            # TTL-монитор MongoDB удаляет документы раз в минуту — протухший ключ перехватываем сами
+            stale = col.find_one_and_update(
+                {"_id": key, "expires_at": {"$lte": now}},
+                {"$set": {"launch_id": None, "expires_at": expires_at}},
+            )
+            if stale is not None:
+                return None
+            doc = col.find_one({"_id": key})
+            if doc is not None:
+                return doc
+            # Ключ удалили между запросами — пробуем занять ещё раз
+        # Ключ так и не удалось ни занять, ни прочитать: его прямо сейчас занимают
+        # и освобождают другие воркеры — считаем, что запуск идёт
+        return {"_id": key, "launch_id": None}
+    except Exception as e:
+        logger.error(f"DB.claim_launch_key: {e}")
+        raise
+
+
+def set_launch_key(key: str, launch_id: int) -> None:
+    """Запоминает ID прогона, запущенного по ключу."""
+    try:
+        _col(LAUNCH_KEYS_COLLECTION).update_one({"_id": key}, {"$set": {"launch_id": launch_id}})
+    except Exception as e:
+        logger.error(f"DB.set_launch_key: {e}")
+
+
+def release_launch_key(key: str) -> None:
+    """Освобождает ключ, если запуск не удался (повтор должен снова пойти в TestOps)."""
+    try:
+        _col(LAUNCH_KEYS_COLLECTION).delete_one({"_id": key, "launch_id": None})
+    except Exception as e:
+        logger.error(f"DB.release_launch_key: {e}")
@@ -1,11 +1,36 @@
+import asyncio
+import html
 import logging
 import os
 import re
+import time
+from typing import List, Optional, Tuple
 
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
 
-from db import add_allowed_user, remove_allowed_user, list_allowed_users
+import testops_client as toc
+from db import (
+    add_allowed_users,
+    add_schedule,
+    delete_schedule,
+    get_allowed_users_page,
+    iter_allowed_users,
+    list_schedules,
+    remove_allowed_users,
+)
+from loop_monitor import monitor
+from rate_limit import (
+    RATE_LIMIT_LAUNCHES_BURST,
+    RATE_LIMIT_LAUNCHES_PER_HOUR,
+    RATE_LIMIT_UPDATES_BURST,
+    RATE_LIMIT_UPDATES_PER_MIN,
+    rate_limit_status,
+)
+from scheduler import build_trigger, schedule_local, unschedule_local
+from testops_client import DEFAULT_INSTANCE
+from utils import format_ref, parse_ref
 
 logger = logging.getLogger(__name__)
 
@@ -13,11 +38,38 @@ logger = logging.getLogger(__name__)
 raw = os.getenv("OWNER_USERNAMES", "")
 OWNER_USERNAMES = {u.strip() for u in raw.split(",") if u.strip()}
 
+USERNAME_RE = re.compile(r"[A-Za-z0-9_]{5,32}")
+# Сколько пользователей показывать на одной странице /list_allowed
+LIST_PAGE_SIZE = 50
+# Максимальный размер файла для /import_allowed
+IMPORT_MAX_BYTES = 1024 * 1024
+
+
+def _parse_usernames(items: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Разбирает username из аргументов команды или строк файла (через пробел, запятую,
+    с новой строки; @ в начале допускается). Возвращает (корректные без повторов, некорректные).
+    """
+    valid, invalid = [], []
+    for item in items:
+        for token in re.split(r"[\s,;]+", item):
+            name = token.strip().lstrip("@")
+            if not name:
+                continue
+            (valid if USERNAME_RE.fullmatch(name) else invalid).append(name)
+    return list(dict.fromkeys(valid)), invalid
+
+
+def _invalid_note(invalid: List[str]) -> str:
+    if not invalid:
+        return ""
+    return "\n⚠️ Пропущены (неверный формат): " + ", ".join(invalid[:20]) + ("…" if len(invalid) > 20 else "")
+
 
 async def allow_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    /allow_user <telegram_username>
-    Добавляет указанного пользователя (по @username) в белый список.
+    /allow_user <telegram_username> [<telegram_username> ...]
+    Добавляет указанных пользователей (по @username) в белый список одним запросом к MongoDB.
     Доступна только пользователям из OWNER_USERNAMES.
     """
     from_user = update.effective_user.username
@@ -25,27 +77,34 @@ async def allow_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         return
 
     if not context.args:
-        return await update.message.reply_text("Использование: /allow_user <telegram_username>")
+        return await update.message.reply_text("Использование: /allow_user <telegram_username> [...]")
 
-    raw_username = context.args[0].lstrip("@")
-    if not re.fullmatch(r"[A-Za-z0-9_]+", raw_username):
+    usernames, invalid = _parse_usernames(context.args)
+    if not usernames:
         return await update.message.reply_text(
-            "Неверный формат username, используйте только буквы, цифры и подчёркивания."
+            "Неверный формат username: 5–32 символа, только буквы, цифры и подчёркивания."
         )
 
     try:
-        add_allowed_user(raw_username)
+        added = add_allowed_users(usernames)
     except Exception as e:
         logger.error(f"Не удалось добавить в allowed_users: {e}")
         return await update.message.reply_text("❗ Ошибка при добавлении пользователя.")
 
-    await update.message.reply_text(f"✅ Пользователь @{raw_username} добавлен в белый список.")
+    if len(usernames) == 1 and not invalid:
+        return await update.message.reply_text(
+            f"✅ Пользователь @{usernames[0]} добавлен в белый список."
+        )
+    await update.message.reply_text(
+        f"✅ Добавлено в белый список: {added} (уже были: {len(usernames) - added})"
+        + _invalid_note(invalid)
+    )
 
 
 async def disallow_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    /disallow_user <telegram_username>
-    Удаляет указанного пользователя (по @username) из белого списка.
+    /disallow_user <telegram_username> [<telegram_username> ...]
+    Удаляет указанных пользователей (по @username) из белого списка одним запросом к MongoDB.
     Доступна только пользователям из OWNER_USERNAMES.
     """
     from_user = update.effective_user.username
@@ -53,36 +112,347 @@ async def disallow_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     if not context.args:
-        return await update.message.reply_text("Использование: /disallow_user <telegram_username>")
+        return await update.message.reply_text("Использование: /disallow_user <telegram_username> [...]")
 
-    raw_username = context.args[0].lstrip("@")
-    if not re.fullmatch(r"[A-Za-z0-9_]+", raw_username):
+    usernames, invalid = _parse_usernames(context.args)
+    if not usernames:
         return await update.message.reply_text(
-            "Неверный формат username, используйте только буквы, цифры и подчёркивания."
+            "Неверный формат username: 5–32 символа, только буквы, цифры и подчёркивания."
         )
 
     try:
-        remove_allowed_user(raw_username)
+        removed = remove_allowed_users(usernames)
     except Exception as e:
         logger.error(f"Не удалось удалить из allowed_users: {e}")
         return await update.message.reply_text("❗ Ошибка при удалении пользователя.")
 
-    await update.message.reply_text(f"❌ Пользователь @{raw_username} удалён из белого списка.")
+    if len(usernames) == 1 and not invalid:
+        return await update.message.reply_text(
+            f"❌ Пользователь @{usernames[0]} удалён из белого списка."
+        )
+    await update.message.reply_text(
+        f"❌ Удалено из белого списка: {removed} (не найдены: {len(usernames) - removed})"
+        + _invalid_note(invalid)
+    )
+
+
+def _allowed_page(after: Optional[str]) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Текст и клавиатура одной страницы белого списка. Кнопка «Далее» несёт
+    последний username страницы — с него начинается следующая.
+    """
+    names, has_more = get_allowed_users_page(after, LIST_PAGE_SIZE)
+    if not names:
+        return "Список разрешённых пользователей пуст.", None
+    text = "👥 Разрешённые пользователи:\n" + "\n".join(f"• @{u}" for u in names)
+    buttons = []
+    if after:
+        buttons.append(InlineKeyboardButton("⏮ В начало", callback_data="allowed_page_"))
+    if has_more:
+        # Старые записи могли быть длиннее 32 символов; префикс не больше имени,
+        # поэтому страница лишь повторит его, но ничего не пропустит.
+        buttons.append(InlineKeyboardButton("Далее ▶️", callback_data=f"allowed_page_{names[-1][:32]}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
 
 
 async def list_allowed(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     /list_allowed
-    Показывает всех пользователей (@username) из белого списка.
+    Показывает пользователей (@username) из белого списка постранично, по LIST_PAGE_SIZE на страницу.
     Доступна только пользователям из OWNER_USERNAMES.
     """
     from_user = update.effective_user.username
     if from_user not in OWNER_USERNAMES:
         return
 
-    ids = list_allowed_users()
-    if not ids:
+    try:
+        text, markup = _allowed_page(None)
+    except Exception:
+        return await update.message.reply_text("❗ Ошибка при чтении белого списка.")
+    await update.message.reply_text(text, reply_markup=markup)
+
+
+async def list_allowed_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Кнопки «Далее ▶️» / «⏮ В начало» в /list_allowed (callback_data allowed_page_<username>).
+    """
+    query = update.callback_query
+    if query.from_user.username not in OWNER_USERNAMES:
+        await query.answer()
+        return
+    await query.answer()
+    after = query.data[len("allowed_page_"):] or None
+    try:
+        text, markup = _allowed_page(after)
+    except Exception:
+        return await query.edit_message_text("❗ Ошибка при чтении белого списка.")
+    await query.edit_message_text(text, reply_markup=markup)
+
+
+async def export_allowed(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /export_allowed
+    Присылает белый список файлом allowed_users.txt (один username на строку).
+    Доступна только пользователям из OWNER_USERNAMES.
+    """
+    from_user = update.effective_user.username
+    if from_user not in OWNER_USERNAMES:
+        return
+
+    try:
+        content = await asyncio.to_thread(lambda: "\n".join(iter_allowed_users()))
+    except Exception as e:
+        logger.error(f"Не удалось выгрузить allowed_users: {e}")
+        return await update.message.reply_text("❗ Ошибка при чтении белого списка.")
+    if not content:
         return await update.message.reply_text("Список разрешённых пользователей пуст.")
+    await update.message.reply_document(
+        document=(content + "\n").encode("utf-8"),
+        filename="allowed_users.txt",
+        caption=f"👥 Пользователей в белом списке: {content.count(chr(10)) + 1}",
+    )
+
+
+async def import_allowed(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /import_allowed — в ответ на сообщение с файлом (например, из /export_allowed)
+    или со списком username в аргументах. Добавляет всех пользователей одним bulk_write.
+    Доступна только пользователям из OWNER_USERNAMES.
+    """
+    from_user = update.effective_user.username
+    if from_user not in OWNER_USERNAMES:
+        return
+
+    lines = list(context.args or [])
+    replied = update.message.reply_to_message
+    document = replied.document if replied else None
+    if document:
+        if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+            return await update.message.reply_text(
+                f"❗ Файл слишком большой (максимум {IMPORT_MAX_BYTES // 1024} КБ)."
+            )
+        try:
+            data = await (await document.get_file()).download_as_bytearray()
+        except Exception as e:
+            logger.error(f"Не удалось скачать файл для импорта allowed_users: {e}")
+            return await update.message.reply_text("❗ Не удалось скачать файл.")
+        lines.extend(bytes(data).decode("utf-8", errors="replace").splitlines())
+    elif replied and replied.text:
+        lines.extend(replied.text.splitlines())
 
-    text = "👥 Разрешённые пользователи:\n" + "\n".join(f"• @{u}" for u in ids)
-    await update.message.reply_text(text)
\ No newline at end of file
+    if not lines:
+        return await update.message.reply_text(
+            "Использование: ответьте командой /import_allowed на сообщение с файлом или списком "
+            "username, либо перечислите их после команды."
+        )
+
+    usernames, invalid = _parse_usernames(lines)
+    try:
+        added = add_allowed_users(usernames)
+    except Exception as e:
+        logger.error(f"Не удалось импортировать allowed_users: {e}")
+        return await update.message.reply_text("❗ Ошибка при добавлении пользователей.")
+    await update.message.reply_text(
+        f"📥 Импорт: добавлено {added}, уже были {len(usernames) - added}" + _invalid_note(invalid)
+    )
+
+
+async def schedule_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /schedule_add <мин> <час> <день> <месяц> <день недели> [сервер:]<job_id> [параметр=значение ...]
+    Создаёт регулярный запуск Job-а; результаты приходят в чат, где выполнена команда.
+    Параметры, не указанные явно, берутся по умолчанию из TestOps.
+    Без «сервер:» Job берётся с основного сервера TestOps.
+    Доступна только пользователям из OWNER_USERNAMES.
+    """
+    from_user = update.effective_user.username
+    if from_user not in OWNER_USERNAMES:
+        return
+
+    usage = (
+        "Использование: /schedule_add <мин> <час> <день> <месяц> <день недели> [сервер:]<job_id> "
+        "[параметр=значение ...]\nНапример: /schedule_add 0 3 * * 1-5 1234 env=stage"
+    )
+    args = context.args or []
+    if len(args) < 6:
+        return await update.message.reply_text(usage)
+    try:
+        instance, job_id = parse_ref(args[5])
+    except ValueError:
+        return await update.message.reply_text(usage)
+    if instance not in toc.instance_names():
+        return await update.message.reply_text(f"❗ Сервер TestOps «{instance}» не настроен.")
+    cron = " ".join(args[:5])
+    try:
+        build_trigger(cron)
+    except ValueError as e:
+        return await update.message.reply_text(f"❗ Некорректное cron-выражение: {e}")
+
+    overrides = {}
+    for item in args[6:]:
+        name, sep, value = item.partition("=")
+        if not sep or not name:
+            return await update.message.reply_text(usage)
+        overrides[name] = value
+
+    try:
+        details = await toc.get_client(instance).get_job_details(job_id)
+    except toc.TestOpsError as e:
+        logger.error(f"schedule_add: не удалось получить Job {job_id}: {e}")
+        return await update.message.reply_text(f"❗ Не удалось получить Job {job_id} из TestOps.")
+
+    params_meta = details.get("parameters") or []
+    unknown = set(overrides) - {p.get("name") for p in params_meta}
+    if unknown:
+        return await update.message.reply_text(
+            f"❗ У Job-а нет параметров: {', '.join(sorted(unknown))}"
+        )
+    values = {p["name"]: overrides.get(p["name"], p.get("defaultValue", "")) for p in params_meta}
+    job_name = details.get("name", f"Job {job_id}")
+    schedule = {
+        "cron": cron,
+        "instance": instance,
+        "job_id": job_id,
+        "project_id": details.get("projectId"),
+        "job_name": job_name,
+        "launch_name": f"[cron] {job_name}",
+        "params_list": [{"id": p["id"], "value": values[p["name"]]} for p in params_meta],
+        "display_params": [[p["name"], values[p["name"]]] for p in params_meta],
+        "chat_id": update.effective_chat.id,
+        "created_by": from_user,
+        "created_at": time.time(),
+    }
+    try:
+        schedule["id"] = add_schedule(schedule)
+    except Exception:
+        return await update.message.reply_text("❗ Не удалось сохранить расписание.")
+
+    job = schedule_local(context.job_queue, schedule)
+    next_run = f"{job.next_t:%Y-%m-%d %H:%M:%S %Z}" if job and job.next_t else "—"
+    await update.message.reply_text(
+        f"🗓 Расписание <code>{schedule['id']}</code> создано: «{html.escape(job_name)}», "
+        f"<code>{cron}</code>\nБлижайший запуск: {next_run}",
+        parse_mode=ParseMode.HTML,
+    )
+
+
+async def schedule_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /schedule_list
+    Показывает все расписания запусков.
+    Доступна только пользователям из OWNER_USERNAMES.
+    """
+    from_user = update.effective_user.username
+    if from_user not in OWNER_USERNAMES:
+        return
+
+    try:
+        schedules = list_schedules()
+    except Exception:
+        return await update.message.reply_text("❗ Ошибка при чтении расписаний.")
+    if not schedules:
+        return await update.message.reply_text("Расписаний нет.")
+
+    lines = ["🗓 Расписания запусков:"]
+    for s in schedules:
+        last = f", последний прогон {s['last_launch_id']}" if s.get("last_launch_id") else ""
+        job_ref = format_ref(s.get("instance", DEFAULT_INSTANCE), s["job_id"])
+        lines.append(
+            f"• <code>{s['id']}</code> — <code>{s['cron']}</code> «{html.escape(s['job_name'])}» "
+            f"(Job {job_ref}) → чат {s['chat_id']}{last}"
+        )
+    await update.message.reply_text("\n".join(lines)[:4000], parse_mode=ParseMode.HTML)
+
+
+async def schedule_del(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /schedule_del <id>
+    Удаляет расписание запусков.
+    Доступна только пользователям из OWNER_USERNAMES.
+    """
+    from_user = update.effective_user.username
+    if from_user not in OWNER_USERNAMES:
+        return
+
+    if not context.args:
+        return await update.message.reply_text("Использование: /schedule_del <id>")
+    schedule_id = context.args[0]
+    try:
+        deleted = delete_schedule(schedule_id)
+    except Exception:
+        return await update.message.reply_text("❗ Ошибка при удалении расписания.")
+    if not deleted:
+        return await update.message.reply_text(f"❗ Расписание {schedule_id} не найдено.")
+    unschedule_local(schedule_id)
+    await update.message.reply_text(f"🗑 Расписание {schedule_id} удалено.")
+
+
+async def loop_monitor_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /loop_monitor [on|off|status|reset]
+    Включает/выключает монитор задержек event loop и показывает его статистику
+    вместе с последними медленными колбэками.
+    Доступна только пользователям из OWNER_USERNAMES.
+    """
+    from_user = update.effective_user.username
+    if from_user not in OWNER_USERNAMES:
+        return
+
+    action = context.args[0].lower() if context.args else "status"
+    if action == "on":
+        monitor.start()
+    elif action == "off":
+        await monitor.stop()
+    elif action == "reset":
+        monitor.reset()
+    elif action != "status":
+        return await update.message.reply_text("Использование: /loop_monitor [on|off|status|reset]")
+
+    st = monitor.status()
+    text = (
+        f"🩺 Монитор event loop: {'включён' if st['running'] else 'выключен'}\n"
+        f"• Замеров: {st['samples']}\n"
+        f"• Средний лаг: {st['avg_lag_ms']:.1f} мс, максимальный: {st['max_lag_ms']:.1f} мс\n"
+        f"• Медленных колбэков (≥ {st['threshold_ms']:.0f} мс): {st['slow_callbacks']}"
+    )
+    if monitor.stalls:
+        last = monitor.stalls[-1]
+        where = last["stack"].strip().splitlines()[-2:] if last["stack"] else ["стек не снят"]
+        text += f"\n\nПоследний: {last['lag_ms']} мс\n" + "\n".join(where)
+    await update.message.reply_text(text[:4000])
+
+
+async def rate_limits_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /rate_limits — лимиты частоты действий и запусков, счётчики отклонённых апдейтов
+    и пользователи, чаще всего упиравшиеся в лимит.
+    Доступна только пользователям из OWNER_USERNAMES.
+    """
+    from_user = update.effective_user.username
+    if from_user not in OWNER_USERNAMES:
+        return
+
+    st = rate_limit_status()
+    counters = st["stats"]
+    updates_limit = (
+        f"{RATE_LIMIT_UPDATES_PER_MIN:g}/мин, запас {RATE_LIMIT_UPDATES_BURST}"
+        if RATE_LIMIT_UPDATES_PER_MIN > 0 else "нет"
+    )
+    launches_limit = (
+        f"{RATE_LIMIT_LAUNCHES_PER_HOUR:g}/ч, запас {RATE_LIMIT_LAUNCHES_BURST}"
+        if RATE_LIMIT_LAUNCHES_PER_HOUR > 0 else "нет"
+    )
+    run_job_max = st["run_job_max"] or "∞"
+    text = (
+        f"🚦 Лимиты: действия — {updates_limit}; запуски — {launches_limit}\n"
+        f"• Запусков в TestOps сейчас: {st['run_job_active']} из {run_job_max}\n"
+        f"• Пропущено апдейтов: {counters.get('allowed', 0)}\n"
+        f"• Отклонено по частоте действий: {counters.get('limited_updates', 0)}\n"
+        f"• Отклонено по частоте запусков: {counters.get('limited_launches', 0)}\n"
+        f"• Отклонено из-за занятых слотов запуска: {counters.get('busy', 0)}"
+    )
+    if st["top_limited"]:
+        text += "\n\nЧаще всего упирались в лимит:\n" + "\n".join(
+            f"• {who}: {count}" for who, count in st["top_limited"]
+        )
+    await update.message.reply_text(text)
@@ -1,9 +1,12 @@
+import html
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import ContextTypes
 
-from keyboards import MAIN_REPLY_KB
-from db import get_user_projects, delete_project
+from keyboards import MAIN_REPLY_KB, build_projects_inline
+from db import find_project, get_project_job_stats, is_user_allowed
+from nav_cache import cached_keyboard, user_projects
+from utils import extract_project_ref, format_duration, percentile, project_label
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +32,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "➕ Добавить проект — добавить проект.\n"
         "📂 Список проектов — посмотреть ваши проекты.\n"
         "ℹ️ Помощь — показать этот текст.\n"
+        "/stats <ID проекта> — статистика Job’ов проекта.\n"
+        "Проект с другого сервера TestOps указывается как «сервер:ID» или ссылкой.\n"
         "\n"
         "Используйте кнопки главного меню ниже."
     )
@@ -44,7 +49,7 @@ async def list_projects(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user_id = update.effective_user.id
     
     try:
-        docs = get_user_projects(user_id)
+        version, docs = user_projects(user_id)
     except Exception as e:
         logger.error(f"MongoDB error (list_projects): {e}")
         if query:
@@ -68,21 +73,11 @@ async def list_projects(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     
     text = "📂 Ваши проекты (нажмите «❌ Удалить», чтобы убрать из списка):\n"
     for doc in docs:
-        text += f"• {doc['project_name']} (ID {doc['project_id']})\n"
+        text += f"• {doc['project_name']} ({project_label(doc['instance'], doc['project_id'])})\n"
     
-    keyboard = []
-    for doc in docs:
-        pid = doc["project_id"]
-        name = doc["project_name"]
-        keyboard.append([
-            InlineKeyboardButton(
-                f"❌ Удалить \"{name}\" (ID {pid})",
-                callback_data=f"delete_{pid}"
-            )
-        ])
-    
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
-    markup = InlineKeyboardMarkup(keyboard)
+    markup = cached_keyboard(
+        ("projects", user_id, version, "delete"), lambda: build_projects_inline(docs, "delete")
+    )
     
     if query:
         sent = await query.message.reply_text(text, reply_markup=markup)
@@ -90,3 +85,60 @@ async def list_projects(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         sent = await update.message.reply_text(text, reply_markup=markup)
     
     context.user_data["last_msg_id_with_buttons"] = sent.message_id
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обработчик команды /stats <project> — выводит сводную статистику по Job-ам проекта
+    (средняя и p95 длительность, доля успешных прогонов, серии падений).
+    Читает только заранее посчитанные сводки, поэтому работает за O(количество Job-ов).
+    """
+    username = update.effective_user.username
+    if not username or not is_user_allowed(username):
+        return await update.message.reply_text("❌ У вас нет прав для взаимодействия с ботом.")
+    
+    if not context.args:
+        return await update.message.reply_text("Использование: /stats <ID или ссылка на проект>")
+    
+    ref = extract_project_ref(context.args[0])
+    if ref is None:
+        return await update.message.reply_text("❗ Не удалось распознать ID проекта.")
+    instance, project_id = ref
+    
+    try:
+        proj_doc = find_project(update.effective_user.id, project_id, instance)
+        summaries = get_project_job_stats(project_id, instance) if proj_doc else []
+    except Exception as e:
+        logger.error(f"MongoDB error (stats): {e}")
+        return await update.message.reply_text(
+            "❗ Ошибка при запросе к БД.", reply_markup=MAIN_REPLY_KB
+        )
+    
+    if not proj_doc:
+        return await update.message.reply_text(
+            f"❗ Проект {project_label(instance, project_id)} не найден в вашем списке.",
+            reply_markup=MAIN_REPLY_KB,
+        )
+    if not summaries:
+        return await update.message.reply_text(
+            f"📊 По проекту «{proj_doc['project_name']}» ещё нет завершённых прогонов.",
+            reply_markup=MAIN_REPLY_KB,
+        )
+    
+    lines = [f"📊 Статистика Job’ов проекта «{proj_doc['project_name']}»:"]
+    for doc in summaries:
+        runs = doc.get("runs", 0)
+        if not runs:
+            continue
+        mean = doc.get("duration_sum", 0) / runs
+        p95 = percentile(doc.get("durations", []), 95) or mean
+        pass_rate = 100 * doc.get("passed_runs", 0) / runs
+        lines.append(
+            f"\n<b>{html.escape(str(doc.get('job_name', doc['job_id'])))}</b> (ID {doc['job_id']})\n"
+            f"• Прогонов: {runs}, успешных: {pass_rate:.0f}%\n"
+            f"• Длительность: средняя {format_duration(mean)}, p95 {format_duration(p95)}\n"
+            f"• Падений подряд: {doc.get('failure_streak', 0)} "
+            f"(макс. {doc.get('max_failure_streak', 0)})"
+        )
+    
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML", reply_markup=MAIN_REPLY_KB)
@@ -1,27 +1,194 @@
+import asyncio
 import logging
 import re
-from typing import Any, Dict, List
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple, Union
 
-from pymongo import errors as mongo_errors
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram import (
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    ReplyKeyboardRemove,
+    Update,
+)
 from telegram.constants import ChatAction
 from telegram.ext import ContextTypes
 
 import testops_client as toc
-from db import get_user_projects, find_project, add_project, is_user_allowed, delete_project
+from db import add_projects, delete_project, is_user_allowed
 from handlers_basic import help_command, list_projects
-from jobs import check_launch_result
+from jobs import watch_launch
+from launch_dedup import LaunchInProgress, launch_key, recent_launch, run_job_once
+from lifecycle import inflight
+from message_state import tracker
+from rate_limit import run_job_slot
+from nav_cache import (
+    cached_keyboard,
+    find_user_project,
+    invalidate_user_projects,
+    project_jobs,
+    user_projects,
+)
+from suggestions import store as suggestion_store
 from keyboards import (
     build_jobs_inline,
     build_params_inline,
+    build_projects_inline,
     MAIN_REPLY_KB,
     REPLY_MENU,
 )
-from testops_client import TESTOPS_URL
-from utils import extract_project_id, notify_error
+from testops_client import DEFAULT_INSTANCE
+from utils import extract_project_refs, format_ref, notify_error, parse_ref, project_label, respond
 
 logger = logging.getLogger(__name__)
 
+# Сколько проектов можно добавить одним сообщением
+PROJECT_IMPORT_LIMIT = 100
+
+
+def _params_step(
+        user_data: Dict,
+        params: List[Dict],
+        collected: Dict[str, Any],
+        project_id: int,
+        job_id: int,
+        instance: str,
+):
+    """
+    Текст и клавиатура для следующего параметра. Кроме значения по умолчанию
+    предлагаются частые значения из прошлых запусков; список вариантов сохраняется
+    в user_data["param_options"], а кнопки ссылаются на него по индексу.
+    """
+    next_param = next((p for p in params if p.get("name") not in collected), None)
+    options = None
+    if next_param is not None:
+        default = next_param.get("defaultValue", "")
+        recent = suggestion_store.top(job_id, next_param.get("name", ""), instance=instance)
+        options = [default] + [value for value in recent if value != default]
+        user_data["param_options"] = options
+    return build_params_inline(params, collected, format_ref(instance, project_id), job_id, options)
+
+
+ProjectKey = Tuple[str, int]
+
+
+def _import_report(
+        added: Dict[ProjectKey, str], duplicates: List[ProjectKey], failed: List[ProjectKey]
+) -> str:
+    """
+    Текст итога добавления проектов. Для одного проекта — короткое сообщение, как раньше.
+    """
+    if len(added) + len(duplicates) + len(failed) == 1:
+        if added:
+            return f"✅ Проект «{next(iter(added.values()))}» добавлен."
+        if duplicates:
+            return f"❗ Проект {project_label(*duplicates[0])} уже добавлен."
+        return f"❗ Ошибка при получении проекта ({project_label(*failed[0])})."
+    
+    lines = []
+    if added:
+        lines.append(f"✅ Добавлено проектов: {len(added)}")
+        lines.extend(f"• «{name}» ({project_label(*key)})" for key, name in added.items())
+    if duplicates:
+        lines.append(f"♻️ Уже были добавлены: {', '.join(format_ref(*key) for key in duplicates)}")
+    if failed:
+        lines.append(f"❗ Не удалось получить из TestOps: {', '.join(format_ref(*key) for key in failed)}")
+    return "\n".join(lines)
+
+
+async def _fetch_project_cards(refs: List[ProjectKey]) -> Dict[ProjectKey, Dict]:
+    """
+    Карточки проектов из TestOps: по пакетному запросу на сервер, серверы — одновременно.
+    Проекты, которые не удалось получить, в результат не попадают.
+    """
+    by_instance: Dict[str, List[int]] = defaultdict(list)
+    for instance, project_id in refs:
+        by_instance[instance].append(project_id)
+    instances = list(by_instance)
+    results = await asyncio.gather(
+        *(toc.get_client(instance).get_projects(by_instance[instance]) for instance in instances)
+    )
+    return {
+        (instance, project_id): card
+        for instance, cards in zip(instances, results)
+        for project_id, card in cards.items()
+    }
+
+
+def _duplicate_launch_text(run_id: int, instance: str) -> str:
+    run_link = toc.get_client(instance).launch_url(run_id)
+    return (
+        f"♻️ Этот запуск уже выполнен, новый не создавался.\n"
+        f"ID прогона: <b>{run_id}</b>\n"
+        f"🔗 <a href=\"{run_link}\">Перейти в Allure TestOps</a>\n\n"
+        "Результаты придут в сообщение о первом запуске."
+    )
+
+
+async def _clear_buttons(target: Union[Update, CallbackQuery], context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Снимает клавиатуру с сообщения прошлого шага. При нажатии кнопки её сообщение
+    сейчас будет отредактировано, поэтому его клавиатура отдельно не снимается.
+    """
+    editing = None if isinstance(target, Update) else target.message.message_id
+    await tracker.clear_last_buttons(context, target.message.chat_id, editing)
+
+
+async def show_projects(
+        target: Union[Update, CallbackQuery], context: ContextTypes.DEFAULT_TYPE, user_id: int
+) -> None:
+    """
+    «▶️ Запустить тест»: список проектов пользователя для выбора.
+    target — Update текстового сообщения (ответ новым сообщением) или CallbackQuery (правка).
+    Права пользователя проверяет вызывающий обработчик.
+    """
+    await _clear_buttons(target, context)
+    
+    try:
+        version, docs = user_projects(user_id)
+    except Exception as e:
+        logger.error(f"MongoDB error (run_test): {e}")
+        return await notify_error(
+            target, context, "Ошибка БД при получении проектов.", retry_data="run_test"
+        )
+    
+    markup = cached_keyboard(
+        ("projects", user_id, version, "select"), lambda: build_projects_inline(docs)
+    )
+    if not docs:
+        await respond(
+            target,
+            "📂 Список проектов пуст.\n"
+            "Нажмите «➕ Добавить проект», чтобы добавить проект.",
+            parse_mode="HTML",
+            reply_markup=markup,
+        )
+        return
+    
+    sent = await respond(target, "📂 Ваши проекты:", reply_markup=markup)
+    context.user_data["last_msg_id_with_buttons"] = sent.message_id
+
+
+async def start_adding_project(
+        target: Union[Update, CallbackQuery], context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """«➕ Добавить проект»: просит прислать ссылки или ID проектов."""
+    await _clear_buttons(target, context)
+    
+    cancel_markup = InlineKeyboardMarkup(
+        [[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]]
+    )
+    
+    await respond(
+        target,
+        "📂 Отправьте номер проекта в Allure TestOps:\n"
+        "(можно сразу несколько ссылок или ID — через пробел, запятую или с новой строки)",
+        parse_mode="HTML",
+        reply_markup=cancel_markup,
+    )
+    context.user_data.clear()
+    context.user_data["adding_project"] = True
+
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -49,24 +216,16 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 "▶️ Запустить тест — выбрать проект и Job для запуска.\n"
                 "➕ Добавить проект — сохранить ссылку на проект.\n"
                 "📂 Список проектов — посмотреть ваши проекты.\n"
-                "ℹ️ Помощь — показать этот текст.\n\n"
+                "ℹ️ Помощь — показать этот текст.\n"
+                "/stats <ID проекта> — статистика Job’ов проекта.\n\n"
                 "Используйте кнопки главного меню ниже."
             )
-            await query.edit_message_text(help_text, reply_markup=MAIN_REPLY_KB)
+            await tracker.edit(query, help_text, reply_markup=MAIN_REPLY_KB)
             return
         
         # 1) Вернуться в главное меню (Reply-клавиатура)
         if data == "back_to_main":
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None,
-                    )
-                except Exception:
-                    pass
+            await tracker.clear_last_buttons(context, query.message.chat_id)
             try:
                 await context.bot.delete_message(
                     chat_id=query.message.chat_id,
@@ -78,16 +237,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         # 2) Отмена всех операций — возвращаем «Главное меню»
         if data == "cancel":
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None,
-                    )
-                except Exception:
-                    pass
+            await tracker.clear_last_buttons(context, query.message.chat_id)
             context.user_data.clear()
             try:
                 await context.bot.delete_message(
@@ -100,19 +250,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         # 2.1) Удаление конкретного проекта
         if data.startswith("delete_"):
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None,
-                    )
-                except Exception:
-                    pass
+            await tracker.clear_last_buttons(context, query.message.chat_id, query.message.message_id)
             
             try:
-                project_id = int(data.split("_", 1)[1])
+                instance, project_id = parse_ref(data.split("_", 1)[1])
             except (IndexError, ValueError):
                 return await notify_error(
                     query, context, "Неверный ID проекта при удалении.", retry_data="list_projects"
@@ -120,23 +261,27 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             # Удаляем проект из БД
             try:
-                deleted = delete_project(user_id, project_id)
+                deleted = delete_project(user_id, project_id, instance)
+                invalidate_user_projects(user_id)
             except Exception as e:
                 logger.error(f"Ошибка при удалении проекта {project_id}: {e}")
-                return await query.edit_message_text(
+                return await tracker.edit(
+                    query,
                     "❗ Не удалось удалить проект из базы. Повторите позже.",
                     reply_markup=None
                 )
             
             if not deleted:
-                return await query.edit_message_text(
-                    f"❗ Проект ID {project_id} не найден в вашем списке.",
+                return await tracker.edit(
+                    query,
+                    f"❗ Проект {project_label(instance, project_id)} не найден в вашем списке.",
                     reply_markup=None
                 )
             
             # Проект успешно удалён: уведомляем и перечитываем список
-            await query.edit_message_text(
-                f"✅ Проект с ID {project_id} успешно удалён.\n"
+            await tracker.edit(
+                query,
+                f"✅ Проект {project_label(instance, project_id)} успешно удалён.\n"
                 f"Обновляю список..."
             )
             return await list_projects(update, context)
@@ -144,41 +289,69 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # 2.2) Подтверждение запуска
         if data == "launch_confirm":
             # Убираем inline-клавиатуру у сообщения с резюме
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None
-                    )
-                except Exception:
-                    pass
+            await tracker.clear_last_buttons(context, query.message.chat_id, query.message.message_id)
             
             # Достаем «черновик» запуска из user_data
             pending = context.user_data.pop("pending_launch", None)
             if not pending:
-                return await query.edit_message_text(
+                # Повторное нажатие «▶️ Запустить» после запуска — показываем уже созданный прогон
+                last_key = context.user_data.get("last_launch_key")
+                run_id = recent_launch(last_key) if last_key else None
+                if run_id is not None:
+                    last_instance = context.user_data.get("last_launch_instance", DEFAULT_INSTANCE)
+                    return await tracker.edit(
+                        query, _duplicate_launch_text(run_id, last_instance), parse_mode="HTML",
+                        disable_web_page_preview=True,
+                    )
+                return await tracker.edit(
+                    query,
                     "❗ Нет данных для запуска. Повторите процедуру.",
                     reply_markup=None
                 )
             
+            instance = pending.get("instance", DEFAULT_INSTANCE)
             job_id = pending["job_id"]
             launch_name = pending["launch_name"]
             params_list = pending["params_list"]
             display_params = pending.get("display_params", [])
             
-            loading = await query.edit_message_text("⌛ Запуск Job…")
+            loading = await tracker.edit(query, "⌛ Запуск Job…")
+            
+            async def start() -> int:
+                # При остановке бота запуск дожидается завершения
+                async with run_job_slot(), inflight("run_job"):
+                    return await toc.get_client(instance).run_job(job_id, launch_name, params_list)
             
-            # Запускаем Job через TestOps API
+            # Запускаем Job через TestOps API; тот же запуск, подтверждённый повторно, не дублируется
+            key = launch_key(user_id, job_id, params_list, launch_name, instance)
             try:
-                run_id = await toc.run_job(job_id, launch_name, params_list)
+                run_id, started = await run_job_once(key, start)
+            except LaunchInProgress:
+                return await tracker.edit(
+                    query, "⏳ Такой запуск уже выполняется. Результат придёт отдельным сообщением."
+                )
             except toc.TestOpsError as e:
-                logger.exception(f"Ошибка запуска Job: {e}")
-                return await query.edit_message_text(
+                logger.exception(
+                    f"Ошибка запуска Job: {e}",
+                    extra={"user_id": user_id, "instance": instance, "job_id": job_id},
+                )
+                return await tracker.edit(
+                    query,
                     "❗ Не удалось запустить Job. Попробуйте позже.",
                     reply_markup=MAIN_REPLY_KB
                 )
+            context.user_data.clear()
+            context.user_data["last_launch_key"] = key
+            context.user_data["last_launch_instance"] = instance
+            if not started:
+                return await tracker.edit(
+                    query, _duplicate_launch_text(run_id, instance), parse_mode="HTML",
+                    disable_web_page_preview=True,
+                )
+            
+            # Запоминаем значения параметров для подсказок в следующих запусках
+            for name, value in display_params:
+                suggestion_store.record(job_id, name, value, instance)
             
             # Формируем информацию о запущенном прогона (с именами параметров)
             if display_params:
@@ -186,7 +359,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             else:
                 params_lines = "нет параметров"
             
-            run_link = f"{TESTOPS_URL}/launch/{run_id}"
+            run_link = toc.get_client(instance).launch_url(run_id)
             started_text = (
                 f"✅ Запущено!\n"
                 f"📌 Имя запуска: <b>{launch_name}</b>\n"
@@ -197,25 +370,20 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             
             # Редактируем сообщение «⌛ Запуск…» в «✅ Запущено…»
-            await context.bot.edit_message_text(
-                text=started_text,
-                chat_id=loading.chat_id,
-                message_id=loading.message_id,
-                parse_mode="HTML",
-                disable_web_page_preview=True
+            await tracker.edit(
+                query, started_text, parse_mode="HTML", disable_web_page_preview=True
             )
             
             # Планируем проверку результата
-            context.job_queue.run_repeating(
-                check_launch_result,
-                interval=30,
-                first=30,
-                data={
-                    "chat_id": loading.chat_id,
-                    "loading_message_id": loading.message_id,
-                    "launch_id": run_id,
-                },
-                name=f"check_launch_{run_id}"
+            watch_launch(
+                context.job_queue,
+                chat_id=loading.chat_id,
+                loading_message_id=loading.message_id,
+                launch_id=run_id,
+                job_id=job_id,
+                project_id=pending["project_id"],
+                job_name=pending.get("job_name", f"Job {job_id}"),
+                instance=instance,
             )
             
             # Отправляем пользователю кнопку возврата к списку действий
@@ -223,23 +391,12 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 "Для показа списка действий нажмите кнопку ниже:",
                 reply_markup=REPLY_MENU
             )
-            
-            context.user_data.clear()
             return
         
         # 2.3) Отмена запуска
         if data == "launch_cancel":
             # Убираем inline-клавиатуру у сообщения с резюме
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None
-                    )
-                except Exception:
-                    pass
+            await tracker.clear_last_buttons(context, query.message.chat_id)
             
             # Удаляем «черновик» запуска, если он был
             context.user_data.pop("pending_launch", None)
@@ -251,186 +408,106 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         # 3) Запустить тест (вывод списка проектов)
         if data == "run_test":
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None
-                    )
-                except Exception:
-                    pass
-            
-            try:
-                docs = get_user_projects(user_id)
-            except Exception as e:
-                logger.error(f"MongoDB error (run_test): {e}")
-                return await notify_error(
-                    query, context, "Ошибка БД при получении проектов.", retry_data="run_test"
-                )
-            
-            if not docs:
-                text = (
-                    "📂 Список проектов пуст.\n"
-                    "Нажмите «➕ Добавить проект», чтобы добавить проект."
-                )
-                buttons = InlineKeyboardMarkup(
-                    [
-                        [InlineKeyboardButton("➕ Добавить проект", callback_data="add_project")],
-                        [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")],
-                        [InlineKeyboardButton("❌ Отмена", callback_data="cancel")],
-                    ]
-                )
-                return await query.edit_message_text(text, parse_mode="HTML", reply_markup=buttons)
-            
-            keyboard = []
-            for doc in docs:
-                pid = doc["project_id"]
-                name = doc["project_name"]
-                keyboard.append(
-                    [InlineKeyboardButton(f"{name} (ID {pid})", callback_data=f"project_{pid}")]
-                )
-            
-            keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
-            keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-            markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                "📂 Ваши проекты:", reply_markup=markup
-            )
-            context.user_data["last_msg_id_with_buttons"] = query.message.message_id
-            return
+            return await show_projects(query, context, user_id)
         
         # 4) Добавить проект
         if data == "add_project":
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None,
-                    )
-                except Exception:
-                    pass
-            
-            cancel_markup = InlineKeyboardMarkup(
-                [[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]]
-            )
-            
-            await query.edit_message_text(
-                "📂 Отправьте номер проекта в Allure TestOps:\n",
-                parse_mode="HTML",
-                reply_markup=cancel_markup,
-            )
-            context.user_data.clear()
-            context.user_data["adding_project"] = True
-            return
+            return await start_adding_project(query, context)
         
         # 5) Выбрать проект по ID
         if data.startswith("project_"):
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None,
-                    )
-                except Exception:
-                    pass
+            await tracker.clear_last_buttons(context, query.message.chat_id, query.message.message_id)
             
+            project_ref = data.split("_", 1)[1]
             try:
-                project_id = int(data.split("_", 1)[1])
-            except (IndexError, ValueError):
+                instance, project_id = parse_ref(project_ref)
+            except ValueError:
                 return await notify_error(
                     query, context, "Неверный ID проекта.", retry_data="run_test"
                 )
             
-            proj_doc = find_project(user_id, project_id)
+            proj_doc = find_user_project(user_id, project_id, instance)
             if not proj_doc:
                 return await notify_error(
                     query, context, "Проект не найден.", retry_data="run_test"
                 )
             project_name = proj_doc["project_name"]
             
-            await query.edit_message_text(
+            await tracker.edit(
+                query,
                 f"⌛ Загрузка Job’ов для проекта «{project_name}»…"
             )
             await context.bot.send_chat_action(
                 chat_id=update.effective_chat.id, action=ChatAction.TYPING
             )
             try:
-                jobs = await toc.get_jobs_list(project_id)
+                jobs_version, jobs = await project_jobs(project_id, instance)
             except toc.TestOpsError as e:
                 logger.error(f"Error getting jobs list: {e}")
                 return await notify_error(
                     query,
                     context,
                     "Ошибка API при получении Job’ов.",
-                    retry_data=f"project_{project_id}",
+                    retry_data=f"project_{project_ref}",
                 )
             
             if not jobs:
-                return await query.edit_message_text(
+                return await tracker.edit(
+                    query,
                     f"❗ У проекта «{project_name}» нет Job’ов.", reply_markup=None
                 )
             
+            context.user_data["current_instance"] = instance
             context.user_data["current_project_id"] = project_id
             context.user_data["current_project_name"] = project_name
             
-            await query.edit_message_text(
+            sent = await tracker.edit(
+                query,
                 f"📋 Job’ы проекта «{project_name}»:",
-                reply_markup=build_jobs_inline(jobs, project_id),
+                reply_markup=cached_keyboard(
+                    ("jobs", instance, project_id, jobs_version),
+                    lambda: build_jobs_inline(jobs, project_ref),
+                ),
             )
-            context.user_data["last_msg_id_with_buttons"] = query.message.message_id
+            context.user_data["last_msg_id_with_buttons"] = sent.message_id
             return
         
         # 6) Выбрать Job
         if data.startswith("job_"):
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None,
-                    )
-                except Exception:
-                    pass
+            await tracker.clear_last_buttons(context, query.message.chat_id, query.message.message_id)
             
             parts = data.split("_")
             if len(parts) != 3:
                 return await notify_error(
                     query, context, "Неверный формат callback.", retry_data="run_test"
                 )
-            _, job_id_str, project_id_str = parts
+            _, job_id_str, project_ref = parts
             try:
                 job_id = int(job_id_str)
-                project_id = int(project_id_str)
+                instance, project_id = parse_ref(project_ref)
             except ValueError:
                 return await notify_error(
                     query, context, "Неверный ID Job.", retry_data="run_test"
                 )
             
+            context.user_data["current_instance"] = instance
             context.user_data["current_job_id"] = job_id
             context.user_data["current_project_id"] = project_id
             context.user_data["collected_params"] = {}
             
-            await query.edit_message_text("⌛ Загрузка деталей Job…")
+            await tracker.edit(query, "⌛ Загрузка деталей Job…")
             await context.bot.send_chat_action(
                 chat_id=update.effective_chat.id, action=ChatAction.TYPING
             )
             try:
-                job_obj = await toc.get_job_details(job_id)
+                job_obj = await toc.get_client(instance).get_job_details(job_id)
             except toc.TestOpsError as e:
                 logger.error(f"Error getting job details: {e}")
                 return await notify_error(
                     query,
                     context,
                     "Ошибка API при получении деталей Job.",
-                    retry_data=f"job_{job_id}_{project_id}",
+                    retry_data=f"job_{job_id}_{project_ref}",
                 )
             
             params = job_obj.get("parameters", [])
@@ -438,68 +515,85 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 "name", f"Job {job_id}"
             )
             context.user_data["current_params"] = params
+            await suggestion_store.ensure_loaded(job_id, instance)
             
             # Если нет параметров – сразу просим имя запуска
             if not params:
                 context.user_data["awaiting_launch_name"] = True
                 context.user_data["awaiting_launch_job"] = job_id
                 context.user_data["awaiting_launch_project"] = project_id
-                return await query.edit_message_text(
+                return await tracker.edit(
+                    query,
                     "У этого Job нет параметров.\n\n❗ Отправьте имя запуска (до 100 символов):"
                 )
             
             # Иначе – спрашиваем первый параметр
-            header, markup = build_params_inline(params, {}, project_id, job_id)
-            sent = await query.edit_message_text(header, reply_markup=markup)
+            header, markup = _params_step(context.user_data, params, {}, project_id, job_id, instance)
+            sent = await tracker.edit(query, header, reply_markup=markup)
             context.user_data["last_msg_id_with_buttons"] = sent.message_id
             return
         
         # 7) Заполнение параметров (по кнопке)
         if data.startswith("param_"):
-            last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
-            if last_buttons:
-                try:
-                    await context.bot.edit_message_reply_markup(
-                        chat_id=query.message.chat_id,
-                        message_id=last_buttons,
-                        reply_markup=None,
-                    )
-                except Exception:
-                    pass
-            
-            parts = data.split("_", 4)
+            parts = data.split("_")
             if len(parts) != 5:
                 return await notify_error(
                     query, context, "Неверный формат параметра.", retry_data="run_test"
                 )
-            _, key, raw_value, job_id_str, project_id_str = parts
+            _, position_str, choice, job_id_str, project_ref = parts
             
             try:
+                position = int(position_str)
                 job_id = int(job_id_str)
-                project_id = int(project_id_str)
+                instance, project_id = parse_ref(project_ref)
             except ValueError:
                 return await notify_error(
                     query, context, "Неверный ID при параметре.", retry_data="run_test"
                 )
             
+            params: List[Dict] = context.user_data.get("current_params", [])
+            collected: Dict[str, Any] = context.user_data.setdefault(
+                "collected_params", {}
+            )
+            current_position = next(
+                (i for i, p in enumerate(params) if p.get("name") not in collected), None
+            )
+            # Кнопка относится не к текущему параметру текущего Job-а: повторное нажатие
+            # или старая клавиатура. Значение не записываем, чтобы не попасть в чужой параметр
+            if (
+                    position != current_position
+                    or job_id != context.user_data.get("current_job_id")
+                    or instance != context.user_data.get("current_instance")
+            ):
+                if query.message.message_id == context.user_data.get("last_msg_id_with_buttons"):
+                    return
+                return await tracker.edit(
+                    query,
+                    "⚠️ Эти кнопки устарели. Продолжите в последнем сообщении "
+                    "или начните заново: «▶️ Запустить тест»."
+                )
+            
+            await tracker.clear_last_buttons(context, query.message.chat_id, query.message.message_id)
+            current = params[current_position]
+            options: List[str] = context.user_data.pop("param_options", [])
+            valid_choice = choice == "INPUT" or (choice.isdigit() and int(choice) < len(options))
+            if not valid_choice:
+                return await notify_error(
+                    query, context, "Неверный формат параметра.", retry_data="run_test"
+                )
+            key = current.get("name")
+            
             # Если нужно вводить своё значение — переключаемся в text_message_handler
-            if raw_value == "INPUT":
+            if choice == "INPUT":
                 context.user_data["awaiting_param_key"] = key
                 context.user_data["awaiting_param_job"] = job_id
                 context.user_data["awaiting_param_project"] = project_id
-                return await query.edit_message_text(
+                return await tracker.edit(
+                    query,
                     f"❗ Введите значение для параметра «{key}»:"
                 )
             
-            params: List[Dict] = context.user_data.get("current_params", [])
-            collected: Dict[str, Any] = context.user_data.setdefault(
-                "collected_params", {}
-            )
-            
-            if raw_value == "SKIP":
-                pass
-            else:
-                collected[key] = raw_value
+            collected[key] = options[int(choice)]
             
             # Проверяем, остались ли ещё параметры
             next_param = None
@@ -512,19 +606,22 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 context.user_data["awaiting_launch_name"] = True
                 context.user_data["awaiting_launch_job"] = job_id
                 context.user_data["awaiting_launch_project"] = project_id
-                return await query.edit_message_text(
+                return await tracker.edit(
+                    query,
                     "Все параметры указаны.\n\n❗ Отправьте имя запуска (до 100 символов):"
                 )
             
-            header, markup = build_params_inline(params, collected, project_id, job_id)
-            sent = await query.edit_message_text(header, reply_markup=markup)
+            header, markup = _params_step(
+                context.user_data, params, collected, project_id, job_id, instance
+            )
+            sent = await tracker.edit(query, header, reply_markup=markup)
             context.user_data["last_msg_id_with_buttons"] = sent.message_id
             return
         
         return await notify_error(query, context, "Неизвестная команда.", retry_data="run_test")
     
     except Exception as exc:
-        logger.exception(f"Ошибка в button_handler: {exc}")
+        logger.exception(f"Ошибка в button_handler: {exc}", extra={"user_id": user_id})
         try:
             await notify_error(
                 update_or_query=query, context=context, message="Внутренняя ошибка.", retry_data="run_test"
@@ -536,7 +633,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Обрабатывает текстовые сообщения для:
-    - «▶️ Запустить тест» и «➕ Добавить проект» (имитирует CallbackQuery)
+    - «▶️ Запустить тест» и «➕ Добавить проект» (те же действия, что и у кнопок)
     - Добавление проекта (флаг adding_project)
     - Ввод собственного значения параметра (awaiting_param_key)
     - Ввод имени запуска (awaiting_launch_name)
@@ -560,51 +657,11 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # 0) «▶️ Запустить тест»
         if normalized in ("▶️ запустить тест", "➤ запустить тест", "запустить тест"):
-            class FakeQuery:
-                def __init__(self, message, user):
-                    self.data = "run_test"
-                    self.message = message
-                    self.from_user = user
-                
-                async def answer(self, *args, **kwargs):
-                    return
-                
-                async def edit_message_text(self, *args, **kwargs):
-                    return await self.message.reply_text(*args, **kwargs)
-            
-            class FakeUpdate:
-                def __init__(self, fake_query, message):
-                    self.callback_query = fake_query
-                    self.effective_chat = message.chat
-                    self.effective_user = message.from_user
-            
-            fake_query = FakeQuery(update.message, update.effective_user)
-            fake_update = FakeUpdate(fake_query, update.message)
-            return await button_handler(fake_update, context)
+            return await show_projects(update, context, user_id)
         
         # 0.1) «➕ Добавить проект»
         if normalized in ("➕ добавить проект", "добавить проект"):
-            class FakeQuery:
-                def __init__(self, message, user):
-                    self.data = "add_project"
-                    self.message = message
-                    self.from_user = user
-                
-                async def answer(self, *args, **kwargs):
-                    return
-                
-                async def edit_message_text(self, *args, **kwargs):
-                    return await self.message.reply_text(*args, **kwargs)
-            
-            class FakeUpdate:
-                def __init__(self, fake_query, message):
-                    self.callback_query = fake_query
-                    self.effective_chat = message.chat
-                    self.effective_user = message.from_user
-            
-            fake_query = FakeQuery(update.message, update.effective_user)
-            fake_update = FakeUpdate(fake_query, update.message)
-            return await button_handler(fake_update, context)
+            return await start_adding_project(update, context)
         
         # 0.2) «📂 Список проектов»
         if normalized in ("📂 список проектов", "список проектов"):
@@ -614,46 +671,54 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         if normalized in ("ℹ️ помощь", "помощь", "/help"):
             return await help_command(update, context)
         
-        # 1) Добавление проекта (ожидание ссылки)
+        # 1) Добавление проектов (ожидание ссылки или списка ссылок/ID)
         if user_data.get("adding_project"):
-            pid = extract_project_id(text)
-            if pid is None:
+            refs = extract_project_refs(text)
+            if not refs:
                 return await update.message.reply_text(
                     "❗ Не удалось распознать ID.\nОтправьте ID существующего проекта в AllureTestOps",
                     parse_mode="HTML",
                     reply_markup=ReplyKeyboardRemove(),
                 )
-            existing = find_project(user_id, pid)
-            if existing:
-                user_data.pop("adding_project", None)
-                return await update.message.reply_text(
-                    f"❗ Проект ID {pid} уже добавлен.", reply_markup=MAIN_REPLY_KB
-                )
-            try:
-                project_name = await toc.get_project_name(pid)
-            except toc.TestOpsError as e:
-                logger.error(f"Не удалось получить проект {pid}: {e}")
-                user_data.pop("adding_project", None)
+            user_data.pop("adding_project", None)
+            if len(refs) > PROJECT_IMPORT_LIMIT:
                 return await update.message.reply_text(
-                    f"❗ Ошибка при получении проекта (ID {pid}).",
+                    f"❗ За один раз можно добавить не больше {PROJECT_IMPORT_LIMIT} проектов.",
                     reply_markup=MAIN_REPLY_KB,
                 )
+            
             try:
-                add_project(user_id, pid, project_name)
-            except mongo_errors.DuplicateKeyError:
-                user_data.pop("adding_project", None)
+                saved = {(p["instance"], p["project_id"]) for p in user_projects(user_id)[1]}
+            except Exception as e:
+                logger.error(f"Ошибка чтения из MongoDB: {e}")
                 return await update.message.reply_text(
-                    f"❗ Проект ID {pid} уже добавлен.", reply_markup=MAIN_REPLY_KB
-                )
+                    "❗ Не удалось прочитать ваши проекты из базы, попробуйте позже.", reply_markup=MAIN_REPLY_KB
+                )
+            duplicates = [ref for ref in refs if ref in saved]
+            to_fetch = [ref for ref in refs if ref not in saved]
+            
+            # Имена всех новых проектов запрашиваются одновременно
+            cards = await _fetch_project_cards(to_fetch) if to_fetch else {}
+            failed = [ref for ref in to_fetch if ref not in cards]
+            names: Dict[str, Dict[int, str]] = defaultdict(dict)
+            for (instance, pid), card in cards.items():
+                names[instance][pid] = card.get("name", f"Проект {pid}")
+            added: Dict[ProjectKey, str] = {}
+            try:
+                for instance, projects in names.items():
+                    added_ids, already = add_projects(user_id, projects, instance)
+                    added.update({(instance, pid): projects[pid] for pid in added_ids})
+                    duplicates += [(instance, pid) for pid in already]
             except Exception as e:
                 logger.error(f"Ошибка записи в MongoDB: {e}")
-                user_data.pop("adding_project", None)
                 return await update.message.reply_text(
                     "❗ Не удалось сохранить проект в базу.", reply_markup=MAIN_REPLY_KB
                 )
-            user_data.pop("adding_project", None)
+            finally:
+                invalidate_user_projects(user_id)
             return await update.message.reply_text(
-                f"✅ Проект «{project_name}» добавлен.", reply_markup=MAIN_REPLY_KB
+                _import_report(added, duplicates, failed),
+                reply_markup=MAIN_REPLY_KB,
             )
         
         # 2) Ввод собственного значения параметра
@@ -683,9 +748,8 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
                     reply_markup=ReplyKeyboardRemove(),
                 )
             
-            header, markup = build_params_inline(
-                params, collected, project_id, job_id
-            )
+            instance = user_data.get("current_instance", DEFAULT_INSTANCE)
+            header, markup = _params_step(user_data, params, collected, project_id, job_id, instance)
             sent = await update.message.reply_text(header, reply_markup=markup)
             user_data["last_msg_id_with_buttons"] = sent.message_id
             return
@@ -727,8 +791,10 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
             
             # Сохраняем «черновик» запуска в user_data, включая display_params
             user_data["pending_launch"] = {
+                "instance": user_data.get("current_instance", DEFAULT_INSTANCE),
                 "job_id": job_id,
                 "project_id": project_id,
+                "job_name": user_data.get("current_job_name", f"Job {job_id}"),
                 "launch_name": launch_name,
                 "params_list": params_list,
                 "display_params": display_params,
@@ -783,5 +849,5 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         )
     
     except Exception as exc:
-        logger.exception(f"Ошибка в text_message_handler: {exc}")
+        logger.exception(f"Ошибка в text_message_handler: {exc}", extra={"user_id": user_id})
         return await notify_error(update, context, "Внутренняя ошибка.", retry_data="run_test")
@@ -1,112 +1,456 @@
+import asyncio
 import logging
+import os
+import socket
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
 
 from telegram import ReplyKeyboardRemove
 from telegram.constants import ParseMode
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, JobQueue
 
 import testops_client as toc
 import time
+from testops_client import DEFAULT_INSTANCE
+from db import (
+    claim_expired_watches,
+    create_watch,
+    finish_watch,
+    get_saved_project_ids,
+    pop_requested_checks,
+    record_job_run,
+    release_watches,
+    renew_watch_leases,
+    update_projects_metadata,
+)
 from keyboards import REPLY_MENU
+from launch_stats import LaunchStats
+from lifecycle import inflight
+from nav_cache import invalidate_all_user_projects
 
 logger = logging.getLogger(__name__)
 
+# Интервал опроса статуса прогона (в секундах)
+LAUNCH_CHECK_INTERVAL = int(os.getenv("LAUNCH_CHECK_INTERVAL", "30"))
 
-async def check_launch_result(context: ContextTypes.DEFAULT_TYPE) -> None:
+# Если включён приём событий о закрытии прогонов (webhook_server), опрос нужен
+# только как страховка и идёт с этим (редким) интервалом
+LAUNCH_WEBHOOK_ENABLED = bool(os.getenv("LAUNCH_WEBHOOK_PORT"))
+LAUNCH_FALLBACK_INTERVAL = int(os.getenv("LAUNCH_FALLBACK_INTERVAL", "300"))
+
+# --------------------- Распределение ожиданий между воркерами ---------------------
+# Ожидания хранятся в MongoDB; каждый воркер арендует (lease) часть из них на
+# WATCH_LEASE_TTL секунд и продлевает аренду каждые WATCH_CLAIM_INTERVAL секунд.
+# Если воркер умер, аренда истекает и ожидания забирают остальные.
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+WATCH_LEASE_TTL = int(os.getenv("WATCH_LEASE_TTL", "90"))
+WATCH_CLAIM_INTERVAL = int(os.getenv("WATCH_CLAIM_INTERVAL", "30"))
+# Сколько ожиданий воркер держит максимум (0 — без ограничения)
+WATCH_MAX_PER_WORKER = int(os.getenv("WATCH_MAX_PER_WORKER", "0"))
+# Сколько ожиданий забирается за один вызов MongoDB в отдельном потоке
+WATCH_CLAIM_BATCH = 100
+
+# Сколько максимум ждать закрытия прогона (в секундах)
+LAUNCH_MAX_WAIT = 12 * 3600  # 12 часов
+
+# Как часто обновлять имена и метаданные сохранённых проектов (в секундах, 0 — не обновлять)
+PROJECT_SYNC_INTERVAL = int(os.getenv("PROJECT_SYNC_INTERVAL", "3600"))
+# Поля карточки проекта TestOps, которые сохраняются в project_meta
+PROJECT_META_FIELDS = ("abbr", "description", "isPublic")
+
+# Ключ ожидания: (сервер TestOps, launch_id) — ID прогонов уникальны только в пределах сервера
+WatchKey = Tuple[str, int]
+
+# Ожидания, которые опрашивает этот воркер: (сервер, launch_id) -> данные задачи
+ACTIVE_WATCHES: Dict[WatchKey, Dict] = {}
+# Прогоны, по которым пришло событие о закрытии и ждут внеочередной проверки
+_TRIGGERED: Set[WatchKey] = set()
+_trigger_scheduled = False
+_job_queue: Optional[JobQueue] = None
+
+# Поля данных задачи, которые хранятся в MongoDB
+WATCH_FIELDS = (
+    "chat_id", "loading_message_id", "instance", "launch_id", "job_id", "project_id", "job_name",
+    "start_ts",
+)
+
+
+def _launch_duration_sec(launch_info: dict, start_ts: float) -> float:
+    """
+    Длительность прогона в секундах: по датам TestOps (createdDate/closedDate, мс),
+    а если их нет — по времени, прошедшему с момента постановки на ожидание.
+    """
+    created = launch_info.get("createdDate")
+    closed = launch_info.get("closedDate") or launch_info.get("lastModifiedDate")
+    if isinstance(created, (int, float)) and isinstance(closed, (int, float)) and closed >= created:
+        return (closed - created) / 1000
+    return max(time.time() - start_ts, 0.0)
+
+
+def _poll_interval() -> float:
+    return LAUNCH_FALLBACK_INTERVAL if LAUNCH_WEBHOOK_ENABLED else LAUNCH_CHECK_INTERVAL
+
+
+def _watch_key(data: Dict) -> WatchKey:
+    return data.get("instance", DEFAULT_INSTANCE), data["launch_id"]
+
+
+def _log_extra(data: Dict) -> Dict:
+    return {"instance": data.get("instance"), "launch_id": data["launch_id"], "chat_id": data["chat_id"]}
+
+
+def _take_ownership(data: Dict, log_extra: Dict) -> bool:
+    """
+    Снимает ожидание из MongoDB. Уведомлять должен только тот воркер, которому это удалось;
+    если MongoDB недоступна, уведомляем сами (лучше дубль, чем потерянный результат).
+    """
+    instance, launch_id = _watch_key(data)
+    try:
+        if finish_watch(launch_id, WORKER_ID, instance):
+            return True
+    except Exception as e:
+        logger.warning(f"poll_launches: не удалось снять ожидание {launch_id}: {e}", extra=log_extra)
+        return True
+    logger.info(f"poll_launches: ожидание {launch_id} обработано другим воркером", extra=log_extra)
+    return False
+
+
+async def _expire_launch(bot, data: Dict) -> None:
+    """Снимает ожидание, превысившее LAUNCH_MAX_WAIT, и сообщает об этом пользователю."""
+    launch_id = data["launch_id"]
+    log_extra = _log_extra(data)
+    if ACTIVE_WATCHES.pop(_watch_key(data), None) is None:
+        return
+    elapsed = time.time() - data["start_ts"]
+    logger.warning(
+        f"poll_launches: превышено время ожидания для launch {launch_id} ({elapsed / 3600:.1f} ч), удаляю задачу.",
+        extra=log_extra,
+    )
+    if not _take_ownership(data, log_extra):
+        return
+    await bot.send_message(
+        chat_id=data["chat_id"],
+        text="⚠️ Тайм-аут ожидания завершения прогона. Проверьте вручную в Allure TestOps.",
+        reply_markup=REPLY_MENU,
+    )
+
+
+async def _complete_launch(
+        bot, client: toc.TestOpsClient, data: Dict, launch_info: Dict, stats: List[Dict]
+) -> None:
     """
-    Периодически (каждые 30 секунд) проверяет, завершился ли прогон (launch) и, если да,
-    отправляет итоговую статистику и кнопку «Меню», после чего удаляет задачу из очереди.
+    Прогон закрыт: обновляет сводную статистику Job-а и отправляет итоговое сообщение
+    со статистикой и кнопку «Меню».
     """
-    job_data = context.job.data
-    attempt = job_data.get("attempt", 1)
-    chat_id = job_data["chat_id"]
-    loading_message_id = job_data["loading_message_id"]
-    launch_id = job_data["launch_id"]
+    launch_id = data["launch_id"]
+    chat_id = data["chat_id"]
+    log_extra = _log_extra(data)
+    # Прогон мог уже обработать параллельный проход (по событию о закрытии)
+    if ACTIVE_WATCHES.pop(_watch_key(data), None) is None:
+        return
+    if not _take_ownership(data, log_extra):
+        return
+    
+    launch_stats = LaunchStats.from_statistic(stats)
+    
+    # Обновляем сводную статистику Job-а (если известно, какой Job запускали)
+    job_id = data.get("job_id")
+    project_id = data.get("project_id")
+    if job_id is not None and project_id is not None and stats:
+        try:
+            record_job_run(
+                project_id,
+                job_id,
+                data.get("job_name", f"Job {job_id}"),
+                _launch_duration_sec(launch_info, data["start_ts"]),
+                launch_stats,
+                client.name,
+            )
+        except Exception as e:
+            logger.error(
+                f"poll_launches: не удалось обновить статистику Job {job_id}: {e}", extra=log_extra
+            )
     
-    # Установка времени начала (если ещё не было)
-    start_ts = job_data.get("start_ts")
-    if start_ts is None:
-        start_ts = time.time()
-        context.job.data["start_ts"] = start_ts
+    stats_text = launch_stats.to_html()
     
-    # Лимит времени ожидания (в секундах)
-    max_duration_sec = 12 * 3600  # 12 часов
+    run_link = client.launch_url(launch_id)
+    final_text = (
+        f"✅ Прогон <b>ID {launch_id}</b> завершён.\n"
+        f"📊 Статистика выполнения:\n{stats_text}\n\n"
+        f"🔗 <a href=\"{run_link}\">Перейти в Allure TestOps</a>"
+    )
     
-    elapsed = time.time() - start_ts
-    if elapsed > max_duration_sec:
-        logger.warning(
-            f"check_launch_result: превышено время ожидания для launch {launch_id} ({elapsed / 3600:.1f} ч), удаляю задачу.")
-        context.job.schedule_removal()
-        await context.bot.send_message(
+    async with inflight("notify"):
+        # Отправляем итоговое сообщение
+        try:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=final_text,
+                parse_mode=ParseMode.HTML,
+                disable_web_page_preview=True,
+                reply_to_message_id=data["loading_message_id"],
+                reply_markup=ReplyKeyboardRemove(),
+            )
+        except Exception as e:
+            logger.error(
+                f"poll_launches: не удалось отправить сообщение о завершении: {e}", extra=log_extra
+            )
+        
+        # Предлагаем «Меню»
+        await bot.send_message(
             chat_id=chat_id,
-            text="⚠️ Тайм-аут ожидания завершения прогона. Проверьте вручную в Allure TestOps.",
+            text="Для продолжения работы нажмите «Меню»:",
             reply_markup=REPLY_MENU,
         )
-        return
-    
-    # Получаем launch_info
+
+
+async def _poll_instance(bot, instance: str, launch_ids: List[int]) -> None:
+    """Пакетный запрос результатов прогонов одного сервера TestOps."""
     try:
-        launch_info = await toc.get_launch_info(launch_id)
+        client = toc.get_client(instance)
     except toc.TestOpsError as e:
-        logger.error(f"check_launch_result: ошибка API при получении {launch_id}: {e}")
+        logger.error(f"poll_launches: {e}, прогонов без проверки: {len(launch_ids)}")
         return
-    
-    # Если ещё не закрыт — ждём дальше
-    if not launch_info.get("closed", False):
+    results = await client.get_launches_results(launch_ids)
+    for launch_id, result in results.items():
+        data = ACTIVE_WATCHES.get((instance, launch_id))
+        if data is not None and result["statistic"] is not None:
+            await _complete_launch(bot, client, data, result["info"], result["statistic"])
+
+
+async def _poll_round(bot, keys: List[WatchKey]) -> None:
+    """
+    Один пакетный проход по ожиданиям: снимает просроченные, по каждому серверу TestOps
+    одним пакетом запрашивает информацию и статистику (get_launches_results) и завершает
+    закрытые. Серверы опрашиваются одновременно и не ждут друг друга.
+    """
+    now = time.time()
+    pending: Dict[str, List[int]] = defaultdict(list)
+    for key in keys:
+        data = ACTIVE_WATCHES.get(key)
+        if data is None:
+            continue
+        data.setdefault("start_ts", now)
+        if now - data["start_ts"] > LAUNCH_MAX_WAIT:
+            await _expire_launch(bot, data)
+        else:
+            instance, launch_id = key
+            pending[instance].append(launch_id)
+    if not pending:
         return
     
-    # Прогон закрыт — получаем статистику
+    await asyncio.gather(
+        *(_poll_instance(bot, instance, launch_ids) for instance, launch_ids in pending.items())
+    )
+
+
+async def poll_launches(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Периодически проверяет все ожидания этого воркера за один пакетный проход и по
+    закрытым прогонам отправляет итоговую статистику.
+    """
+    await _poll_round(context.bot, list(ACTIVE_WATCHES))
+
+
+async def poll_triggered_launches(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Внеочередной проход по прогонам, для которых пришло событие о закрытии.
+    События, пришедшие почти одновременно, проверяются одним пакетом.
+    """
+    global _trigger_scheduled
+    _trigger_scheduled = False
+    keys = list(_TRIGGERED)
+    _TRIGGERED.clear()
+    await _poll_round(context.bot, keys)
+
+
+def _ensure_poller(job_queue: JobQueue) -> None:
+    global _job_queue
+    _job_queue = job_queue
+    if not job_queue.get_jobs_by_name("poll_launches"):
+        job_queue.run_repeating(
+            poll_launches, interval=_poll_interval(), first=_poll_interval(), name="poll_launches"
+        )
+
+
+def trigger_launch_check(launch_id: int, instance: Optional[str] = None) -> bool:
+    """
+    Запускает проверку прогона немедленно, не дожидаясь очередного опроса
+    (используется при получении события о закрытии прогона).
+    instance=None — прогон с таким ID на любом из серверов TestOps.
+    Поиск — O(число серверов). Возвращает False, если прогон опрашивает не этот воркер.
+    """
+    global _trigger_scheduled
+    if _job_queue is None:
+        return False
+    instances = [instance] if instance is not None else toc.instance_names()
+    keys = [(name, launch_id) for name in instances if (name, launch_id) in ACTIVE_WATCHES]
+    if not keys:
+        return False
+    _TRIGGERED.update(keys)
+    if not _trigger_scheduled:
+        _trigger_scheduled = True
+        _job_queue.run_once(poll_triggered_launches, 0, name="poll_triggered_launches")
+    return True
+
+
+def watch_launch(
+    job_queue: JobQueue,
+    chat_id: int,
+    loading_message_id: int,
+    launch_id: int,
+    job_id: int,
+    project_id: int,
+    job_name: str,
+    instance: str = DEFAULT_INSTANCE,
+) -> None:
+    """
+    Ставит прогон на ожидание: регистрирует его в MongoDB с арендой на этот воркер.
+    instance — сервер TestOps, на котором запущен прогон.
+    Каждые LAUNCH_CHECK_INTERVAL секунд (LAUNCH_FALLBACK_INTERVAL, если включены события
+    о закрытии) poll_launches одним пакетом проверяет все ожидания воркера.
+    """
+    data = {
+        "chat_id": chat_id,
+        "loading_message_id": loading_message_id,
+        "instance": instance,
+        "launch_id": launch_id,
+        "job_id": job_id,
+        "project_id": project_id,
+        "job_name": job_name,
+        "start_ts": time.time(),
+    }
     try:
-        stats = await toc.get_launch_statistic(launch_id)
-    except toc.TestOpsError as e:
-        logger.error(f"check_launch_result: не удалось получить статистику для {launch_id}: {e}")
-        stats = []
+        create_watch(data, WORKER_ID, time.time() + WATCH_LEASE_TTL)
+    except Exception as e:
+        logger.error(f"watch_launch: не удалось сохранить ожидание {launch_id} ({instance}): {e}")
+    ACTIVE_WATCHES[(instance, launch_id)] = data
+    _ensure_poller(job_queue)
+
+
+async def claim_watches(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Периодическая задача координации: продлевает аренду своих ожиданий,
+    бросает те, что перешли к другому воркеру, и забирает ожидания с истёкшей арендой.
+    """
+    now = time.time()
+    lease_until = now + WATCH_LEASE_TTL
     
-    passed_count = sum(
-        item["count"] for item in stats if item.get("status", "").upper() == "PASSED"
-    )
-    failed_count = sum(
-        item["count"] for item in stats if item.get("status", "").upper() == "FAILED"
-    )
-    skipped_count = sum(
-        item["count"]
-        for item in stats
-        if item.get("status", "").upper() not in ("PASSED", "FAILED")
-    )
-    total_count = passed_count + failed_count + skipped_count
+    try:
+        owned = set(
+            await asyncio.to_thread(renew_watch_leases, WORKER_ID, list(ACTIVE_WATCHES), lease_until)
+        )
+    except Exception as e:
+        logger.error(f"claim_watches: не удалось продлить аренду ожиданий: {e}")
+        return
+    for key in [key for key in ACTIVE_WATCHES if key not in owned]:
+        logger.info(f"claim_watches: ожидание {key} больше не принадлежит {WORKER_ID}")
+        ACTIVE_WATCHES.pop(key, None)
     
-    stats_text = (
-        f"🎯 Всего тестов: <b>{total_count}</b>\n"
-        f"🟢 Passed: <b>{passed_count}</b>\n"
-        f"🔴 Failed: <b>{failed_count}</b>\n"
-        f"⚪ Skipped: <b>{skipped_count}</b>"
-    )
+    # События о закрытии, принятые другими воркерами для наших ожиданий
+    try:
+        for instance, launch_id in await asyncio.to_thread(pop_requested_checks, WORKER_ID):
+            trigger_launch_check(launch_id, instance)
+    except Exception as e:
+        logger.error(f"claim_watches: не удалось получить запрошенные проверки: {e}")
     
-    run_link = f"{toc.TESTOPS_URL}/launch/{launch_id}"
-    final_text = (
-        f"✅ Прогон <b>ID {launch_id}</b> завершён.\n"
-        f"📊 Статистика выполнения:\n{stats_text}\n\n"
-        f"🔗 <a href=\"{run_link}\">Перейти в Allure TestOps</a>"
+    # Свободные ожидания забираются пачками по WATCH_CLAIM_BATCH, каждая — в отдельном потоке
+    claimed = 0
+    while True:
+        limit = WATCH_CLAIM_BATCH
+        if WATCH_MAX_PER_WORKER:
+            limit = min(limit, WATCH_MAX_PER_WORKER - len(ACTIVE_WATCHES))
+            if limit <= 0:
+                break
+        try:
+            docs = await asyncio.to_thread(claim_expired_watches, WORKER_ID, now, lease_until, limit)
+        except Exception as e:
+            logger.error(f"claim_watches: не удалось забрать ожидания: {e}")
+            break
+        for doc in docs:
+            key = _watch_key(doc)
+            if key not in ACTIVE_WATCHES:
+                # Первую проверку делаем сразу: прогон мог закрыться, пока ожидание было без хозяина
+                ACTIVE_WATCHES[key] = {"instance": key[0], **{k: doc[k] for k in WATCH_FIELDS if k in doc}}
+                trigger_launch_check(doc["launch_id"], key[0])
+        claimed += len(docs)
+        if len(docs) < limit:
+            break
+    if claimed:
+        logger.info(f"claim_watches: {WORKER_ID} забрал ожиданий: {claimed}")
+
+
+def start_watch_coordinator(job_queue: JobQueue) -> None:
+    """
+    Запускает координацию ожиданий (вызывается при старте бота).
+    Первый проход сразу подхватывает ожидания, отпущенные при прошлой остановке.
+    """
+    _ensure_poller(job_queue)
+    job_queue.run_repeating(
+        claim_watches, interval=WATCH_CLAIM_INTERVAL, first=0, name="claim_watches"
     )
-    
-    # Отправляем итоговое сообщение
+
+
+def release_own_watches() -> int:
+    """
+    Отпускает аренду всех ожиданий этого воркера (вызывается при остановке бота),
+    чтобы их сразу подхватил другой воркер или этот же после перезапуска.
+    """
+    ACTIVE_WATCHES.clear()
+    _TRIGGERED.clear()
+    return release_watches(WORKER_ID)
+
+
+async def _sync_instance_projects(instance: str, project_ids: List[int]) -> None:
     try:
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=final_text,
-            parse_mode=ParseMode.HTML,
-            disable_web_page_preview=True,
-            reply_to_message_id=loading_message_id,
-            reply_markup=ReplyKeyboardRemove(),
-        )
+        client = toc.get_client(instance)
+    except toc.TestOpsError as e:
+        logger.warning(f"sync_projects: {e}, проектов без обновления: {len(project_ids)}")
+        return
+    cards = await client.get_projects(project_ids)
+    updates = {
+        project_id: {
+            "project_name": card.get("name", f"Проект {project_id}"),
+            "project_meta": {k: card[k] for k in PROJECT_META_FIELDS if k in card},
+        }
+        for project_id, card in cards.items()
+    }
+    try:
+        changed = await asyncio.to_thread(update_projects_metadata, updates, instance)
     except Exception as e:
-        logger.error(f"check_launch_result: не удалось отправить сообщение о завершении: {e}")
-    
-    # Предлагаем «Меню»
-    await context.bot.send_message(
-        chat_id=chat_id,
-        text="Для продолжения работы нажмите «Меню»:",
-        reply_markup=REPLY_MENU,
+        logger.error(f"sync_projects[{instance}]: не удалось сохранить метаданные проектов: {e}")
+        return
+    if changed:
+        # Списки проектов и клавиатуры хранят старые названия — сбрасываем их
+        invalidate_all_user_projects()
+    logger.info(
+        f"sync_projects[{instance}]: проверено проектов {len(cards)} из {len(project_ids)}, "
+        f"обновлено записей: {changed}"
+    )
+
+
+async def sync_projects(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обновляет имена и метаданные всех сохранённых проектов: каждый проект запрашивается
+    в TestOps один раз, сколько бы пользователей его ни сохранили, а изменения
+    записываются одним bulk_write на сервер. Серверы TestOps обновляются одновременно.
+    """
+    try:
+        saved = await asyncio.to_thread(get_saved_project_ids)
+    except Exception as e:
+        logger.error(f"sync_projects: не удалось прочитать сохранённые проекты: {e}")
+        return
+    await asyncio.gather(
+        *(_sync_instance_projects(instance, ids) for instance, ids in saved.items() if ids)
+    )
+
+
+def start_project_sync(job_queue: JobQueue) -> None:
+    """
+    Запускает периодическое обновление имён проектов (вызывается при старте бота).
+    """
+    if PROJECT_SYNC_INTERVAL <= 0:
+        return
+    job_queue.run_repeating(
+        sync_projects, interval=PROJECT_SYNC_INTERVAL, first=60, name="sync_projects"
     )
-    
-    # Удаляем задачу из очереди
-    context.job.schedule_removal()
@@ -0,0 +1,117 @@
+import codecs
+import json
+from typing import Any, List, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+def loads(data: bytes) -> Any:
+    """Разбирает JSON из байтов (через orjson, если он установлен)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> str:
+    """Сериализует JSON в строку (через orjson, если он установлен)."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def project(item: Any, fields: Optional[Sequence[str]]) -> Any:
+    """Оставляет у словаря только поля fields (остальные значения не трогает)."""
+    if fields is None or not isinstance(item, dict):
+        return item
+    return {key: item[key] for key in fields if key in item}
+
+
+class JsonListStream:
+    """
+    Разбирает JSON по мере поступления данных. Если верхний уровень — массив,
+    элементы декодируются по одному, как только пришли целиком, и сразу урезаются
+    до fields: в памяти не держится ни всё тело, ни лишние поля элементов.
+    Любой другой JSON (например, страница {"content": [...]}) копится и разбирается целиком.
+    """
+
+    def __init__(self, fields: Optional[Sequence[str]] = None) -> None:
+        self.fields = fields
+        self.items: List[Any] = []
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._raw: Optional[bytearray] = None
+        self._streaming: Optional[bool] = None
+        self._opened = False
+        self._done = False
+
+    def feed(self, chunk: bytes) -> None:
+        if self._streaming is None:
+            head = chunk.lstrip()
+            if not head:
+                return
+            self._streaming = head[:1] == b"["
+            if not self._streaming:
+                self._raw = bytearray()
+        if not self._streaming:
+            self._raw += chunk
+            return
+        self._buf += self._text.decode(chunk)
+        self._parse()
+
+    def _skip(self, pos: int) -> int:
+        buf, n = self._buf, len(self._buf)
+        while pos < n and buf[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def _parse(self) -> None:
+        buf, n = self._buf, len(self._buf)
+        pos = self._skip(0)
+        if not self._opened and pos < n:
+            # feed() уже проверил, что первый значащий символ — «[»
+            self._opened = True
+            pos += 1
+        while not self._done:
+            pos = self._skip(pos)
+            if pos >= n:
+                break
+            if buf[pos] == "]":
+                self._done = True
+                pos += 1
+                break
+            try:
+                item, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Элемент пришёл не целиком — ждём следующий кусок
+                break
+            # Число на границе куска могло оборваться («-0.» разбирается как -0):
+            # элемент принимается, только когда за ним уже виден разделитель
+            after = self._skip(end)
+            if after >= n:
+                break
+            if buf[after] not in ",]":
+                if _NUMBER_CHARS.issuperset(buf[end:]):
+                    break
+                raise ValueError(f"некорректный JSON-массив около позиции {after}")
+            self.items.append(project(item, self.fields))
+            pos = after + 1 if buf[after] == "," else after
+        self._buf = buf[pos:]
+
+    def result(self) -> Any:
+        """Разобранный JSON после того, как переданы все данные."""
+        if self._streaming is None:
+            raise ValueError("пустой ответ")
+        if not self._streaming:
+            return loads(bytes(self._raw))
+        self._buf += self._text.decode(b"", final=True)
+        self._parse()
+        if not self._done:
+            raise ValueError("JSON-массив оборван")
+        return self.items
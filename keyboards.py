@@ -2,6 +2,8 @@ from typing import Any, Dict, List, Optional, Tuple
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 
+from utils import format_ref, project_label
+
 # --------------------- Константы Reply-клавиатур ---------------------
 MAIN_REPLY_KB = ReplyKeyboardMarkup(
     [
@@ -22,18 +24,28 @@ REPLY_MENU = ReplyKeyboardMarkup(
 
 
 # --------------------- Построение Inline-клавиатур ---------------------
-def build_projects_inline(projects: List[Dict]) -> InlineKeyboardMarkup:
+def build_projects_inline(projects: List[Dict], mode: str = "select") -> InlineKeyboardMarkup:
+    """
+    Клавиатура списка проектов — общая для «▶️ Запустить тест» и «📂 Список проектов».
+    mode="select": кнопки выбора проекта, «➕ Добавить проект», «Назад», «Отмена»;
+    mode="delete": кнопки «❌ Удалить» для каждого проекта и «Назад».
+    В callback_data проект передаётся ссылкой format_ref (с сервером TestOps).
+    """
     keyboard: List[List[InlineKeyboardButton]] = []
     for doc in projects:
-        pid = doc["project_id"]
+        ref = format_ref(doc["instance"], doc["project_id"])
+        label = project_label(doc["instance"], doc["project_id"])
         name = doc["project_name"]
-        keyboard.append(
-            [
-                InlineKeyboardButton(
-                    f"{name} (ID {pid})", callback_data=f"project_{pid}"
-                )
-            ]
-        )
+        if mode == "delete":
+            button = InlineKeyboardButton(
+                f"❌ Удалить \"{name}\" ({label})", callback_data=f"delete_{ref}"
+            )
+        else:
+            button = InlineKeyboardButton(f"{name} ({label})", callback_data=f"project_{ref}")
+        keyboard.append([button])
+    if mode == "delete":
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
+        return InlineKeyboardMarkup(keyboard)
     keyboard.append(
         [InlineKeyboardButton("➕ Добавить проект", callback_data="add_project")]
     )
@@ -42,7 +54,7 @@ def build_projects_inline(projects: List[Dict]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(keyboard)
 
 
-def build_jobs_inline(jobs: List[Dict], project_id: int) -> InlineKeyboardMarkup:
+def build_jobs_inline(jobs: List[Dict], project_ref: str) -> InlineKeyboardMarkup:
     keyboard: List[List[InlineKeyboardButton]] = []
     for job in jobs:
         jid = job.get("id")
@@ -50,7 +62,7 @@ def build_jobs_inline(jobs: List[Dict], project_id: int) -> InlineKeyboardMarkup
         keyboard.append(
             [
                 InlineKeyboardButton(
-                    f"{jname} (ID {jid})", callback_data=f"job_{jid}_{project_id}"
+                    f"{jname} (ID {jid})", callback_data=f"job_{jid}_{project_ref}"
                 )
             ]
         )
@@ -61,14 +73,28 @@ def build_jobs_inline(jobs: List[Dict], project_id: int) -> InlineKeyboardMarkup
     return InlineKeyboardMarkup(keyboard)
 
 
+def _button_label(value: str, limit: int = 40) -> str:
+    return value if len(value) <= limit else value[: limit - 1] + "…"
+
+
 def build_params_inline(
         params: List[Dict],
         collected: Dict[str, Any],
-        project_id: int,
+        project_ref: str,
         job_id: int,
+        options: Optional[List[str]] = None,
 ) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Шаг заполнения параметров: текст и клавиатура для первого незаполненного параметра.
+    options — варианты значений: первым идёт значение по умолчанию, дальше недавние.
+    В callback_data передаются номер параметра и индекс варианта
+    (param_<номер параметра>_<индекс>_<job>_<project_ref>), сами значения хранятся
+    в user_data["param_options"]: так callback_data не упирается в лимит Telegram в 64 байта,
+    а нажатие на устаревшую клавиатуру не попадёт в другой параметр.
+    """
     next_param = None
-    for p in params:
+    position = 0
+    for position, p in enumerate(params):
         key = p.get("name")
         if key not in collected:
             next_param = p
@@ -86,24 +112,39 @@ def build_params_inline(
     
     key = next_param.get("name", "")
     default = next_param.get("defaultValue", "")
+    if options is None:
+        options = [default]
     
     header = (
         f"📋 Заполнено:\n{chosen_text}\n\n"
         f"Введите значение для «{key}» или используйте одну из кнопок:\n"
         f"• «✅ По умолчанию ({default})»\n"
-        f"• «✏️ Ввести своё значение»\n"
     )
+    if len(options) > 1:
+        header += "• «🕘 …» — недавно использованные значения\n"
+    header += "• «✏️ Ввести своё значение»\n"
     buttons = [
         [
             InlineKeyboardButton(
-                f"✅ По умолчанию ({default})",
-                callback_data=f"param_{key}_{default}_{job_id}_{project_id}",
+                _button_label(f"✅ По умолчанию ({default})"),
+                callback_data=f"param_{position}_0_{job_id}_{project_ref}",
             )
-        ],
+        ]
+    ]
+    for i, value in enumerate(options[1:], start=1):
+        buttons.append(
+            [
+                InlineKeyboardButton(
+                    _button_label(f"🕘 {value}"),
+                    callback_data=f"param_{position}_{i}_{job_id}_{project_ref}",
+                )
+            ]
+        )
+    buttons += [
         [
             InlineKeyboardButton(
                 f"✏️ Ввести своё значение",
-                callback_data=f"param_{key}_INPUT_{job_id}_{project_id}",
+                callback_data=f"param_{position}_INPUT_{job_id}_{project_ref}",
             )
         ],
         [InlineKeyboardButton("⬅️ Назад", callback_data="run_test")],
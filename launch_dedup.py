@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from db import claim_launch_key, release_launch_key, set_launch_key
+from testops_client import DEFAULT_INSTANCE, TestOpsError
+
+logger = logging.getLogger(__name__)
+
+# --------------------- Настройки ---------------------
+# Сколько секунд повторное подтверждение того же запуска (пользователь, Job, параметры, имя)
+# возвращает уже созданный прогон вместо нового; 0 — защита выключена
+LAUNCH_DEDUP_TTL = int(os.getenv("LAUNCH_DEDUP_TTL", "300"))
+
+
+class LaunchInProgress(Exception):
+    """Такой же запуск прямо сейчас выполняет другой воркер."""
+    pass
+
+
+# ключ -> (launch_id, истекает)
+_recent: Dict[str, Tuple[int, float]] = {}
+# ключ -> запуск, который выполняется в этом процессе
+_pending: Dict[str, "asyncio.Future[int]"] = {}
+
+
+def launch_key(
+        user_id: int,
+        job_id: int,
+        params_list: List[Dict],
+        launch_name: str,
+        instance: str = DEFAULT_INSTANCE,
+) -> str:
+    """
+    Ключ запуска: пользователь, сервер TestOps, Job, хэш параметров (порядок не важен)
+    и имя запуска.
+    """
+    params = sorted((str(p.get("id")), str(p.get("value"))) for p in params_list)
+    digest = hashlib.sha1(
+        json.dumps([job_id, params, launch_name], ensure_ascii=False).encode()
+    ).hexdigest()
+    return f"{user_id}:{instance}:{job_id}:{digest}"
+
+
+def recent_launch(key: str) -> Optional[int]:
+    """ID прогона, недавно запущенного по ключу на этом воркере, или None."""
+    cached = _recent.get(key)
+    if cached is None or cached[1] <= time.monotonic():
+        return None
+    return cached[0]
+
+
+def _remember(key: str, launch_id: int) -> None:
+    now = time.monotonic()
+    if len(_recent) > 1000:
+        for stale in [k for k, (_, expires) in _recent.items() if expires <= now]:
+            del _recent[stale]
+    _recent[key] = (launch_id, now + LAUNCH_DEDUP_TTL)
+
+
+async def run_job_once(key: str, start: Callable[[], Awaitable[int]]) -> Tuple[int, bool]:
+    """
+    Запускает start() не чаще одного раза за LAUNCH_DEDUP_TTL секунд на ключ.
+    Возвращает (launch_id, True), если запуск выполнен сейчас, и (launch_id, False),
+    если вернулся уже созданный прогон. Повторы ждут запуск, который ещё идёт в этом
+    процессе; если его выполняет другой воркер, бросает LaunchInProgress.
+    Ключи хранятся в памяти и в MongoDB (для нескольких воркеров). Если MongoDB
+    недоступна, защита работает только в пределах воркера.
+    """
+    if LAUNCH_DEDUP_TTL <= 0:
+        return await start(), True
+
+    launch_id = recent_launch(key)
+    if launch_id is not None:
+        logger.info(f"run_job_once: повторный запуск {key} → прогон {launch_id}")
+        return launch_id, False
+    pending = _pending.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending), False
+
+    future: "asyncio.Future[int]" = asyncio.get_running_loop().create_future()
+    _pending[key] = future
+    # Ключ в MongoDB может быть занят нами, пока прогон не создан: его нужно освободить
+    # при любом выходе, в том числе при отмене, иначе повторы до LAUNCH_DEDUP_TTL
+    # получают «запуск уже выполняется». Занятие могло успеть пройти, даже если нас отменили
+    holds_key = True
+    try:
+        try:
+            existing = await asyncio.to_thread(claim_launch_key, key, LAUNCH_DEDUP_TTL)
+        except Exception:
+            existing = None
+        if existing is not None:
+            holds_key = False
+            if existing.get("launch_id") is None:
+                raise LaunchInProgress(key)
+            launch_id = int(existing["launch_id"])
+            logger.info(f"run_job_once: повторный запуск {key} → прогон {launch_id} (из MongoDB)")
+            _remember(key, launch_id)
+            future.set_result(launch_id)
+            return launch_id, False
+
+        launch_id = await start()
+        holds_key = False
+        _remember(key, launch_id)
+        future.set_result(launch_id)
+        await asyncio.shield(asyncio.to_thread(set_launch_key, key, launch_id))
+        return launch_id, True
+    except BaseException as e:
+        if holds_key:
+            await asyncio.shield(asyncio.to_thread(release_launch_key, key))
+        if not future.done():
+            # Ждущим повторам отмена этого запуска не передаётся как их собственная отмена
+            if isinstance(e, asyncio.CancelledError):
+                e = TestOpsError("Запуск прерван")
+            future.set_exception(e)
+            # Исключение получат ждущие повторы; если их нет, не ругаемся «never retrieved»
+            future.exception()
+        raise
+    finally:
+        _pending.pop(key, None)
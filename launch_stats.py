@@ -0,0 +1,74 @@
+import html
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+# Статусы TestOps в порядке вывода; остальные (in progress и т.п.) выводятся после них
+KNOWN_STATUSES = ("passed", "failed", "broken", "skipped", "unknown")
+
+STATUS_LABELS = {
+    "passed": "🟢 Passed",
+    "failed": "🔴 Failed",
+    "broken": "🟠 Broken",
+    "skipped": "⚪ Skipped",
+    "unknown": "🟣 Unknown",
+}
+
+# Эти строки выводятся всегда, даже при нуле
+ALWAYS_SHOWN = ("passed", "failed", "skipped")
+
+
+@dataclass(slots=True)
+class LaunchStats:
+    """
+    Статистика прогона по статусам тестов. Строится за один проход по ответу
+    /launch/{id}/statistic и сохраняет все статусы TestOps, а не только passed/failed.
+    """
+
+    counts: Dict[str, int] = field(default_factory=dict)
+    total: int = 0
+
+    @classmethod
+    def from_statistic(cls, items: Iterable[Dict]) -> "LaunchStats":
+        counts: Dict[str, int] = {}
+        total = 0
+        for item in items:
+            count = item.get("count") or 0
+            status = (item.get("status") or "unknown").lower()
+            counts[status] = counts.get(status, 0) + count
+            total += count
+        return cls(counts, total)
+
+    @property
+    def passed(self) -> int:
+        return self.counts.get("passed", 0)
+
+    @property
+    def failed(self) -> int:
+        return self.counts.get("failed", 0)
+
+    @property
+    def broken(self) -> int:
+        return self.counts.get("broken", 0)
+
+    @property
+    def skipped(self) -> int:
+        return self.counts.get("skipped", 0)
+
+    @property
+    def has_failures(self) -> bool:
+        """Прогон неуспешен, если в нём есть упавшие или сломанные тесты."""
+        return self.failed > 0 or self.broken > 0
+
+    def to_html(self) -> str:
+        """Строки статистики для сообщений (HTML)."""
+        lines: List[str] = [f"🎯 Всего тестов: <b>{self.total}</b>"]
+        for status in KNOWN_STATUSES:
+            count = self.counts.get(status, 0)
+            if count or status in ALWAYS_SHOWN:
+                lines.append(f"{STATUS_LABELS[status]}: <b>{count}</b>")
+        for status, count in self.counts.items():
+            if status not in STATUS_LABELS and count:
+                # Имя статуса приходит из TestOps как есть — экранируем для parse_mode=HTML
+                label = html.escape(status.replace("_", " ").capitalize())
+                lines.append(f"⏳ {label}: <b>{count}</b>")
+        return "\n".join(lines)
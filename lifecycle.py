@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+import signal
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд при остановке ждать завершения запусков и отправки уведомлений
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+
+# Выставляется, когда бот получил сигнал остановки: новые действия больше не принимаются
+draining = asyncio.Event()
+
+_inflight: Counter = Counter()
+_idle: Optional[asyncio.Event] = None
+
+
+def _idle_event() -> asyncio.Event:
+    global _idle
+    if _idle is None:
+        _idle = asyncio.Event()
+        _idle.set()
+    return _idle
+
+
+@asynccontextmanager
+async def inflight(kind: str) -> AsyncIterator[None]:
+    """
+    Помечает операцию, которую нельзя обрывать при остановке (запуск Job-а,
+    отправка уведомления о завершении). drain() ждёт, пока такие операции закончатся.
+    """
+    idle = _idle_event()
+    _inflight[kind] += 1
+    idle.clear()
+    try:
+        yield
+    finally:
+        _inflight[kind] -= 1
+        if not +_inflight:
+            idle.set()
+
+
+async def drain(timeout: float = DRAIN_TIMEOUT) -> bool:
+    """
+    Ждёт завершения операций, отмеченных inflight(), не дольше timeout секунд.
+    Возвращает True, если всё успело завершиться.
+    """
+    try:
+        await asyncio.wait_for(_idle_event().wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        logger.warning(f"Остановка: не дождались завершения операций {dict(+_inflight)}")
+        return False
+
+
+async def reject_while_draining(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обработчик группы -2 (раньше всех остальных): во время остановки отвечает,
+    что бот перезапускается, и не пускает апдейт к остальным обработчикам.
+    """
+    if not draining.is_set():
+        return
+    text = "⏳ Бот перезапускается, повторите действие через минуту."
+    # Апдейт останавливается, даже если ответить не удалось
+    try:
+        if update.callback_query:
+            await update.callback_query.answer(text=text, show_alert=True)
+        elif update.effective_message:
+            await update.effective_message.reply_text(text)
+    except TelegramError as e:
+        logger.warning(f"reject_while_draining: не удалось ответить на апдейт: {e}")
+    finally:
+        raise ApplicationHandlerStop
+
+
+async def _drain_and_stop(application: Application) -> None:
+    if draining.is_set():
+        return
+    draining.set()
+    logger.info("Получен сигнал остановки: перестаю принимать действия и жду текущие операции")
+    if application.updater and application.updater.running:
+        await application.updater.stop()
+    await drain()
+    application.stop_running()
+
+
+def install_signal_handlers(application: Application) -> bool:
+    """
+    Ставит обработчики SIGINT/SIGTERM, которые запускают фазу дренажа перед остановкой.
+    Возвращает False, если платформа не поддерживает add_signal_handler (Windows) —
+    тогда остановка идёт стандартным путём PTB.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(
+                sig, lambda: application.create_task(_drain_and_stop(application))
+            )
+    except (NotImplementedError, RuntimeError):
+        return False
+    return True
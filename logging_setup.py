@@ -0,0 +1,127 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Dict, Optional
+
+# --------------------- Настройки ---------------------
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+# Уровни по модулям: "telegram=INFO,httpx=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+
+# Шумные библиотеки по умолчанию пишут только предупреждения
+DEFAULT_MODULE_LEVELS = {
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "apscheduler": "WARNING",
+    "pymongo": "WARNING",
+    "aiohttp": "WARNING",
+}
+
+# Поля из extra=..., которые попадают в структурированную запись
+CONTEXT_FIELDS = ("user_id", "chat_id", "instance", "launch_id", "job_id", "project_id")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну JSON-строку, добавляя user_id/launch_id и т.п. из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не форматирует запись на вызывающем потоке: стандартный prepare()
+    вызывает format() (трейсбек рендерится прямо в event loop) и стирает exc_info.
+    Здесь в очередь уходит копия записи, где подставлены только аргументы сообщения
+    (чтобы зафиксировать их значения), а exc_info сохраняется — форматирует её listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_module_levels(raw: str) -> Dict[str, str]:
+    """Разбирает строку вида "telegram=INFO,httpx=WARNING" в словарь."""
+    levels = {}
+    for item in raw.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Настраивает логирование через очередь: обработчики на event loop только кладут
+    запись в очередь (QueueHandler), а форматирование и запись в консоль/файл
+    с ротацией выполняет отдельный поток (QueueListener).
+    Повторный вызов возвращает уже запущенный listener.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if LOG_JSON else logging.Formatter(TEXT_FORMAT)
+    outputs = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE:
+        outputs.append(
+            logging.handlers.RotatingFileHandler(
+                LOG_FILE,
+                maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT,
+                encoding="utf-8",
+            )
+        )
+    for handler in outputs:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in {**DEFAULT_MODULE_LEVELS, **parse_module_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *outputs, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток логирования."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
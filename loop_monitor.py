@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --------------------- Настройки ---------------------
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR", "0") == "1"
+# Как часто event loop «отмечается» (в секундах)
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+# Блокировка дольше этого порога считается медленным колбэком (в секундах)
+LOOP_MONITOR_THRESHOLD = float(os.getenv("LOOP_MONITOR_THRESHOLD", "0.25"))
+# Файл, в который дописываются медленные колбэки (JSON Lines); пусто — не писать
+LOOP_MONITOR_EXPORT = os.getenv("LOOP_MONITOR_EXPORT", "")
+
+
+class LoopMonitor:
+    """
+    Монитор задержек event loop.
+
+    Внутри loop крутится «пульс» — задача, которая каждые interval секунд засыпает
+    и замеряет, насколько позже она проснулась (лаг). Отдельный поток-сторож следит
+    за временем последнего пульса: если loop не отвечает дольше threshold, сторож
+    снимает стек потока loop-а — это и есть место, где он заблокирован
+    (синхронный pymongo, запись логов на диск и т.п.).
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL,
+        threshold: float = LOOP_MONITOR_THRESHOLD,
+        export_path: str = LOOP_MONITOR_EXPORT,
+        history: int = 20,
+    ) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.export_path = export_path
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.samples = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.slow_count = 0
+        self._last_beat = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._pending_stack: Optional[List[str]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Запускает пульс и поток-сторож. Должен вызываться из работающего event loop."""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        logger.info(
+            f"LoopMonitor запущен (interval={self.interval}s, threshold={self.threshold}s)"
+        )
+
+    async def stop(self) -> None:
+        """Останавливает пульс и поток-сторож."""
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+        logger.info("LoopMonitor остановлен")
+
+    def reset(self) -> None:
+        """Сбрасывает накопленную статистику."""
+        self.stalls.clear()
+        self.samples = 0
+        self.max_lag = self.total_lag = 0.0
+        self.slow_count = 0
+
+    def status(self) -> Dict[str, Any]:
+        """Снимок статистики для команды /loop_monitor и экспорта."""
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "avg_lag_ms": (self.total_lag / self.samples * 1000) if self.samples else 0.0,
+            "max_lag_ms": self.max_lag * 1000,
+            "slow_callbacks": self.slow_count,
+            "threshold_ms": self.threshold * 1000,
+        }
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self._last_beat = time.monotonic()
+            self.samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self._record_stall(lag, self._pending_stack)
+            self._pending_stack = None
+
+    def _watch(self) -> None:
+        """Поток-сторож: снимает стек loop-а, пока тот заблокирован дольше порога."""
+        period = max(self.interval / 2, 0.01)
+        while not self._stop.wait(period):
+            blocked_for = time.monotonic() - self._last_beat - self.interval
+            if blocked_for < self.threshold or self._pending_stack is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._pending_stack = traceback.format_stack(frame, limit=25)
+
+    def _record_stall(self, lag: float, stack: Optional[List[str]]) -> None:
+        self.slow_count += 1
+        record = {
+            "ts": time.time(),
+            "lag_ms": round(lag * 1000, 1),
+            "stack": "".join(stack) if stack else None,
+        }
+        self.stalls.append(record)
+        logger.warning(
+            f"LoopMonitor: event loop был заблокирован {record['lag_ms']} мс"
+            + (f"\n{record['stack']}" if record["stack"] else "")
+        )
+        if self.export_path:
+            try:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.error(f"LoopMonitor: не удалось записать {self.export_path}: {e}")
+
+
+# Единственный экземпляр на процесс
+monitor = LoopMonitor()
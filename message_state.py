@@ -0,0 +1,117 @@
+import logging
+import os
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from telegram import Message
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# --------------------- Настройки ---------------------
+# Для скольких сообщений бота помнить текущий текст и клавиатуру (вытесняются самые давние)
+MESSAGE_STATE_CAPACITY = int(os.getenv("MESSAGE_STATE_CAPACITY", "10000"))
+
+# Состояние сообщения: (текст, parse_mode, клавиатура); None в тексте — текст неизвестен
+State = Tuple[Optional[str], Optional[str], Any]
+
+
+def _not_modified(error: BadRequest) -> bool:
+    return "not modified" in str(error).lower()
+
+
+class MessageStateTracker:
+    """
+    Помнит текст и клавиатуру сообщений бота, которые он сам редактировал,
+    и не отправляет в Bot API правки, которые ничего не меняют:
+    - повторное редактирование тем же текстом и клавиатурой пропускается;
+    - снятие клавиатуры с сообщения без клавиатуры пропускается;
+    - снятие клавиатуры с сообщения, которое сейчас будет отредактировано,
+      объединяется с этой правкой (новый текст заменяет и клавиатуру).
+    Счётчики сделанных и сэкономленных вызовов — в stats.
+    """
+
+    def __init__(self, capacity: int = MESSAGE_STATE_CAPACITY) -> None:
+        self.capacity = capacity
+        self.stats: Counter = Counter()
+        self._states: "OrderedDict[Hashable, State]" = OrderedDict()
+
+    def _get(self, chat_id: int, message_id: int) -> Optional[State]:
+        return self._states.get((chat_id, message_id))
+
+    def _set(self, chat_id: int, message_id: int, state: State) -> None:
+        key = (chat_id, message_id)
+        self._states[key] = state
+        self._states.move_to_end(key)
+        if len(self._states) > self.capacity:
+            self._states.popitem(last=False)
+
+    async def edit(self, query: Any, text: str, reply_markup: Any = None, **kwargs) -> Any:
+        """
+        query.edit_message_text, если сообщение действительно меняется.
+        Иначе возвращает query.message без обращения к Bot API.
+        """
+        message = query.message
+        state = (text, kwargs.get("parse_mode"), reply_markup)
+        if self._get(message.chat_id, message.message_id) == state:
+            self.stats["edit_skipped"] += 1
+            return message
+        try:
+            result = await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+        except BadRequest as e:
+            if not _not_modified(e):
+                raise
+            self.stats["edit_not_modified"] += 1
+            result = message
+        else:
+            self.stats["edit_sent"] += 1
+        # Для inline-сообщений Bot API возвращает True вместо Message
+        target = result if isinstance(result, Message) else message
+        self._set(target.chat_id, target.message_id, state)
+        return result
+
+    async def remove_markup(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int) -> None:
+        """Убирает inline-клавиатуру у сообщения (ошибки Bot API игнорируются)."""
+        state = self._get(chat_id, message_id)
+        if state is not None and state[2] is None:
+            self.stats["markup_skipped"] += 1
+            return
+        try:
+            await context.bot.edit_message_reply_markup(
+                chat_id=chat_id, message_id=message_id, reply_markup=None
+            )
+            self.stats["markup_sent"] += 1
+        except BadRequest as e:
+            if _not_modified(e):
+                self.stats["markup_not_modified"] += 1
+        except Exception:
+            pass
+        text, parse_mode = (state[0], state[1]) if state is not None else (None, None)
+        self._set(chat_id, message_id, (text, parse_mode, None))
+
+    async def clear_last_buttons(
+            self,
+            context: ContextTypes.DEFAULT_TYPE,
+            chat_id: int,
+            editing: Optional[int] = None,
+    ) -> None:
+        """
+        Снимает клавиатуру с сообщения из user_data["last_msg_id_with_buttons"].
+        editing — ID сообщения, которое обработчик сразу после этого отредактирует:
+        если клавиатура висит на нём же, отдельный вызов не нужен.
+        """
+        last_buttons = context.user_data.pop("last_msg_id_with_buttons", None)
+        if not last_buttons:
+            return
+        if last_buttons == editing:
+            self.stats["markup_merged"] += 1
+            return
+        await self.remove_markup(context, chat_id, last_buttons)
+
+    def summary(self) -> Dict[str, int]:
+        """Счётчики вызовов: *_sent — ушли в Bot API, остальные — сэкономлены или были лишними."""
+        return dict(self.stats)
+
+
+tracker = MessageStateTracker()
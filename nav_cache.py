@@ -0,0 +1,119 @@
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+
+import testops_client as toc
+from db import get_user_projects
+from testops_client import DEFAULT_INSTANCE
+
+# --------------------- Настройки ---------------------
+# Сколько секунд держать в памяти список проектов пользователя (изменения через
+# этот воркер сбрасывают кэш сразу, TTL нужен для изменений через другие воркеры)
+USER_PROJECTS_TTL = int(os.getenv("USER_PROJECTS_TTL", "300"))
+# Сколько секунд держать список Job’ов проекта, полученный из TestOps
+JOBS_CACHE_TTL = int(os.getenv("JOBS_CACHE_TTL", "60"))
+# Сколько готовых клавиатур хранить (вытесняются самые давние)
+KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", "1024"))
+# Для скольких пользователей и проектов держать списки (вытесняются самые давние)
+USER_PROJECTS_CACHE_SIZE = int(os.getenv("USER_PROJECTS_CACHE_SIZE", "10000"))
+PROJECT_JOBS_CACHE_SIZE = int(os.getenv("PROJECT_JOBS_CACHE_SIZE", "2000"))
+
+# Номера версий: меняются при каждом изменении данных, по ним кэшируются клавиатуры
+_versions = itertools.count(1)
+
+# user_id -> (версия, истекает, проекты)
+_user_projects: "OrderedDict[int, Tuple[int, float, List[Dict]]]" = OrderedDict()
+# (сервер TestOps, project_id) -> (версия, истекает, Job’ы)
+_project_jobs: "OrderedDict[Tuple[str, int], Tuple[int, float, List[Dict]]]" = OrderedDict()
+_keyboards: "OrderedDict[Hashable, InlineKeyboardMarkup]" = OrderedDict()
+
+
+def user_projects(user_id: int) -> Tuple[int, List[Dict]]:
+    """
+    Проекты пользователя и версия списка. MongoDB читается только при промахе кэша.
+    """
+    cached = _user_projects.get(user_id)
+    if cached is not None and cached[1] > time.monotonic():
+        _user_projects.move_to_end(user_id)
+        return cached[0], cached[2]
+    projects = get_user_projects(user_id)
+    version = next(_versions)
+    _put(
+        _user_projects, user_id,
+        (version, time.monotonic() + USER_PROJECTS_TTL, projects), USER_PROJECTS_CACHE_SIZE,
+    )
+    return version, projects
+
+
+def find_user_project(user_id: int, project_id: int, instance: str = DEFAULT_INSTANCE) -> Optional[Dict]:
+    """Проект пользователя из кэшированного списка или None."""
+    _, projects = user_projects(user_id)
+    return next(
+        (p for p in projects if p["project_id"] == project_id and p["instance"] == instance), None
+    )
+
+
+def invalidate_user_projects(user_id: int) -> None:
+    """Сбрасывает кэш проектов пользователя (вызывается при добавлении/удалении)."""
+    _user_projects.pop(user_id, None)
+
+
+def invalidate_all_user_projects() -> None:
+    """
+    Сбрасывает списки проектов всех пользователей (после переименования проектов
+    в sync_projects). Новые списки получат новые версии, поэтому и клавиатуры
+    с прежними названиями больше не используются.
+    """
+    _user_projects.clear()
+
+
+async def project_jobs(project_id: int, instance: str = DEFAULT_INSTANCE) -> Tuple[int, List[Dict]]:
+    """
+    Job’ы проекта и версия списка. Если после обновления из TestOps список не изменился,
+    версия сохраняется — и вместе с ней готовая клавиатура.
+    """
+    key = (instance, project_id)
+    cached = _project_jobs.get(key)
+    if cached is not None and cached[1] > time.monotonic():
+        _project_jobs.move_to_end(key)
+        return cached[0], cached[2]
+    jobs = await toc.get_client(instance).get_jobs_list(project_id)
+    same = cached is not None and _jobs_signature(cached[2]) == _jobs_signature(jobs)
+    version = cached[0] if same else next(_versions)
+    _put(
+        _project_jobs, key,
+        (version, time.monotonic() + JOBS_CACHE_TTL, jobs), PROJECT_JOBS_CACHE_SIZE,
+    )
+    return version, jobs
+
+
+def _jobs_signature(jobs: List[Dict]) -> Tuple:
+    return tuple((job.get("id"), job.get("name")) for job in jobs)
+
+
+def _put(cache: OrderedDict, key: Hashable, value, size: int) -> None:
+    """Кладёт значение в LRU-кэш и вытесняет самые давние записи сверх size."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > size:
+        cache.popitem(last=False)
+
+
+def cached_keyboard(key: Hashable, build: Callable[[], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+    """
+    Возвращает готовую клавиатуру по ключу (в ключ входит версия данных) или строит её.
+    InlineKeyboardMarkup в PTB неизменяемы, поэтому один объект можно отправлять многократно.
+    """
+    markup = _keyboards.get(key)
+    if markup is not None:
+        _keyboards.move_to_end(key)
+        return markup
+    markup = build()
+    _keyboards[key] = markup
+    if len(_keyboards) > KEYBOARD_CACHE_SIZE:
+        _keyboards.popitem(last=False)
+    return markup
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# --------------------- Настройки ---------------------
+# Любые действия пользователя (сообщения и нажатия кнопок): в минуту и запас на всплеск; 0 — без лимита
+RATE_LIMIT_UPDATES_PER_MIN = float(os.getenv("RATE_LIMIT_UPDATES_PER_MIN", "60"))
+RATE_LIMIT_UPDATES_BURST = int(os.getenv("RATE_LIMIT_UPDATES_BURST", "20"))
+# Запуски Job-ов одним пользователем: в час и запас на всплеск; 0 — без лимита
+RATE_LIMIT_LAUNCHES_PER_HOUR = float(os.getenv("RATE_LIMIT_LAUNCHES_PER_HOUR", "30"))
+RATE_LIMIT_LAUNCHES_BURST = int(os.getenv("RATE_LIMIT_LAUNCHES_BURST", "5"))
+# Сколько запросов на запуск Job-а воркер отправляет в TestOps одновременно (0 — без ограничения)
+RUN_JOB_MAX_CONCURRENT = int(os.getenv("RUN_JOB_MAX_CONCURRENT", "5"))
+# Для скольких пользователей держать счётчики (вытесняются самые давние)
+RATE_LIMIT_MAX_USERS = 10000
+
+# Нажатия, которые запускают Job в TestOps
+LAUNCH_CALLBACKS = frozenset({"launch_confirm"})
+
+
+@dataclass(slots=True)
+class TokenBucket:
+    """Токен-бакет: rate токенов в секунду, не больше capacity в запасе."""
+
+    rate: float
+    capacity: float
+    tokens: float
+    updated: float
+    # Пользователь уже предупреждён о превышении (сбрасывается после первого разрешённого действия)
+    warned: bool = False
+
+    def take(self, now: float) -> float:
+        """Берёт токен. Возвращает 0, если действие разрешено, иначе сколько секунд ждать."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Токен-бакеты по пользователям. Бакет заводится при первом действии пользователя;
+    при превышении max_users вытесняются бакеты давно неактивных пользователей.
+    """
+
+    def __init__(self, per_second: float, burst: int, max_users: int = RATE_LIMIT_MAX_USERS) -> None:
+        self.per_second = per_second
+        self.burst = max(burst, 1)
+        self.max_users = max_users
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_second > 0
+
+    def bucket(self, user_id: int, now: float) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_second, self.burst, self.burst, now)
+            self._buckets[user_id] = bucket
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+
+update_limiter = RateLimiter(RATE_LIMIT_UPDATES_PER_MIN / 60, RATE_LIMIT_UPDATES_BURST)
+launch_limiter = RateLimiter(RATE_LIMIT_LAUNCHES_PER_HOUR / 3600, RATE_LIMIT_LAUNCHES_BURST)
+
+# allowed / limited_updates / limited_launches / busy — для /rate_limits
+stats: Counter = Counter()
+# Кто чаще всего упирался в лимит: username (или id) -> число отклонённых действий
+limited_users: Counter = Counter()
+
+_run_job_slots: Optional[asyncio.Semaphore] = None
+_run_job_active = 0
+
+
+def _slots() -> asyncio.Semaphore:
+    global _run_job_slots
+    if _run_job_slots is None:
+        _run_job_slots = asyncio.Semaphore(RUN_JOB_MAX_CONCURRENT)
+    return _run_job_slots
+
+
+def run_job_busy() -> bool:
+    """Все слоты для запуска Job-ов заняты."""
+    return RUN_JOB_MAX_CONCURRENT > 0 and _run_job_active >= RUN_JOB_MAX_CONCURRENT
+
+
+@asynccontextmanager
+async def run_job_slot() -> AsyncIterator[None]:
+    """
+    Ограничивает число одновременных toc.run_job на воркере (RUN_JOB_MAX_CONCURRENT).
+    Если все слоты заняты, ждёт освобождения.
+    """
+    global _run_job_active
+    if RUN_JOB_MAX_CONCURRENT <= 0:
+        yield
+        return
+    async with _slots():
+        _run_job_active += 1
+        try:
+            yield
+        finally:
+            _run_job_active -= 1
+
+
+def _format_wait(seconds: float) -> str:
+    seconds = int(seconds) + 1
+    return f"{seconds} с" if seconds < 60 else f"{(seconds + 59) // 60} мин"
+
+
+async def _reject(update: Update, text: str, notify: bool) -> None:
+    # Нажатие кнопки нужно подтвердить в любом случае, иначе у клиента крутится индикатор;
+    # на сообщения отвечаем только один раз за серию, чтобы флуд не множил вызовы Bot API.
+    # Апдейт останавливается, даже если ответить не удалось (устаревший query, RetryAfter)
+    try:
+        if update.callback_query:
+            await update.callback_query.answer(text=text, show_alert=notify)
+        elif notify and update.effective_message:
+            await update.effective_message.reply_text(text)
+    except TelegramError as e:
+        logger.warning(f"rate_limit: не удалось ответить на отклонённый апдейт: {e}")
+    finally:
+        raise ApplicationHandlerStop
+
+
+async def limit_updates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Обработчик группы -1: ограничивает частоту действий пользователя и запусков Job-ов.
+    Отклонённый апдейт не доходит до остальных обработчиков (и до TestOps/MongoDB).
+    """
+    user = update.effective_user
+    if user is None:
+        return
+    now = time.monotonic()
+    bucket, wait, kind = None, 0.0, "updates"
+    if update_limiter.enabled:
+        bucket = update_limiter.bucket(user.id, now)
+        wait = bucket.take(now)
+        if not wait:
+            bucket.warned = False
+
+    query = update.callback_query
+    if not wait and query is not None and query.data in LAUNCH_CALLBACKS:
+        if run_job_busy():
+            stats["busy"] += 1
+            await _reject(
+                update, "⏳ Сейчас запускается слишком много Job’ов. Повторите через минуту.", True
+            )
+        if launch_limiter.enabled:
+            kind = "launches"
+            bucket = launch_limiter.bucket(user.id, now)
+            wait = bucket.take(now)
+            if not wait:
+                bucket.warned = False
+
+    if not wait:
+        stats["allowed"] += 1
+        return
+
+    stats[f"limited_{kind}"] += 1
+    who = user.username or str(user.id)
+    limited_users[who] += 1
+    notify = not bucket.warned
+    if notify:
+        bucket.warned = True
+        logger.warning(f"rate_limit: {who} превысил лимит ({kind}), ждать {wait:.0f} с")
+    if kind == "launches":
+        text = f"⛔ Слишком много запусков. Следующий можно через {_format_wait(wait)}."
+    else:
+        text = f"⛔ Слишком много действий. Подождите {_format_wait(wait)}."
+    await _reject(update, text, notify)
+
+
+def rate_limit_status(top: int = 5) -> Dict:
+    """Счётчики лимитера для /rate_limits."""
+    return {
+        "stats": dict(stats),
+        "run_job_active": _run_job_active,
+        "run_job_max": RUN_JOB_MAX_CONCURRENT,
+        "top_limited": limited_users.most_common(top),
+    }
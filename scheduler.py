@@ -0,0 +1,247 @@
+import asyncio
+import html
+import logging
+import os
+import re
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+from apscheduler.triggers.cron import CronTrigger
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes, Job, JobQueue
+
+import testops_client as toc
+from db import claim_schedule_run, list_schedules, record_schedule_launch
+from jobs import watch_launch
+from lifecycle import draining, inflight
+from rate_limit import run_job_slot
+
+logger = logging.getLogger(__name__)
+
+# --------------------- Настройки ---------------------
+# Часовой пояс, в котором трактуются cron-выражения
+SCHEDULE_TZ = ZoneInfo(os.getenv("SCHEDULE_TZ", "UTC"))
+# Запуски по расписанию разносятся по первым SCHEDULE_SPREAD секундам минуты
+# (смещение постоянно для каждого расписания), чтобы не бить в TestOps пачкой
+SCHEDULE_SPREAD = min(int(os.getenv("SCHEDULE_SPREAD", "45")), 59)
+# Как часто подтягивать изменения расписаний из MongoDB (сделанные другими воркерами)
+SCHEDULE_SYNC_INTERVAL = int(os.getenv("SCHEDULE_SYNC_INTERVAL", "60"))
+
+# Расписания, запланированные на этом воркере: id -> документ / задача JobQueue
+SCHEDULES: Dict[str, Dict] = {}
+SCHEDULE_JOBS: Dict[str, Job] = {}
+
+_CRON_WEEKDAYS = ("sun", "mon", "tue", "wed", "thu", "fri", "sat", "sun")
+_CRON_DAY_RANGE = re.compile(r"(\w+)(?:-(\w+))?")
+
+
+def _cron_weekday(value: str) -> int:
+    # Номер дня в нумерации crontab: число 0-7 или имя (sun, mon, ...)
+    if value.isdigit():
+        day = int(value)
+        if day > 7:
+            raise ValueError(f"день недели {day} вне диапазона 0-7")
+        return day
+    if value.lower() in _CRON_WEEKDAYS:
+        return _CRON_WEEKDAYS.index(value.lower())
+    raise ValueError(f"неизвестный день недели «{value}»")
+
+
+def _cron_day_of_week(field: str) -> str:
+    """
+    Переводит поле «день недели» из нумерации crontab (0 и 7 — воскресенье) в имена APScheduler.
+    Неделя APScheduler начинается с понедельника, поэтому воскресенье в начале диапазона
+    выносится отдельно («0-5» → «sun,mon-fri»), а диапазон с шагом раскрывается в список дней
+    («*/2» → «sun,tue,thu,sat», как в crontab): шаг в днях недели APScheduler считает иначе.
+    """
+    tokens = []
+    for part in field.split(","):
+        days, sep, step = part.partition("/")
+        if days == "*":
+            first, last = 0, 6
+            if not sep:
+                tokens.append("*")
+                continue
+        else:
+            match = _CRON_DAY_RANGE.fullmatch(days)
+            if not match:
+                raise ValueError(f"некорректный день недели «{part}»")
+            first = _cron_weekday(match.group(1))
+            if match.group(2):
+                last = _cron_weekday(match.group(2))
+                if last == 0 and not match.group(2).isdigit():
+                    # «sat-sun»: воскресенье в конце диапазона — это 7
+                    last = 7
+            else:
+                # «2/2» в crontab — со вторника до конца недели
+                last = 6 if sep else first
+        if first > last:
+            raise ValueError(f"некорректный диапазон «{days}»")
+        if sep:
+            if not step.isdigit() or int(step) == 0:
+                raise ValueError(f"некорректный шаг в «{part}»")
+            tokens.extend(_CRON_WEEKDAYS[day] for day in range(first, last + 1, int(step)))
+            continue
+        if first == 0:
+            tokens.append("sun")
+            if last == 0:
+                continue
+            first = 1
+        if first == last:
+            tokens.append(_CRON_WEEKDAYS[first])
+        else:
+            tokens.append(f"{_CRON_WEEKDAYS[first]}-{_CRON_WEEKDAYS[last]}")
+    return ",".join(tokens)
+
+
+def build_trigger(cron: str, offset: int = 0) -> CronTrigger:
+    """
+    Строит триггер из cron-выражения из 5 полей (минута, час, день, месяц, день недели).
+    Дни недели нумеруются как в crontab (0 и 7 — воскресенье). Бросает ValueError.
+    """
+    fields = cron.split()
+    if len(fields) != 5:
+        raise ValueError(f"ожидается 5 полей, получено {len(fields)}")
+    minute, hour, day, month, day_of_week = fields
+    day_of_week = _cron_day_of_week(day_of_week)
+    return CronTrigger(
+        minute=minute,
+        hour=hour,
+        day=day,
+        month=month,
+        day_of_week=day_of_week,
+        second=offset,
+        timezone=SCHEDULE_TZ,
+    )
+
+
+def _offset(schedule_id: str) -> int:
+    return zlib.crc32(schedule_id.encode()) % (SCHEDULE_SPREAD + 1)
+
+
+async def run_scheduled_launch(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Запускает Job по расписанию. Все воркеры срабатывают в одну и ту же секунду,
+    но запускает только тот, кто первым отметил слот в MongoDB. Дальше прогон
+    ставится на обычное ожидание (watch_launch), и результат приходит в целевой чат.
+    """
+    schedule_id = context.job.data
+    schedule = SCHEDULES.get(schedule_id)
+    if schedule is None or draining.is_set():
+        return
+    slot = int(time.time() // 60)
+    try:
+        if not claim_schedule_run(schedule_id, slot):
+            return
+    except Exception:
+        return
+
+    job_id = schedule["job_id"]
+    chat_id = schedule["chat_id"]
+    launch_name = f"{schedule['launch_name']} {datetime.now(SCHEDULE_TZ):%Y-%m-%d %H:%M}"
+    instance = schedule.get("instance", toc.DEFAULT_INSTANCE)
+    log_extra = {"chat_id": chat_id, "instance": instance, "job_id": job_id}
+    try:
+        # Неизвестный сервер (убран из TESTOPS_INSTANCES) — тоже TestOpsError
+        client = toc.get_client(instance)
+        async with run_job_slot(), inflight("run_job"):
+            run_id = await client.run_job(job_id, launch_name, schedule.get("params_list", []))
+    except toc.TestOpsError as e:
+        logger.error(f"run_scheduled_launch: расписание {schedule_id}: {e}", extra=log_extra)
+        record_schedule_launch(schedule_id, None, str(e))
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"❗ Не удалось запустить «{schedule['job_name']}» по расписанию.",
+        )
+        return
+    record_schedule_launch(schedule_id, run_id)
+
+    if schedule.get("display_params"):
+        params_lines = "\n".join(f"• {name} = {value}" for name, value in schedule["display_params"])
+    else:
+        params_lines = "нет параметров"
+    run_link = client.launch_url(run_id)
+    message = await context.bot.send_message(
+        chat_id=chat_id,
+        text=(
+            f"🗓 Запущено по расписанию <code>{schedule['cron']}</code>\n"
+            f"📌 Имя запуска: <b>{html.escape(launch_name)}</b>\n"
+            f"📋 Параметры:\n<code>{html.escape(params_lines)}</code>\n\n"
+            f"ID прогона: <b>{run_id}</b>\n"
+            f"🔗 <a href=\"{run_link}\">Перейти в Allure TestOps</a>"
+        ),
+        parse_mode=ParseMode.HTML,
+        disable_web_page_preview=True,
+    )
+    watch_launch(
+        context.job_queue,
+        chat_id=chat_id,
+        loading_message_id=message.message_id,
+        launch_id=run_id,
+        job_id=job_id,
+        project_id=schedule.get("project_id"),
+        job_name=schedule["job_name"],
+        instance=instance,
+    )
+
+
+def schedule_local(job_queue: JobQueue, schedule: Dict) -> Optional[Job]:
+    """
+    Планирует расписание на этом воркере (или перепланирует, если изменилось cron-выражение).
+    """
+    schedule_id = schedule["id"]
+    current = SCHEDULES.get(schedule_id)
+    SCHEDULES[schedule_id] = schedule
+    if current is not None and current["cron"] == schedule["cron"] and schedule_id in SCHEDULE_JOBS:
+        return SCHEDULE_JOBS[schedule_id]
+    unschedule_local(schedule_id, forget=False)
+    try:
+        trigger = build_trigger(schedule["cron"], _offset(schedule_id))
+    except ValueError as e:
+        logger.error(f"schedule_local: некорректное расписание {schedule_id}: {e}")
+        return None
+    job = job_queue.run_custom(
+        run_scheduled_launch,
+        job_kwargs={"trigger": trigger},
+        data=schedule_id,
+        name=f"schedule_{schedule_id}",
+    )
+    SCHEDULE_JOBS[schedule_id] = job
+    return job
+
+
+def unschedule_local(schedule_id: str, forget: bool = True) -> None:
+    job = SCHEDULE_JOBS.pop(schedule_id, None)
+    if job is not None:
+        job.schedule_removal()
+    if forget:
+        SCHEDULES.pop(schedule_id, None)
+
+
+async def sync_schedules(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Сверяет локальные задачи с расписаниями в MongoDB: добавляет новые,
+    перепланирует изменённые и снимает удалённые (в том числе на других воркерах).
+    """
+    try:
+        schedules = await asyncio.to_thread(list_schedules)
+    except Exception:
+        return
+    seen = set()
+    for schedule in schedules:
+        seen.add(schedule["id"])
+        schedule_local(context.job_queue, schedule)
+    for schedule_id in [sid for sid in SCHEDULES if sid not in seen]:
+        unschedule_local(schedule_id)
+
+
+def start_scheduler(job_queue: JobQueue) -> None:
+    """
+    Запускает синхронизацию расписаний (вызывается при старте бота).
+    """
+    job_queue.run_repeating(
+        sync_schedules, interval=SCHEDULE_SYNC_INTERVAL, first=0, name="sync_schedules"
+    )
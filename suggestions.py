@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Set, Tuple
+
+from telegram.ext import ContextTypes, JobQueue
+
+from db import load_param_suggestions, save_param_suggestions
+from testops_client import DEFAULT_INSTANCE
+
+logger = logging.getLogger(__name__)
+
+# --------------------- Настройки ---------------------
+# Сколько недавних значений параметра предлагать кнопками
+SUGGESTIONS_TOP_K = int(os.getenv("SUGGESTIONS_TOP_K", "3"))
+# Сколько разных значений на (Job, параметр) помнить, чтобы считать частоту
+SUGGESTIONS_CAPACITY = int(os.getenv("SUGGESTIONS_CAPACITY", "20"))
+# Как часто сохранять накопленные значения в MongoDB (в секундах)
+SUGGESTIONS_FLUSH_INTERVAL = int(os.getenv("SUGGESTIONS_FLUSH_INTERVAL", "60"))
+
+# (сервер TestOps, job_id, параметр)
+Key = Tuple[str, int, str]
+
+
+class SuggestionStore:
+    """
+    Частые значения параметров Job-ов: для каждого (сервер, job_id, параметр) хранится не больше
+    capacity значений со счётчиком и временем последнего использования.
+    При переполнении вытесняется самое редкое и давнее значение.
+    В MongoDB уходят только приращения счётчиков с прошлого сохранения.
+    """
+
+    def __init__(self, capacity: int = SUGGESTIONS_CAPACITY) -> None:
+        self.capacity = capacity
+        # (сервер, job_id, параметр) -> значение -> [счётчик, время последнего использования]
+        self._values: Dict[Key, Dict[str, List[float]]] = {}
+        self._loaded_jobs: Set[Tuple[str, int]] = set()
+        # Ещё не сохранённые приращения в том же виде
+        self._deltas: Dict[Key, Dict[str, List[float]]] = {}
+
+    @staticmethod
+    def _add(values: Dict[str, List[float]], value: str, count: float, last_used: float) -> None:
+        entry = values.setdefault(value, [0, 0.0])
+        entry[0] += count
+        entry[1] = max(entry[1], last_used)
+
+    def _trim(self, values: Dict[str, List[float]]) -> None:
+        while len(values) > self.capacity:
+            victim = min(values, key=lambda v: (values[v][0], values[v][1]))
+            del values[victim]
+
+    def record(self, job_id: int, name: str, value: str, instance: str = DEFAULT_INSTANCE) -> None:
+        key = (instance, job_id, name)
+        now = time.time()
+        values = self._values.setdefault(key, {})
+        if value not in values and len(values) >= self.capacity:
+            victim = min(values, key=lambda v: (values[v][0], values[v][1]))
+            del values[victim]
+        self._add(values, value, 1, now)
+        self._add(self._deltas.setdefault(key, {}), value, 1, now)
+
+    def top(
+            self, job_id: int, name: str, k: int = SUGGESTIONS_TOP_K, instance: str = DEFAULT_INSTANCE
+    ) -> List[str]:
+        """Самые частые значения (при равенстве — самые свежие)."""
+        values = self._values.get((instance, job_id, name))
+        if not values:
+            return []
+        ranked = sorted(values.items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)
+        return [value for value, _ in ranked[:k]]
+
+    async def ensure_loaded(self, job_id: int, instance: str = DEFAULT_INSTANCE) -> None:
+        """
+        Подгружает сохранённые значения параметров Job-а из MongoDB (один раз на процесс;
+        если чтение не удалось, попытка повторится при следующем вызове).
+        Чтение идёт в отдельном потоке, а слияние со значениями в памяти — в event loop.
+        """
+        if (instance, job_id) in self._loaded_jobs:
+            return
+        try:
+            docs = await asyncio.to_thread(load_param_suggestions, job_id, instance)
+        except Exception as e:
+            logger.warning(f"suggestions: не удалось загрузить значения Job {job_id} ({instance}): {e}")
+            return
+        if (instance, job_id) in self._loaded_jobs:
+            # Пока шло чтение, Job подгрузил параллельный вызов
+            return
+        self._loaded_jobs.add((instance, job_id))
+        loaded: Dict[Key, Dict[str, List[float]]] = {}
+        for doc in docs:
+            key = (instance, job_id, doc["param"])
+            self._add(loaded.setdefault(key, {}), doc["value"], doc["count"], doc["last_used"])
+        # В базе уже есть всё сохранённое; добавляем к нему только несохранённые приращения
+        for key, deltas in self._deltas.items():
+            if key[:2] == (instance, job_id):
+                for value, (count, last_used) in deltas.items():
+                    self._add(loaded.setdefault(key, {}), value, count, last_used)
+        for key, values in loaded.items():
+            self._trim(values)
+            self._values[key] = values
+
+    def pop_dirty(self) -> List[Dict]:
+        """Приращения счётчиков с прошлого сохранения: документ на значение."""
+        deltas, self._deltas = self._deltas, {}
+        return [
+            {
+                "instance": instance,
+                "job_id": job_id,
+                "param": name,
+                "value": value,
+                "count": count,
+                "last_used": last_used,
+            }
+            for (instance, job_id, name), values in deltas.items()
+            for value, (count, last_used) in values.items()
+        ]
+
+    def restore(self, docs: List[Dict]) -> None:
+        """Возвращает приращения, которые не удалось сохранить, до следующей попытки."""
+        for doc in docs:
+            key = (doc["instance"], doc["job_id"], doc["param"])
+            self._add(self._deltas.setdefault(key, {}), doc["value"], doc["count"], doc["last_used"])
+
+
+store = SuggestionStore()
+
+
+def _save(docs: List[Dict]) -> bool:
+    try:
+        save_param_suggestions(docs)
+    except Exception as e:
+        logger.warning(f"flush_suggestions: не удалось сохранить {len(docs)} значений: {e}")
+        return False
+    return True
+
+
+def flush_suggestions() -> int:
+    """
+    Сохраняет приращения счётчиков в MongoDB (вызывается и при остановке бота).
+    Возвращает число сохранённых значений; при ошибке приращения остаются до следующей попытки.
+    """
+    docs = store.pop_dirty()
+    if not docs:
+        return 0
+    if not _save(docs):
+        store.restore(docs)
+        return 0
+    return len(docs)
+
+
+async def flush_suggestions_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Документы собираются в event loop, а запись в MongoDB идёт в отдельном потоке;
+    # несохранённые приращения возвращаются тоже в event loop
+    docs = store.pop_dirty()
+    if docs and not await asyncio.to_thread(_save, docs):
+        store.restore(docs)
+
+
+def start_suggestions_flush(job_queue: JobQueue) -> None:
+    """
+    Запускает периодическое сохранение значений параметров (вызывается при старте бота).
+    """
+    job_queue.run_repeating(
+        flush_suggestions_job,
+        interval=SUGGESTIONS_FLUSH_INTERVAL,
+        first=SUGGESTIONS_FLUSH_INTERVAL,
+        name="flush_suggestions",
+    )
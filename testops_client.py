@@ -1,13 +1,18 @@
 # testops_client.py
 
+import asyncio
 import os
+import re
 import time
 import logging
 import aiohttp
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 from dotenv import load_dotenv
 
+from json_stream import JsonListStream, dumps, loads, project
+from testops_replay import ExchangeRecorder, ExchangeReplayer
+
 # Загружаем .env
 load_dotenv()
 
@@ -15,17 +20,49 @@ logger = logging.getLogger(__name__)
 
 # --------------------- Переменные окружения ---------------------
 # Ожидается, что в окружении заданы TESTOPS_URL (базовый URL, например: https://my.testops.io),
-# и USER_TOKEN (API-токен Allure TestOps).
+# TESTOPS_API_BASE (базовый URL API) и USER_TOKEN (API-токен Allure TestOps).
+# Наличие переменных проверяется при первом запросе, а не при импорте.
 TESTOPS_API_BASE = os.getenv("TESTOPS_API_BASE")
 TESTOPS_URL = os.getenv("TESTOPS_URL")
 USER_TOKEN = os.getenv("USER_TOKEN", "")
 
-if not TESTOPS_API_BASE or not USER_TOKEN:
-    logger.error("В testops_client: отсутствует TESTOPS_URL или USER_TOKEN в окружении.")
-    raise RuntimeError("TESTOPS_URL и USER_TOKEN обязательны для работы модуля testops_client")
+# Дополнительные серверы TestOps задаются в TESTOPS_INSTANCES: имена через запятую
+# (строчные латинские буквы и цифры). Для сервера NAME задаются TESTOPS_NAME_API_BASE,
+# TESTOPS_NAME_URL и TESTOPS_NAME_USER_TOKEN, а также, при необходимости,
+# TESTOPS_NAME_POOL_SIZE и TESTOPS_NAME_RATE_LIMIT. Читаются при первом обращении к серверам.
+# Имя сервера из TESTOPS_API_BASE/TESTOPS_URL/USER_TOKEN; к нему относятся данные,
+# сохранённые до появления нескольких серверов
+DEFAULT_INSTANCE = "default"
+INSTANCE_NAME_RE = re.compile(r"[a-z0-9]{1,16}")
+
+# Размер пула соединений HTTP-сессии (у каждого сервера TestOps своя сессия)
+TESTOPS_POOL_SIZE = int(os.getenv("TESTOPS_POOL_SIZE", "20"))
+# Сколько запросов пакетные функции (get_launches_*) выполняют одновременно
+TESTOPS_BATCH_CONCURRENCY = int(os.getenv("TESTOPS_BATCH_CONCURRENCY", "10"))
+# Сколько запросов в секунду отправлять на один сервер TestOps (0 — без ограничения)
+TESTOPS_RATE_LIMIT = float(os.getenv("TESTOPS_RATE_LIMIT", "0"))
+
+# Максимальный размер ответа TestOps в байтах: больший ответ не дочитывается и считается ошибкой
+TESTOPS_MAX_RESPONSE_BYTES = int(os.getenv("TESTOPS_MAX_RESPONSE_BYTES", str(16 * 1024 * 1024)))
+# Списки (например, Job-ы проекта) больше этого размера разбираются по мере чтения, по элементу;
+# 0 — всегда разбирать ответ целиком
+TESTOPS_STREAM_MIN_BYTES = int(os.getenv("TESTOPS_STREAM_MIN_BYTES", str(1024 * 1024)))
+# Сколько байт тела ответа с ошибкой попадает в лог
+ERROR_BODY_LOG_BYTES = 2048
+# Размер куска при чтении ответа
+READ_CHUNK_BYTES = 64 * 1024
+
+# Запись и воспроизведение обменов с API (читаются при первом обращении, как и настройки серверов):
+# TESTOPS_RECORD — дописывать все обмены в файл (JSON Lines; .gz — со сжатием);
+# TESTOPS_REPLAY — воспроизводить записанный файл вместо обращений к TestOps (сеть и токен не нужны);
+# TESTOPS_REPLAY_LATENCY — задержка ответов при воспроизведении в секундах; пусто — как при записи
+
+# Запись и воспроизведение обменов (создаются при первом запросе, общие для всех серверов)
+_recorder: Optional[ExchangeRecorder] = None
+_replayer: Optional[ExchangeReplayer] = None
 
-# Кэширование JWT
-_jwt_cache: Dict[str, Any] = {"token": None, "expires_at": 0}
+# Клиенты серверов TestOps: имя -> клиент (создаются при первом обращении)
+_clients: Dict[str, "TestOpsClient"] = {}
 
 
 class TestOpsError(Exception):
@@ -33,169 +70,503 @@ class TestOpsError(Exception):
     pass
 
 
-async def get_jwt() -> str:
+def get_replayer() -> Optional[ExchangeReplayer]:
     """
-    Асинхронно получает и кеширует JWT из Allure TestOps по API-токену.
-    Возвращает актуальный токен (Bearer).
+    Воспроизведение из TESTOPS_REPLAY или None, если режим выключен.
+    Бросает FileNotFoundError, если файла записи нет.
     """
-    now = time.time()
-    if _jwt_cache["token"] and _jwt_cache["expires_at"] - 30 > now:
-        return _jwt_cache["token"]
+    global _replayer
+    path = os.getenv("TESTOPS_REPLAY", "")
+    if _replayer is None and path:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"TESTOPS_REPLAY: файл записи {path} не найден")
+        latency = os.getenv("TESTOPS_REPLAY_LATENCY", "")
+        _replayer = ExchangeReplayer(path, float(latency) if latency else None)
+    return _replayer
 
-    url = f"{TESTOPS_API_BASE}/uaa/oauth/token"
-    data = {"grant_type": "apitoken", "scope": "openid", "token": USER_TOKEN}
-    headers = {"Accept": "application/json"}
 
-    timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        try:
-            async with session.post(url, data=data, headers=headers) as resp:
-                if resp.status >= 400:
-                    text = await resp.text()
-                    logger.error(f"get_jwt: POST {url} failed {resp.status} | {text}")
-                    raise TestOpsError(f"Ошибка получения токена: {resp.status}")
-                j = await resp.json()
-        except aiohttp.ClientError as e:
-            logger.error(f"get_jwt: сетевой сбой при запросе токена: {e}")
-            raise TestOpsError("Сетевой сбой при получении токена")
-
-    token = j.get("access_token")
-    expires_in = j.get("expires_in", 300)
-    if not token:
-        logger.error("get_jwt: нет поля access_token в ответе")
-        raise TestOpsError("В ответе отсутствует access_token")
-
-    _jwt_cache["token"] = token
-    _jwt_cache["expires_at"] = now + int(expires_in)
-    return token
-
-
-async def api_request(method: str, path: str, payload: Optional[Dict] = None) -> Any:
+def get_recorder() -> Optional[ExchangeRecorder]:
+    """Запись в TESTOPS_RECORD или None, если режим выключен."""
+    global _recorder
+    path = os.getenv("TESTOPS_RECORD", "")
+    if _recorder is None and path:
+        _recorder = ExchangeRecorder(path)
+    return _recorder
+
+
+async def _read_error_body(resp: aiohttp.ClientResponse) -> str:
+    # Тело ответа с ошибкой нужно только для лога: читаем не больше ERROR_BODY_LOG_BYTES
+    try:
+        data = await resp.content.read(ERROR_BODY_LOG_BYTES)
+    except aiohttp.ClientError:
+        return ""
+    return data.decode("utf-8", errors="replace")
+
+
+async def _read_body(resp: aiohttp.ClientResponse, url: str, stream: Optional[JsonListStream] = None) -> bytes:
     """
-    Универсальный асинхронный запрос к TestOps API.
-    method: "GET" или "POST".
-    path: то, что идёт после базового URL, например: "/project/123".
-    payload: для POST – словарь с JSON-телом.
-    Возвращает распарсенный JSON.
+    Читает тело ответа кусками, не больше TESTOPS_MAX_RESPONSE_BYTES.
+    Если передан stream, куски сразу уходят в него и тело не накапливается.
     """
-    jwt = await get_jwt()
-    url = f"{TESTOPS_API_BASE}{path}"
-    headers = {
-        "Authorization": f"Bearer {jwt}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    
-    timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
+    limit = TESTOPS_MAX_RESPONSE_BYTES
+    if limit > 0 and resp.content_length is not None and resp.content_length > limit:
+        logger.error(f"{url}: ответ {resp.content_length} байт больше TESTOPS_MAX_RESPONSE_BYTES={limit}")
+        raise TestOpsError(f"Слишком большой ответ TestOps: {resp.content_length} байт")
+    body = bytearray()
+    size = 0
+    async for chunk in resp.content.iter_chunked(READ_CHUNK_BYTES):
+        size += len(chunk)
+        if 0 < limit < size:
+            logger.error(f"{url}: ответ больше TESTOPS_MAX_RESPONSE_BYTES={limit}, чтение прервано")
+            raise TestOpsError(f"Слишком большой ответ TestOps: больше {limit} байт")
+        if stream is not None:
+            stream.feed(chunk)
+        else:
+            body += chunk
+    return bytes(body)
+
+
+class RequestLimiter:
+    """
+    Ограничивает частоту запросов к одному серверу TestOps: rate запросов в секунду
+    с запасом на всплеск в одну секунду. Место в очереди резервируется до ожидания,
+    поэтому одновременные запросы выстраиваются по очереди, а не будят друг друга.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.waits = 0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        interval = 1 / self.rate
+        burst = max(int(self.rate), 1)
+        now = time.monotonic()
+        slot = max(self._next, now)
+        self._next = slot + interval
+        delay = slot - now - (burst - 1) * interval
+        if delay > 0:
+            self.waits += 1
+            await asyncio.sleep(delay)
+
+
+class TestOpsClient:
+    """
+    Клиент одного сервера Allure TestOps. У каждого сервера свои JWT, HTTP-сессия
+    с пулом соединений и ограничение частоты запросов, поэтому медленный или
+    перегруженный сервер не задерживает запросы к остальным.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            api_base: Optional[str],
+            url: Optional[str],
+            token: str,
+            pool_size: int = TESTOPS_POOL_SIZE,
+            rate_limit: float = TESTOPS_RATE_LIMIT,
+    ) -> None:
+        self.name = name
+        self.api_base = api_base
+        self.url = url
+        self.pool_size = pool_size
+        self.limiter = RequestLimiter(rate_limit)
+        self._token = token
+        # Кэширование JWT
+        self._jwt: Optional[str] = None
+        self._jwt_expires_at = 0.0
+        self._jwt_lock: Optional[asyncio.Lock] = None
+        # HTTP-сессия (создаётся при первом запросе, закрывается в close)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def __repr__(self) -> str:
+        return f"TestOpsClient({self.name!r}, {self.api_base!r})"
+
+    def _require_config(self) -> None:
+        if not self.api_base or not self._token:
+            logger.error(f"testops_client[{self.name}]: не задан базовый URL API или токен.")
+            raise TestOpsError(f"Для сервера TestOps «{self.name}» обязательны URL API и токен")
+
+    def launch_url(self, launch_id: int) -> str:
+        """Ссылка на прогон в веб-интерфейсе TestOps."""
+        return f"{self.url}/launch/{launch_id}"
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Возвращает HTTP-сессию сервера с пулом соединений, создавая её при первом вызове.
+        Должна вызываться из работающего event loop.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10),
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                json_serialize=dumps,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_jwt(self) -> str:
+        """
+        Асинхронно получает и кеширует JWT из Allure TestOps по API-токену.
+        Возвращает актуальный токен (Bearer). Одновременные запросы ждут одно обновление.
+        """
+        if self._jwt and self._jwt_expires_at - 30 > time.time():
+            return self._jwt
+
+        self._require_config()
+        if self._jwt_lock is None:
+            self._jwt_lock = asyncio.Lock()
+        async with self._jwt_lock:
+            now = time.time()
+            if self._jwt and self._jwt_expires_at - 30 > now:
+                return self._jwt
+
+            url = f"{self.api_base}/uaa/oauth/token"
+            data = {"grant_type": "apitoken", "scope": "openid", "token": self._token}
+            headers = {"Accept": "application/json"}
+
+            try:
+                await self.limiter.wait()
+                async with self.session().post(url, data=data, headers=headers) as resp:
+                    if resp.status >= 400:
+                        text = await _read_error_body(resp)
+                        logger.error(f"get_jwt: POST {url} failed {resp.status} | {text}")
+                        raise TestOpsError(f"Ошибка получения токена: {resp.status}")
+                    j = loads(await _read_body(resp, url))
+            except aiohttp.ClientError as e:
+                logger.error(f"get_jwt: сетевой сбой при запросе токена: {e}")
+                raise TestOpsError("Сетевой сбой при получении токена")
+            except ValueError:
+                logger.error(f"get_jwt: некорректный JSON в ответе {url}")
+                raise TestOpsError("Некорректный ответ при получении токена")
+
+            token = j.get("access_token")
+            expires_in = j.get("expires_in", 300)
+            if not token:
+                logger.error("get_jwt: нет поля access_token в ответе")
+                raise TestOpsError("В ответе отсутствует access_token")
+
+            self._jwt = token
+            self._jwt_expires_at = now + int(expires_in)
+            return token
+
+    async def api_request(
+            self,
+            method: str,
+            path: str,
+            payload: Optional[Dict] = None,
+            fields: Optional[Sequence[str]] = None,
+    ) -> Any:
+        """
+        Запрос к TestOps API (см. _send_request). В режиме TESTOPS_REPLAY ответ берётся
+        из записанного файла, в режиме TESTOPS_RECORD обмен дописывается в файл.
+        """
+        method = method.upper()
+        # В записи помечаются только обмены с дополнительными серверами: старые записи
+        # так и воспроизводятся для сервера по умолчанию
+        instance = None if self.name == DEFAULT_INSTANCE else self.name
+        replayer = get_replayer()
+        if replayer is not None:
+            entry = await replayer.respond(method, path, instance)
+            if entry is None:
+                logger.error(f"replay: нет записи для {method} {path} ({self.name})")
+                raise TestOpsError(f"{method} {path} → нет записи")
+            if "error" in entry:
+                raise TestOpsError(entry["error"])
+            body = entry["body"]
+            return [project(item, fields) for item in body] if isinstance(body, list) else body
+
+        recorder = get_recorder()
+        if recorder is None:
+            return await self._send_request(method, path, payload, fields)
+        started = time.perf_counter()
+        try:
+            data = await self._send_request(method, path, payload, fields)
+        except TestOpsError as e:
+            recorder.record(method, path, payload, time.perf_counter() - started, error=str(e), instance=instance)
+            raise
+        recorder.record(method, path, payload, time.perf_counter() - started, body=data, instance=instance)
+        return data
+
+    async def _send_request(
+            self,
+            method: str,
+            path: str,
+            payload: Optional[Dict] = None,
+            fields: Optional[Sequence[str]] = None,
+    ) -> Any:
+        """
+        Универсальный асинхронный запрос к TestOps API через HTTP-сессию сервера.
+        method: "GET" или "POST".
+        path: то, что идёт после базового URL, например: "/project/123".
+        payload: для POST – словарь с JSON-телом.
+        fields: если ответ – список словарей, у элементов остаются только эти поля;
+        большие списки (от TESTOPS_STREAM_MIN_BYTES) тогда разбираются по мере чтения.
+        Возвращает распарсенный JSON.
+        При 5xx повторяется только GET: повтор POST (например, /job/{id}/run) мог бы
+        запустить Job второй раз.
+        """
+        jwt = await self.get_jwt()
+        url = f"{self.api_base}{path}"
+        headers = {
+            "Authorization": f"Bearer {jwt}",
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+
+        method = method.upper()
+        if method not in ("GET", "POST"):
+            raise TestOpsError(f"Unsupported HTTP method: {method}")
+
+        session = self.session()
         for attempt in (1, 2):  # максимум 2 попытки
             try:
-                if method.upper() == "GET":
-                    async with session.get(url, headers=headers) as resp:
-                        text = await resp.text()
-                        if resp.status >= 500 and attempt == 1:
-                            logger.warning(f"GET {url} → {resp.status}, retrying...")
-                            await asyncio.sleep(2)
-                            continue
-                        if resp.status >= 400:
-                            logger.error(f"GET {url} failed {resp.status} | {text}")
-                            raise TestOpsError(f"GET {path} → {resp.status}")
-                        return await resp.json()
-                
-                elif method.upper() == "POST":
-                    async with session.post(url, json=payload or {}, headers=headers) as resp:
-                        text = await resp.text()
-                        if resp.status >= 500 and attempt == 1:
-                            logger.warning(f"POST {url} → {resp.status}, retrying...")
-                            await asyncio.sleep(2)
-                            continue
-                        if resp.status >= 400:
-                            logger.error(f"POST {url} failed {resp.status} | {text}")
-                            raise TestOpsError(f"POST {path} → {resp.status}")
-                        return await resp.json()
-                
-                else:
-                    raise TestOpsError(f"Unsupported HTTP method: {method}")
-            
+                kwargs = {"json": payload or {}} if method == "POST" else {}
+                await self.limiter.wait()
+                async with session.request(method, url, headers=headers, **kwargs) as resp:
+                    if resp.status >= 500 and attempt == 1 and method == "GET":
+                        logger.warning(f"{method} {url} → {resp.status}, retrying...")
+                        await asyncio.sleep(2)
+                        continue
+                    if resp.status >= 400:
+                        text = await _read_error_body(resp)
+                        logger.error(f"{method} {url} failed {resp.status} | {text}")
+                        raise TestOpsError(f"{method} {path} → {resp.status}")
+                    try:
+                        size = resp.content_length
+                        if fields is not None and TESTOPS_STREAM_MIN_BYTES > 0 and (
+                                size is None or size >= TESTOPS_STREAM_MIN_BYTES):
+                            stream = JsonListStream(fields)
+                            await _read_body(resp, url, stream)
+                            return stream.result()
+                        data = loads(await _read_body(resp, url))
+                    except ValueError as e:
+                        logger.error(f"{method} {url}: некорректный JSON в ответе: {e}")
+                        raise TestOpsError(f"{method} {path} → некорректный JSON")
+                    if fields is not None and isinstance(data, list):
+                        return [project(item, fields) for item in data]
+                    return data
+
             except aiohttp.ClientError as e:
                 logger.error(f"api_request: сетевой сбой при запросе {method} {url}: {e}")
                 raise TestOpsError("Сетевой сбой при запросе к TestOps")
 
+    async def get_project(self, project_id: int) -> Dict:
+        """
+        Возвращает карточку проекта из TestOps: имя, аббревиатуру, описание и т.д.
+        """
+        data = await self.api_request("GET", f"/project/{project_id}")
+        if not isinstance(data, dict):
+            raise TestOpsError(f"Unexpected response for project: {project_id}")
+        return data
 
-async def get_project_name(project_id: int) -> str:
-    """
-    Получает из TestOps имя проекта по его ID.
-    """
-    data = await api_request("GET", f"/project/{project_id}")
-    return data.get("name", f"Проект {project_id}")
+    async def get_project_name(self, project_id: int) -> str:
+        """
+        Получает из TestOps имя проекта по его ID.
+        """
+        data = await self.get_project(project_id)
+        return data.get("name", f"Проект {project_id}")
 
+    async def get_jobs_list(self, project_id: int) -> List[Dict]:
+        """
+        Возвращает список Job’ов для данного проекта (только id и name — остальное боту не нужно).
+        Если ответ – не список, пытается найти поля "content", "jobs", "elements" или "data".
+        """
+        fields = ("id", "name")
+        data = await self.api_request("GET", f"/job?projectId={project_id}", fields=fields)
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            for key in ("content", "jobs", "elements", "data"):
+                if key in data and isinstance(data[key], list):
+                    return [project(item, fields) for item in data[key]]
+        return []
 
-async def get_jobs_list(project_id: int) -> List[Dict]:
-    """
-    Возвращает список Job’ов для данного проекта.
-    Если ответ – не список, пытается найти поля "content", "jobs", "elements" или "data".
-    """
-    data = await api_request("GET", f"/job?projectId={project_id}")
-    if isinstance(data, list):
+    async def get_job_details(self, job_id: int) -> Dict:
+        """
+        Возвращает детали Job-а, включая параметры, url: GET /api/job/{jobId}.
+        """
+        data = await self.api_request("GET", f"/job/{job_id}")
+        if not isinstance(data, dict):
+            raise TestOpsError(f"Unexpected response for job details: {job_id}")
         return data
-    if isinstance(data, dict):
-        for key in ("content", "jobs", "elements", "data"):
-            if key in data and isinstance(data[key], list):
-                return data[key]
-    return []
 
+    async def run_job(self, job_id: int, launch_name: str, params_list: List[Dict]) -> int:
+        """
+        Запускает Job с заданным списком параметров.
+        Возвращает ID созданного запуска (launch_id).
+        """
+        payload = {
+            "launchName": launch_name,
+            "parameters": params_list,
+            "selection": {
+                "groupsInclude": [],
+                "groupsExclude": [],
+                "leafsInclude": [],
+                "leafsExclude": [],
+                "path": [],
+                "inverted": False,
+            },
+            "tags": [],
+        }
+        data = await self.api_request("POST", f"/job/{job_id}/run", payload)
+        run_id = data.get("id")
+        if not run_id:
+            logger.error(f"run_job: нет поля id в ответе при запуске job {job_id} ({self.name})")
+            raise TestOpsError("Не удалось получить идентификатор запуска")
+        return int(run_id)
 
-async def get_job_details(job_id: int) -> Dict:
-    """
-    Возвращает детали Job-а, включая параметры, url: GET /api/job/{jobId}.
-    """
-    data = await api_request("GET", f"/job/{job_id}")
-    if not isinstance(data, dict):
-        raise TestOpsError(f"Unexpected response for job details: {job_id}")
-    return data
+    async def get_launch_info(self, launch_id: int) -> Dict:
+        """
+        Возвращает информацию о запуске по ID: статус, флаги и т.д.
+        """
+        data = await self.api_request("GET", f"/launch/{launch_id}")
+        if not isinstance(data, dict):
+            raise TestOpsError(f"Unexpected response for launch info: {launch_id}")
+        return data
+
+    async def get_launch_statistic(self, launch_id: int) -> List[Dict]:
+        """
+        Возвращает статистику по запуску (количество тестов в разных статусах).
+        """
+        data = await self.api_request("GET", f"/launch/{launch_id}/statistic")
+        if not isinstance(data, list):
+            raise TestOpsError(f"Unexpected stats response for launch {launch_id}")
+        return data
+
+    async def _fetch_many(self, fetch, ids: List[int]) -> Dict[int, Any]:
+        """
+        Выполняет fetch(id) для всех ID (без повторов) одновременно через сессию сервера,
+        но не больше TESTOPS_BATCH_CONCURRENCY запросов за раз.
+        ID, по которым запрос не удался, в результат не попадают.
+        """
+        semaphore = asyncio.Semaphore(TESTOPS_BATCH_CONCURRENCY)
+
+        async def fetch_one(item_id: int):
+            async with semaphore:
+                try:
+                    return item_id, await fetch(item_id)
+                except TestOpsError as e:
+                    logger.error(f"{fetch.__name__}: ошибка для {item_id} ({self.name}): {e}")
+                    return item_id, None
+
+        results = await asyncio.gather(*(fetch_one(item_id) for item_id in dict.fromkeys(ids)))
+        return {item_id: data for item_id, data in results if data is not None}
+
+    async def get_projects(self, project_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Пакетный get_project: {project_id: карточка проекта}.
+        """
+        return await self._fetch_many(self.get_project, project_ids)
+
+    async def get_launches_info(self, launch_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Пакетный get_launch_info: {launch_id: информация о запуске}.
+        """
+        return await self._fetch_many(self.get_launch_info, launch_ids)
 
+    async def get_launches_statistic(self, launch_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Пакетный get_launch_statistic: {launch_id: статистика по статусам}.
+        """
+        return await self._fetch_many(self.get_launch_statistic, launch_ids)
 
-async def run_job(job_id: int, launch_name: str, params_list: List[Dict]) -> int:
+    async def get_launches_results(self, launch_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Один пакетный проход по прогонам: сначала информация по всем, затем статистика
+        только по закрытым. Возвращает {launch_id: {"info": {...}, "statistic": [...]}};
+        у незакрытых прогонов statistic равен None, прогоны с ошибкой API пропускаются.
+        """
+        infos = await self.get_launches_info(launch_ids)
+        closed = {lid for lid, info in infos.items() if info.get("closed", False)}
+        stats = await self.get_launches_statistic(list(closed)) if closed else {}
+        return {
+            lid: {"info": info, "statistic": stats.get(lid, []) if lid in closed else None}
+            for lid, info in infos.items()
+        }
+
+
+_settings: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def _instance_settings() -> Dict[str, Dict[str, Any]]:
     """
-    Запускает Job с заданным списком параметров.
-    Возвращает ID созданного запуска (launch_id).
+    Настройки серверов из окружения: имя -> аргументы TestOpsClient.
+    Читаются при первом обращении, а не при импорте.
     """
-    payload = {
-        "launchName": launch_name,
-        "parameters": params_list,
-        "selection": {
-            "groupsInclude": [],
-            "groupsExclude": [],
-            "leafsInclude": [],
-            "leafsExclude": [],
-            "path": [],
-            "inverted": False,
+    global _settings
+    if _settings is not None:
+        return _settings
+    settings = {
+        DEFAULT_INSTANCE: {
+            "api_base": os.getenv("TESTOPS_API_BASE"),
+            "url": os.getenv("TESTOPS_URL"),
+            "token": os.getenv("USER_TOKEN", ""),
         },
-        "tags": [],
     }
-    data = await api_request("POST", f"/job/{job_id}/run", payload)
-    run_id = data.get("id")
-    if not run_id:
-        logger.error(f"run_job: нет поля id в ответе при запуске job {job_id}")
-        raise TestOpsError("Не удалось получить идентификатор запуска")
-    return int(run_id)
+    instances = os.getenv("TESTOPS_INSTANCES", "")
+    for name in (n.strip().lower() for n in instances.split(",")):
+        if not name:
+            continue
+        if not INSTANCE_NAME_RE.fullmatch(name) or name == DEFAULT_INSTANCE:
+            logger.error(f"TESTOPS_INSTANCES: некорректное имя сервера «{name}», пропускаю")
+            continue
+        prefix = f"TESTOPS_{name.upper()}_"
+        settings[name] = {
+            "api_base": os.getenv(prefix + "API_BASE"),
+            "url": os.getenv(prefix + "URL"),
+            "token": os.getenv(prefix + "USER_TOKEN", ""),
+            "pool_size": int(os.getenv(prefix + "POOL_SIZE", str(TESTOPS_POOL_SIZE))),
+            "rate_limit": float(os.getenv(prefix + "RATE_LIMIT", str(TESTOPS_RATE_LIMIT))),
+        }
+    _settings = settings
+    return settings
 
 
-async def get_launch_info(launch_id: int) -> Dict:
+def instance_names() -> List[str]:
+    """Имена настроенных серверов TestOps (первым — сервер по умолчанию)."""
+    return list(_instance_settings())
+
+
+def get_client(instance: Optional[str] = None) -> TestOpsClient:
     """
-    Возвращает информацию о запуске по ID: статус, флаги и т.д.
+    Клиент сервера TestOps по имени (None — сервер по умолчанию).
+    Бросает TestOpsError, если такой сервер не настроен.
     """
-    data = await api_request("GET", f"/launch/{launch_id}")
-    if not isinstance(data, dict):
-        raise TestOpsError(f"Unexpected response for launch info: {launch_id}")
-    return data
+    name = instance or DEFAULT_INSTANCE
+    client = _clients.get(name)
+    if client is None:
+        settings = _instance_settings().get(name)
+        if settings is None:
+            raise TestOpsError(f"Сервер TestOps «{name}» не настроен")
+        client = _clients[name] = TestOpsClient(name, **settings)
+    return client
 
 
-async def get_launch_statistic(launch_id: int) -> List[Dict]:
+def instance_for_url(url: str) -> Optional[str]:
     """
-    Возвращает статистику по запуску (количество тестов в разных статусах).
+    Сервер, которому принадлежит ссылка (по началу TESTOPS_URL / TESTOPS_NAME_URL),
+    или None, если ссылка не относится ни к одному из настроенных серверов.
     """
-    data = await api_request("GET", f"/launch/{launch_id}/statistic")
-    if not isinstance(data, list):
-        raise TestOpsError(f"Unexpected stats response for launch {launch_id}")
-    return data
\ No newline at end of file
+    for name, settings in _instance_settings().items():
+        base = (settings.get("url") or "").rstrip("/")
+        if base and (url == base or url.startswith(base + "/")):
+            return name
+    return None
+
+
+async def close_session() -> None:
+    """Закрывает HTTP-сессии всех серверов и файл записи обменов (вызывается из post_shutdown)."""
+    global _recorder
+    for client in _clients.values():
+        await client.close()
+    if _recorder is not None:
+        # close() ждёт, пока поток допишет очередь, — не блокируем цикл событий
+        await asyncio.to_thread(_recorder.close)
+        _recorder = None
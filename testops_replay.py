@@ -0,0 +1,165 @@
+import asyncio
+import gzip
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    # Файлы с расширением .gz пишутся и читаются со сжатием
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class ExchangeRecorder:
+    """
+    Пишет обмены с TestOps API в файл JSON Lines: по строке на запрос —
+    метод, путь, тело POST, ответ (или текст ошибки) и задержку в секундах,
+    а для дополнительных серверов TestOps ещё и имя сервера.
+    JWT и заголовки не записываются.
+    Строки пишет в файл отдельный поток (как логи в logging_setup): запрос к TestOps
+    не ждёт диска, а файл сбрасывается на диск, как только очередь опустела.
+    Если файл не открылся или запись упала (например, кончилось место), ошибка
+    пишется в лог и запись обменов останавливается — бот продолжает работать.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.count = 0
+        self._file: Optional[IO[str]] = None
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._started = time.monotonic()
+        self._failed = False
+
+    def _write_loop(self) -> None:
+        while True:
+            line = self._queue.get()
+            if line is None:
+                break
+            try:
+                self._file.write(line)
+                if self._queue.empty():
+                    # Для .gz это Z_SYNC_FLUSH: уже записанное читается и после падения процесса
+                    self._file.flush()
+            except Exception:
+                logger.exception(f"Запись обменов с TestOps в {self.path} остановлена")
+                # record() больше ничего не кладёт в очередь; остаток очереди не нужен
+                self._failed = True
+                break
+
+    def record(
+            self,
+            method: str,
+            path: str,
+            payload: Optional[Dict],
+            latency: float,
+            body: Any = None,
+            error: Optional[str] = None,
+            instance: Optional[str] = None,
+    ) -> None:
+        if self._failed:
+            return
+        if self._file is None:
+            try:
+                self._file = _open(self.path, "a")
+            except OSError as e:
+                logger.error(f"Запись обменов с TestOps выключена: не удалось открыть {self.path}: {e}")
+                self._failed = True
+                return
+            self._writer = threading.Thread(
+                target=self._write_loop, name="testops-recorder", daemon=True
+            )
+            self._writer.start()
+            logger.info(f"Запись обменов с TestOps в {self.path}")
+        entry: Dict[str, Any] = {
+            "t": round(time.monotonic() - self._started, 3),
+            "method": method,
+            "path": path,
+            "latency": round(latency, 4),
+        }
+        if instance is not None:
+            entry["instance"] = instance
+        if payload is not None:
+            entry["payload"] = payload
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["body"] = body
+        self._queue.put(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        """
+        Дописывает очередь и закрывает файл. Ждёт поток записи — из цикла событий
+        вызывается через asyncio.to_thread.
+        """
+        if self._file is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+            try:
+                self._file.close()
+            except Exception as e:
+                logger.error(f"Не удалось закрыть {self.path}: {e}")
+                self._failed = True
+            self._file = None
+            if self._failed:
+                logger.warning(f"Запись обменов с TestOps в {self.path} неполная")
+            else:
+                logger.info(f"Записано обменов с TestOps: {self.count} ({self.path})")
+
+
+class ExchangeReplayer:
+    """
+    Воспроизводит записанные обмены без сети. Ответы подбираются по (сервер, метод, путь)
+    строго в порядке записи; когда записи для пути кончаются, повторяется последняя
+    (так опрос прогона продолжает получать его финальное состояние).
+    latency=None — задержка как при записи, иначе фиксированная задержка в секундах.
+    """
+
+    def __init__(self, path: str, latency: Optional[float] = None) -> None:
+        self.path = path
+        self.latency = latency
+        self.stats: Counter = Counter()
+        self._exchanges: Dict[Tuple[Optional[str], str, str], List[Dict]] = defaultdict(list)
+        self._cursor: Counter = Counter()
+        with _open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    key = (entry.get("instance"), entry["method"], entry["path"])
+                    self._exchanges[key].append(entry)
+        logger.info(
+            f"Воспроизведение обменов с TestOps из {path}: "
+            f"{sum(len(v) for v in self._exchanges.values())} записей"
+        )
+
+    def next(self, method: str, path: str, instance: Optional[str] = None) -> Optional[Dict]:
+        key = (instance, method, path)
+        entries = self._exchanges.get(key)
+        if not entries:
+            self.stats["missing"] += 1
+            return None
+        index = min(self._cursor[key], len(entries) - 1)
+        self._cursor[key] += 1
+        # Счётчики по шаблону пути: «POST /job/{id}/run»
+        template = re.sub(r"[0-9]+", "{id}", path.split("?")[0])
+        self.stats[f"{method} {template}"] += 1
+        return entries[index]
+
+    async def respond(self, method: str, path: str, instance: Optional[str] = None) -> Optional[Dict]:
+        """Запись для запроса (после задержки) или None, если такого запроса не записано."""
+        entry = self.next(method, path, instance)
+        delay = self.latency if self.latency is not None else (entry or {}).get("latency", 0)
+        if delay:
+            await asyncio.sleep(delay)
+        return entry
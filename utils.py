@@ -1,11 +1,17 @@
+import math
 import re
-from typing import Any, Optional
+from typing import Any, List, Optional, Tuple
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import ContextTypes
 
+from message_state import tracker
+from testops_client import DEFAULT_INSTANCE, instance_for_url, instance_names
+
 # Регулярное выражение для извлечения ID из URL проекта
 PROJECT_ID_REGEX = re.compile(r"/?(\d+)")
+# Ссылка на объект сервера TestOps в callback_data и командах: «<сервер>:<ID>» или просто «<ID>»
+REF_REGEX = re.compile(r"([a-z0-9]{1,16}):(\d+)")
 
 async def notify_error(
     update_or_query: Any,
@@ -24,10 +30,18 @@ async def notify_error(
     buttons.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
     markup = InlineKeyboardMarkup(buttons)
 
+    await respond(update_or_query, message, reply_markup=markup)
+
+
+async def respond(update_or_query: Any, text: str, **kwargs) -> Any:
+    """
+    Ответ на действие пользователя: на текстовое сообщение (Update) — новым сообщением,
+    на нажатие кнопки (CallbackQuery) — правкой сообщения с этой кнопкой.
+    Возвращает отправленное или отредактированное сообщение.
+    """
     if isinstance(update_or_query, Update) and update_or_query.message:
-        await update_or_query.message.reply_text(message, reply_markup=markup)
-    else:
-        await update_or_query.edit_message_text(message, reply_markup=markup)
+        return await update_or_query.message.reply_text(text, **kwargs)
+    return await tracker.edit(update_or_query, text, **kwargs)
 
 
 async def remove_reply_keyboard(update: Update):
@@ -49,4 +63,83 @@ def extract_project_id(text: str) -> Optional[int]:
     try:
         return int(match.group(1))
     except ValueError:
-        return None
\ No newline at end of file
+        return None
+
+
+def format_ref(instance: str, item_id: int) -> str:
+    """
+    Ссылка на проект или Job для callback_data: «ID» для сервера TestOps по умолчанию
+    (как до поддержки нескольких серверов) и «<сервер>:ID» для остальных.
+    """
+    return str(item_id) if instance == DEFAULT_INSTANCE else f"{instance}:{item_id}"
+
+
+def parse_ref(ref: str) -> Tuple[str, int]:
+    """Разбирает ссылку из format_ref в (сервер, ID). Бросает ValueError."""
+    match = REF_REGEX.fullmatch(ref)
+    if match:
+        return match.group(1), int(match.group(2))
+    if not ref.isdigit():
+        raise ValueError(f"некорректная ссылка: {ref!r}")
+    return DEFAULT_INSTANCE, int(ref)
+
+
+def project_label(instance: str, project_id: int) -> str:
+    """Подпись проекта для пользователя: «ID 12» или «ID 12, staging» для других серверов."""
+    return f"ID {project_id}" if instance == DEFAULT_INSTANCE else f"ID {project_id}, {instance}"
+
+
+def extract_project_ref(token: str) -> Optional[Tuple[str, int]]:
+    """
+    Сервер TestOps и ID проекта из ссылки или ID. Сервер определяется по адресу ссылки
+    (TESTOPS_URL / TESTOPS_<NAME>_URL) или задаётся явно: «staging:12»;
+    просто ID и ссылки на неизвестные адреса относятся к серверу по умолчанию.
+    Возвращает None, если ID не найден или сервер не настроен.
+    """
+    match = REF_REGEX.fullmatch(token)
+    if match:
+        return (match.group(1), int(match.group(2))) if match.group(1) in instance_names() else None
+    instance = instance_for_url(token.rstrip("/"))
+    if instance is not None:
+        # ID ищется только в пути: в адресе сервера тоже могут быть цифры
+        path = token.split("://", 1)[-1]
+        path = path[path.find("/"):] if "/" in path else ""
+        project_id = extract_project_id(path)
+    else:
+        instance, project_id = DEFAULT_INSTANCE, extract_project_id(token)
+    return (instance, project_id) if project_id is not None else None
+
+
+def extract_project_refs(text: str) -> List[Tuple[str, int]]:
+    """
+    Разбирает список ссылок/ID проектов, разделённых пробелами, запятыми, точками с запятой
+    или переводами строк. Возвращает пары (сервер, ID) без повторов в порядке появления.
+    """
+    refs = (extract_project_ref(token) for token in re.split(r"[\s,;]+", text) if token)
+    return list(dict.fromkeys(ref for ref in refs if ref is not None))
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """
+    Возвращает перцентиль pct (0..100) по методу ближайшего ранга или None для пустого списка.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Ранг — ceil(pct/100 * n); умножение до деления, чтобы 7% от 100 не дало 7.000000000000001
+    rank = max(math.ceil(pct * len(ordered) / 100) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Форматирует длительность в секундах в вид «1ч 05м», «12м 30с» или «45с».
+    """
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}ч {minutes:02d}м"
+    if minutes:
+        return f"{minutes}м {secs:02d}с"
+    return f"{secs}с"
@@ -0,0 +1,115 @@
+import asyncio
+import hmac
+import logging
+import os
+from typing import Any, List, Optional
+
+from aiohttp import web
+
+from db import request_watch_checks
+from jobs import trigger_launch_check
+from testops_client import instance_names
+
+logger = logging.getLogger(__name__)
+
+# --------------------- Настройки ---------------------
+# Порт HTTP-эндпоинта для событий о закрытии прогонов; пусто — эндпоинт выключен
+LAUNCH_WEBHOOK_HOST = os.getenv("LAUNCH_WEBHOOK_HOST", "0.0.0.0")
+LAUNCH_WEBHOOK_PORT = int(os.getenv("LAUNCH_WEBHOOK_PORT", "0") or 0)
+LAUNCH_WEBHOOK_PATH = os.getenv("LAUNCH_WEBHOOK_PATH", "/launch-closed")
+# Общий секрет, который отправитель передаёт в заголовке X-Webhook-Secret
+LAUNCH_WEBHOOK_SECRET = os.getenv("LAUNCH_WEBHOOK_SECRET", "")
+# Сколько ID прогонов принимается в одном событии (больше — ответ 413)
+LAUNCH_WEBHOOK_MAX_IDS = int(os.getenv("LAUNCH_WEBHOOK_MAX_IDS", "1000"))
+# Максимальный размер тела события в байтах
+LAUNCH_WEBHOOK_MAX_BODY = 256 * 1024
+
+
+def _extract_launch_ids(payload: Any) -> List[int]:
+    """
+    Достаёт ID прогонов из тела события. Поддерживаются варианты:
+    {"launch_id": 1}, {"launchId": 1}, {"id": 1}, {"launch_ids": [1, 2]} и список таких объектов.
+    """
+    items = payload if isinstance(payload, list) else [payload]
+    ids: List[int] = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for key in ("launch_ids", "launchIds"):
+            if isinstance(item.get(key), list):
+                ids.extend(int(x) for x in item[key] if str(x).isdigit())
+        for key in ("launch_id", "launchId", "id"):
+            if str(item.get(key, "")).isdigit():
+                ids.append(int(item[key]))
+                break
+    return ids
+
+
+async def handle_launch_closed(request: web.Request) -> web.Response:
+    """
+    POST {LAUNCH_WEBHOOK_PATH}[?instance=<сервер>]: событие «прогон закрыт» от вебхука
+    TestOps или шага CI. Без instance проверяются прогоны с этим ID на всех серверах TestOps.
+    Если прогон опрашивает этот воркер — проверка запускается сразу, иначе событие
+    передаётся владельцу через MongoDB.
+    """
+    if LAUNCH_WEBHOOK_SECRET and not hmac.compare_digest(
+        request.headers.get("X-Webhook-Secret", ""), LAUNCH_WEBHOOK_SECRET
+    ):
+        return web.json_response({"error": "forbidden"}, status=403)
+    instance = request.query.get("instance") or None
+    if instance is not None and instance not in instance_names():
+        return web.json_response({"error": "unknown instance"}, status=400)
+    try:
+        payload = await request.json()
+    except ValueError:
+        return web.json_response({"error": "invalid json"}, status=400)
+
+    launch_ids = _extract_launch_ids(payload)
+    if not launch_ids:
+        return web.json_response({"error": "launch_id is required"}, status=400)
+    if len(launch_ids) > LAUNCH_WEBHOOK_MAX_IDS:
+        return web.json_response(
+            {"error": f"too many launch ids (max {LAUNCH_WEBHOOK_MAX_IDS})"}, status=413
+        )
+
+    matched, rest = [], []
+    for launch_id in launch_ids:
+        (matched if trigger_launch_check(launch_id, instance) else rest).append(launch_id)
+    # Остальные передаются владельцам одним запросом к MongoDB в отдельном потоке
+    found = set()
+    if rest:
+        try:
+            found = await asyncio.to_thread(request_watch_checks, rest, instance)
+        except Exception as e:
+            logger.error(f"webhook: не удалось передать события другим воркерам: {e}")
+    forwarded = [launch_id for launch_id in rest if launch_id in found]
+    unknown = [launch_id for launch_id in rest if launch_id not in found]
+
+    logger.info(
+        f"webhook: закрыты прогоны {launch_ids} — сразу: {matched}, "
+        f"другим воркерам: {forwarded}, неизвестные: {unknown}"
+    )
+    return web.json_response({"matched": matched, "forwarded": forwarded, "unknown": unknown})
+
+
+async def start_webhook_server() -> Optional[web.AppRunner]:
+    """
+    Поднимает HTTP-эндпоинт для событий о закрытии прогонов, если задан LAUNCH_WEBHOOK_PORT.
+    """
+    if not LAUNCH_WEBHOOK_PORT:
+        return None
+    app = web.Application(client_max_size=LAUNCH_WEBHOOK_MAX_BODY)
+    app.router.add_post(LAUNCH_WEBHOOK_PATH, handle_launch_closed)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, LAUNCH_WEBHOOK_HOST, LAUNCH_WEBHOOK_PORT).start()
+    logger.info(
+        f"Приём событий о закрытии прогонов: http://{LAUNCH_WEBHOOK_HOST}:{LAUNCH_WEBHOOK_PORT}"
+        f"{LAUNCH_WEBHOOK_PATH}"
+    )
+    return runner
+
+
+async def stop_webhook_server(runner: Optional[web.AppRunner]) -> None:
+    if runner is not None:
+        await runner.cleanup()